@@ -0,0 +1,87 @@
+"""Throughput benchmarks of batch decoding paths"""
+
+import random
+import tempfile
+
+from common import measure, result, skipped
+
+from wmbc.capture import encode_batch
+from wmbc.mb_proto import crc16
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.modbus_planner import build_read_request
+from wmbc.register_map import RegisterDef, RegisterMap
+from wmbc.sim import WMBDeviceEmulator
+
+SUITE = "batch"
+
+
+def _frames(count: int, seed: int = 0) -> list:
+    """Modbus response answers of simulated devices reading 1-125 holding registers"""
+    rng = random.Random(seed)
+    device = WMBDeviceEmulator(1)
+    device.slaves[1][0].holding_registers.update({idx: rng.randrange(0x10000) for idx in range(125)})
+    mbproto = MBProto(frame_cache_size=0)
+    mbproto.target_port = 1
+    return [device.handle(mbproto.create_modbus_oneshot(build_read_request(1, 3, 0, rng.randint(1, 125))))[0]
+            for _ in range(count)]
+
+
+def _throughput(func, count: int, repeat: int) -> dict:
+    values = measure(func, repeat)
+    values["frames"] = count
+    values["frames_per_sec"] = count * values.pop("ops_per_sec")
+    return values
+
+
+def run(quick: bool = False) -> list:
+    repeat = 3 if quick else 5
+    results = []
+    try:
+        import numpy
+        has_numpy = True
+    except ImportError:
+        has_numpy = False
+
+    for count in ((1000,) if quick else (1000, 10000)):
+        frames = _frames(count)
+        mbproto = MBProto()
+        params = {"frames": count, "numpy": has_numpy}
+
+        results.append(result(SUITE, "decode_response_loop", params,
+                              **_throughput(lambda: [mbproto.decode_response(frame) for frame in frames], count, repeat)))
+        results.append(result(SUITE, "verify_many", params,
+                              **_throughput(lambda: crc16.verify_many(frames), count, repeat)))
+        if has_numpy:
+            results.append(result(SUITE, "decode_many", params,
+                                  **_throughput(lambda: mbproto.decode_many(frames), count, repeat)))
+        else:
+            results.append(skipped(SUITE, "decode_many", "NumPy is not installed"))
+        results.append(result(SUITE, "capture_encode_batch", params,
+                              **_throughput(lambda: encode_batch([1] * count, [0.0] * count, frames), count, repeat)))
+
+        # Register map decoding of a fixed block, the Modbus frames are extracted once
+        register_map = RegisterMap([RegisterDef(f"r{idx}", 1, 3, 2 * idx, "float32", "CDAB") for idx in range(16)])
+        block = register_map.blocks[0]
+        device = WMBDeviceEmulator(1)
+        answer = device.modbus_request(1, block.frame)
+        modbus_frames = [answer] * count
+        results.append(result(SUITE, "register_map_decode", {**params, "values": 16},
+                              **_throughput(lambda: [block.decode(frame) for frame in modbus_frames], count, repeat)))
+
+    if has_numpy:
+        from wmbc.telemetry_store import TelemetryStore
+        count = 1000
+        registers = list(range(16))
+        with tempfile.TemporaryDirectory() as path:
+            store = TelemetryStore(path)
+
+            def append():
+                for _ in range(count):
+                    store.append(1, 6, registers)
+            results.append(result(SUITE, "telemetry_store_append", {"frames": count, "registers": 16},
+                                  **_throughput(append, count, repeat)))
+            results.append(result(SUITE, "telemetry_store_last", {"records": 100},
+                                  **measure(lambda: store.last(1, 100)["registers"].sum(), repeat)))
+    else:
+        results.append(skipped(SUITE, "telemetry_store_append", "NumPy is not installed"))
+    return results
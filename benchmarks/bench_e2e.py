@@ -0,0 +1,71 @@
+"""End-to-end fleet polling scenarios against the simulated network"""
+
+import asyncio
+import statistics
+from itertools import product
+from time import monotonic, process_time
+
+from common import result
+
+from wmbc.fleet import WMBFleetController
+from wmbc.modbus_planner import build_read_request
+from wmbc.scheduler import PollScheduler
+from wmbc.sim import SimulatedNetwork
+
+SUITE = "e2e"
+
+
+async def _scenario(devices: int, period: float, loss: float, duration: float, latency: float, seed: int) -> dict:
+    network = SimulatedNetwork.with_devices(devices, latency=latency, jitter=latency / 2, loss=loss, seed=seed)
+    fleet = WMBFleetController(sink_controller=network.sink_controller, sink_ids=["sink0"])
+    fleet.initialize_sink()
+    fleet.mbproto.target_port = 1
+    payload_coded = fleet.mbproto.create_modbus_oneshot(build_read_request(1, 3, 0, 4))
+
+    answers = 0
+
+    def on_answer(msg, callback_args):
+        nonlocal answers
+        answers += 1
+
+    scheduler = PollScheduler(fleet, seed=seed)
+    for device in network.devices:
+        scheduler.add_job(device.address, payload_coded, period, _callback=on_answer)
+    start, cpu_start = monotonic(), process_time()
+    task = asyncio.ensure_future(scheduler.run())
+    await asyncio.sleep(duration)
+    task.cancel()
+    elapsed, cpu = monotonic() - start, process_time() - cpu_start
+
+    stats = scheduler.stats()
+    polls = sum(job["polls"] for job in stats)
+    srtt = [estimate["srtt"] for estimate in fleet.rtt.estimates().values() if estimate["srtt"] is not None]
+    return {
+        "duration_s": elapsed,
+        "polls": polls,
+        "answers": answers,
+        "timeouts": sum(job["timeouts"] for job in stats),
+        "missed": sum(job["missed"] for job in stats),
+        "answers_per_sec": answers / elapsed,
+        "expected_polls_per_sec": devices / period,
+        "mean_lateness_ms": 1000 * statistics.fmean(job["mean_lateness"] for job in stats) if stats else 0.0,
+        "max_lateness_ms": 1000 * max((job["max_lateness"] for job in stats), default=0.0),
+        "mean_srtt_ms": 1000 * statistics.fmean(srtt) if srtt else None,
+        "cpu_us_per_poll": 1e6 * cpu / polls if polls else None,
+        "stale_dropped": fleet.inflight.stale_dropped,
+        "network": network.stats(),
+    }
+
+
+def run(quick: bool = False, devices=None, periods=None, losses=None, duration=None, latency: float = 0.05,
+        seed: int = 0) -> list:
+    devices = devices or ((100,) if quick else (100, 1000))
+    periods = periods or ((1.0,) if quick else (1.0, 5.0))
+    losses = losses or ((0.0, 0.05) if quick else (0.0, 0.05))
+    duration = duration or (3.0 if quick else 10.0)
+    results = []
+    for count, period, loss in product(devices, periods, losses):
+        params = {"devices": count, "period_s": period, "loss": loss, "latency_s": latency}
+        values = asyncio.run(_scenario(count, period, loss, duration, latency, seed))
+        results.append(result(SUITE, "fleet_poll", params, **values))
+    return results
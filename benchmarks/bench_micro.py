@@ -0,0 +1,84 @@
+"""Microbenchmarks of MB Protocol encoding and decoding hot paths"""
+
+from common import measure, quiet_logging, result
+
+from wmbc import metrics
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.mb_proto import modbus_rtu
+from wmbc.sim import WMBDeviceEmulator
+
+SUITE = "micro"
+
+READ_HOLDING_REQUEST = bytes.fromhex("0103000000044409")
+
+
+def _configured_proto(frame_cache_size: int) -> MBProto:
+    mbproto = MBProto(frame_cache_size=frame_cache_size)
+    mbproto.device_mode = 0
+    mbproto.antenna_config = 0
+    mbproto.target_port = 1
+    mbproto.baudrate_config = 9600
+    mbproto.parity_bit = 0
+    mbproto.stop_bits = 1
+    return mbproto
+
+
+def _answers() -> dict:
+    """Encoded answers of a simulated device"""
+    device = WMBDeviceEmulator(1)
+    device.slaves[1][0].holding_registers.update({0: 1, 1: 2, 2: 3, 3: 4})
+    mbproto = _configured_proto(0)
+    return {
+        "ack": device.handle(mbproto.create_device_mode())[0],
+        "diagnostics": device.handle(mbproto.create_diagnostics())[0],
+        "modbus_response": device.handle(mbproto.create_modbus_oneshot(READ_HOLDING_REQUEST))[0],
+    }
+
+
+def run(quick: bool = False) -> list:
+    repeat = 3 if quick else 5
+    results = []
+
+    # Builders with the frame cache (steady state of repeated commands) and without it
+    for cached, cache_size in (("cached", MBProto.FRAME_CACHE_SIZE), ("uncached", 0)):
+        mbproto = _configured_proto(cache_size)
+        builders = {
+            "create_device_reset": mbproto.create_device_reset,
+            "create_diagnostics": mbproto.create_diagnostics,
+            "create_device_mode": mbproto.create_device_mode,
+            "create_antenna_config": mbproto.create_antenna_config,
+            "create_port_config": mbproto.create_port_config,
+            "create_modbus_oneshot": lambda: mbproto.create_modbus_oneshot(READ_HOLDING_REQUEST),
+            "create_modbus_periodic": lambda: mbproto.create_modbus_periodic(1, 60, READ_HOLDING_REQUEST),
+        }
+        for name, builder in builders.items():
+            results.append(result(SUITE, name, {"frame_cache": cached}, **measure(builder, repeat)))
+
+    mbproto = _configured_proto(MBProto.FRAME_CACHE_SIZE)
+    answers = _answers()
+    for name, frame in answers.items():
+        results.append(result(SUITE, "decode_response", {"answer": name},
+                              **measure(lambda: mbproto.decode_response(frame), repeat)))
+
+    _, _, msg = mbproto.decode_response(answers["modbus_response"])
+    modbus_frame = msg.payload.payload_answer_frame.modbus_response_frame.modbus_frame
+    results.append(result(SUITE, "decode_modbus_frame", {"function_code": modbus_rtu.FC_READ_HOLDING_REGISTERS},
+                          **measure(lambda: mbproto.decode_modbus_frame(modbus_frame), repeat)))
+    results.append(result(SUITE, "parse_modbus_frame", {"function_code": modbus_rtu.FC_READ_HOLDING_REGISTERS},
+                          **measure(lambda: mbproto.parse_modbus_frame(modbus_frame), repeat)))
+    for name in ("diagnostics", "modbus_response"):
+        _, _, msg = mbproto.decode_response(answers[name])
+        results.append(result(SUITE, "decode_answer", {"answer": name},
+                              **measure(lambda: mbproto.decode_answer(msg), repeat)))
+
+    # Per-message metrics overhead of the receive path
+    _, _, msg = mbproto.decode_response(answers["ack"])
+    results.append(result(SUITE, "metrics_record_answer", {"answer": "ack"},
+                          **measure(lambda: metrics.record_answer(1, msg), repeat)))
+
+    # Rendered but discarded log output
+    with quiet_logging():
+        for name, frame in answers.items():
+            results.append(result(SUITE, "print_decoded_msg", {"answer": name},
+                                  **measure(lambda: mbproto.print_decoded_msg(frame), repeat)))
+    return results
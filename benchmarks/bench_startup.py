@@ -0,0 +1,78 @@
+"""Start-up time of the command line and import time of the library with its budget"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+from common import REPO_ROOT, result
+
+SUITE = "startup"
+
+# Modules which have to be imported on first use only, importing them is slow or has side effects
+LAZY_MODULES = ("wsctrl", "gi", "dbus", "pymodbus", "google.protobuf.json_format", "numpy", "http.server", "cProfile")
+
+# Wall time budgets in milliseconds on top of a bare interpreter start
+BUDGETS_MS = {
+    "cli_help": 60.0,
+    "import_mbproto": 120.0,
+    "import_client": 120.0,
+    "import_controllers": 200.0,
+}
+
+COMMANDS = {
+    "cli_help": ["-m", "wmbc", "--help"],
+    "import_mbproto": ["-c", "import wmbc.mb_proto.mb_protocol_iface"],
+    "import_client": ["-c", "import wmbc.client"],
+    "import_controllers": ["-c", "import wmbc.wmbc, wmbc.fleet"],
+}
+
+_SIDE_EFFECTS = """
+import json, logging, signal, sys
+import wmbc.wmbc, wmbc.fleet
+print(json.dumps({
+    "loaded": sorted(name for name in %r if name in sys.modules),
+    "sigint_handler": signal.getsignal(signal.SIGINT) is not signal.default_int_handler,
+    "root_handlers": len(logging.getLogger().handlers),
+}))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (REPO_ROOT, env.get("PYTHONPATH"))))
+    return env
+
+
+def _wall_ms(args: list, repeat: int) -> list:
+    env = _env()
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run([sys.executable, *args], env=env, check=True, stdout=subprocess.DEVNULL)
+        times.append(1000 * (perf_counter() - start))
+    return times
+
+
+def run(quick: bool = False) -> list:
+    repeat = 5 if quick else 20
+    results = []
+    # Interpreter start is subtracted, so the budgets do not depend on the machine's process spawn cost
+    baseline = min(_wall_ms(["-c", "pass"], repeat))
+    results.append(result(SUITE, "interpreter", {}, min_ms=baseline))
+    for name, args in COMMANDS.items():
+        times = _wall_ms(args, repeat)
+        overhead = min(times) - baseline
+        budget = BUDGETS_MS[name]
+        results.append(result(SUITE, name, {}, min_ms=min(times), median_ms=statistics.median(times),
+                              overhead_ms=overhead, budget_ms=budget, budget_exceeded=overhead > budget))
+
+    completed = subprocess.run([sys.executable, "-c", _SIDE_EFFECTS % (LAZY_MODULES,)], env=_env(), check=True,
+                               capture_output=True, text=True)
+    side_effects = json.loads(completed.stdout)
+    results.append(result(SUITE, "import_side_effects", {}, **side_effects,
+                          budget_exceeded=bool(side_effects["loaded"] or side_effects["sigint_handler"]
+                                               or side_effects["root_handlers"])))
+    return results
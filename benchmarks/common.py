@@ -0,0 +1,68 @@
+"""Timing helpers and result records shared by the benchmark suites"""
+
+import logging
+import os
+import platform
+import statistics
+import sys
+import timeit
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from importlib import metadata
+
+# Suites import wmbc from the source tree, so benchmarks run from a checkout without installing it
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def measure(func, repeat: int = 5) -> dict:
+    """Times func with timeit, every repeat runs for at least 0.2 s"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    best = min(times)
+    return {
+        "iterations": number * repeat,
+        "min_us": best * 1e6,
+        "mean_us": statistics.fmean(times) * 1e6,
+        "stdev_us": statistics.stdev(times) * 1e6 if len(times) > 1 else 0.0,
+        "ops_per_sec": 1.0 / best if best else None,
+    }
+
+
+def result(suite: str, name: str, params: dict = None, **values) -> dict:
+    return {"suite": suite, "name": name, "params": params or {}, **values}
+
+
+def skipped(suite: str, name: str, reason: str) -> dict:
+    return {"suite": suite, "name": name, "params": {}, "skipped": reason}
+
+
+def metadata_info() -> dict:
+    try:
+        version = metadata.version("wmbc")
+    except metadata.PackageNotFoundError:
+        version = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "wmbc_version": version,
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+@contextmanager
+def quiet_logging(level=logging.INFO):
+    """Keeps log records enabled at level (so they are rendered) but discards the output"""
+    root = logging.getLogger()
+    handlers, old_level = root.handlers[:], root.level
+    root.handlers = [logging.NullHandler()]
+    root.setLevel(level)
+    try:
+        yield
+    finally:
+        root.handlers = handlers
+        root.setLevel(old_level)
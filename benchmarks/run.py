@@ -0,0 +1,139 @@
+"""
+Runs the benchmark suites and writes machine-readable results
+
+Usage:
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --suite micro --quick --baseline previous.json
+    python benchmarks/run.py --suite startup --quick
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import metadata_info
+
+SUITES = ("micro", "batch", "e2e", "startup")
+
+
+def _key(entry: dict) -> tuple:
+    return entry["suite"], entry["name"], json.dumps(entry["params"], sort_keys=True)
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """Returns entries of results whose best time is worse than the baseline by more than threshold"""
+    previous = {_key(entry): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        old = previous.get(_key(entry))
+        if old is None or "min_us" not in entry or "min_us" not in old:
+            continue
+        ratio = entry["min_us"] / old["min_us"]
+        entry["baseline_ratio"] = ratio
+        if ratio > 1.0 + threshold:
+            regressions.append(entry)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WMBC benchmark suite')
+    parser.add_argument(
+            '--suite',
+            nargs='+',
+            choices=SUITES,
+            default=list(SUITES),
+            help='Suites to run'
+    )
+    parser.add_argument(
+            '--quick',
+            action='store_true',
+            help='Fewer repeats and smaller scenarios'
+    )
+    parser.add_argument(
+            '--output',
+            type=str,
+            help='JSON file with the results, printed to stdout if not provided'
+    )
+    parser.add_argument(
+            '--baseline',
+            type=str,
+            help='JSON results of a previous run to compare timings with'
+    )
+    parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.2,
+            help='Relative slowdown against the baseline reported as regression'
+    )
+    parser.add_argument(
+            '--devices',
+            type=int,
+            nargs='+',
+            help='Numbers of devices of end-to-end scenarios'
+    )
+    parser.add_argument(
+            '--period',
+            type=float,
+            nargs='+',
+            help='Poll periods of end-to-end scenarios in seconds'
+    )
+    parser.add_argument(
+            '--loss',
+            type=float,
+            nargs='+',
+            help='Packet loss probabilities of end-to-end scenarios'
+    )
+    parser.add_argument(
+            '--duration',
+            type=float,
+            help='Duration of every end-to-end scenario in seconds'
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, force=True)
+
+    results = []
+    for suite in args.suite:
+        logging.warning(f"Running {suite} benchmarks")
+        if suite == "micro":
+            import bench_micro
+            results += bench_micro.run(args.quick)
+        elif suite == "batch":
+            import bench_batch
+            results += bench_batch.run(args.quick)
+        elif suite == "startup":
+            import bench_startup
+            results += bench_startup.run(args.quick)
+        else:
+            import bench_e2e
+            results += bench_e2e.run(args.quick, args.devices, args.period, args.loss, args.duration)
+        # Keep the suites from changing log level of each other
+        logging.getLogger().setLevel(logging.WARNING)
+
+    # Start-up budgets are absolute and checked without a baseline
+    regressions = [entry for entry in results if entry.get("budget_exceeded")]
+    for entry in regressions:
+        logging.warning(f"Over budget: {entry['suite']}/{entry['name']}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f)["results"], args.threshold)
+        regressions += slower
+        for entry in slower:
+            logging.warning(f"Regression: {entry['suite']}/{entry['name']} {entry['params']} "
+                            f"{entry['baseline_ratio']:.2f}x slower")
+
+    report = {"meta": metadata_info(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
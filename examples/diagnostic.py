@@ -1,10 +1,6 @@
 import argparse
 import asyncio
 import logging
-import json
-import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
-from wmbc.mb_proto.mb_protocol_iface import MBProto
-from google.protobuf.json_format import MessageToJson
 from wmbc.wmbc import WMBController
 
 logging.basicConfig(level=logging.INFO)
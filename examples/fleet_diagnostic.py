@@ -0,0 +1,42 @@
+import argparse
+import asyncio
+import logging
+from wmbc.fleet import WMBFleetController
+
+logging.basicConfig(level=logging.INFO)
+
+async def poll_diagnostics(fleet: WMBFleetController, dst_addrs: list, period: int):
+    diag_frame = fleet.mbproto.create_diagnostics()
+    while True:
+        for dst_addr in dst_addrs:
+            fleet.send_command(dst_addr, diag_frame)
+        await asyncio.sleep(period)
+
+async def main():
+    parser = argparse.ArgumentParser(description='Example of running diagnostics status periodically on many devices \
+        over a single sink connection')
+    parser.add_argument(
+        '--dst-addr',
+        required=True,
+        type=int,
+        nargs='+',
+        help='Wirepas destination addresses'
+    )
+    parser.add_argument(
+            '--period',
+            required=False,
+            type=int,
+            default=20,
+            help='Period in seconds'
+    )
+
+    args = parser.parse_args()
+
+    fleet = WMBFleetController()
+    for dst_addr in args.dst_addr:
+        fleet.add_device(dst_addr)
+    fleet.initialize_sink()
+    await asyncio.gather(fleet.run(), poll_diagnostics(fleet, args.dst_addr, args.period))
+
+if __name__ == "__main__":
+    asyncio.run(main())
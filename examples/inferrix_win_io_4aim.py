@@ -1,38 +1,26 @@
 import argparse
 import asyncio
 import logging
-import json
 import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
 from wmbc.mb_proto.mb_protocol_iface import MBProto
-from google.protobuf.json_format import MessageToJson
-from pymodbus.client import ModbusFrameGenerator
-from pymodbus.framer import FramerType
+from wmbc.mb_proto.mb_protocol_results import ModbusResponseResult
+from wmbc.register_map import RegisterDef, RegisterMap
 from wmbc.wmbc import WMBController
 
 logging.basicConfig(level=logging.INFO)
 
 def print_answer(msg: mb_protocol.MbMessage, callback_args: dict) -> None:
-    voltage_range = callback_args.get('volt_range')
-    dev_id = callback_args.get('modbus_addr')
+    register_map = callback_args.get('register_map')
     _mbproto = MBProto()
-    _json_str = MessageToJson(msg, always_print_fields_with_no_presence=True, preserving_proto_field_name=True)
-    _dict = json.loads(_json_str)
-    if (msg.cmd == mb_protocol.Cmd.CMD_MODBUS_ONE_SHOT or msg.cmd == mb_protocol.Cmd.CMD_MODBUS_PERIODICAL):
-        if (msg.payload.payload_answer_frame.ack_frame.acknowladge == 0):
-            data = msg.payload.payload_answer_frame.modbus_response_frame.modbus_frame
-            try:
-                modbus_frame = _mbproto.decode_modbus_frame(data)
-            except Exception as e:
-                logging.error("Faild to decode Modbus Frame")
-            else:
-                _dict['payload']['payload_answer_frame']['modbus_response_frame']['modbus_frame'] = modbus_frame
-    if 'modbus_response_frame' in _dict['payload']['payload_answer_frame']:
-        if 'ReadHoldingRegistersResponse' in _dict['payload']['payload_answer_frame']['modbus_response_frame']['modbus_frame']:
-            if _dict['payload']['payload_answer_frame']['modbus_response_frame']['modbus_frame']['ReadHoldingRegistersResponse']['dev_id'] == dev_id:
-                ai_regs = _dict['payload']['payload_answer_frame']['modbus_response_frame']['modbus_frame']['ReadHoldingRegistersResponse']['registers']
-                if len(ai_regs) >= 4:
-                    for iter in range(4):
-                        logging.info("AI %d is: %f V",iter+1, (ai_regs[iter]*voltage_range[iter])/(2 ** 10))
+    result = _mbproto.decode_answer(msg)
+    if isinstance(result, ModbusResponseResult):
+        try:
+            values = register_map.decode(result.modbus_frame)
+        except ValueError as e:
+            logging.warning("Invalid response: %s", e)
+            return
+        for name, value in values.items():
+            logging.info("%s is: %f V", name, value)
 
 async def main():
     parser = argparse.ArgumentParser(description='Inferix WIN-IO-4AIM demo for WMB Controller - reads AI voltage values over Wirepas \
@@ -79,12 +67,15 @@ async def main():
     args = parser.parse_args()
     args_dict = vars(args)
 
-    generator = ModbusFrameGenerator(framer=FramerType.RTU, slave=args_dict.get('modbus_addr'))
-    read_regs_frame = generator.read_holding_registers(address=0, count=4)
+    # AI values are 10-bit readings of the selected voltage range
+    register_map = RegisterMap([
+        RegisterDef(f"AI {ai + 1}", args_dict.get('modbus_addr'), 3, ai, "uint16",
+                    scale=args_dict['volt_range'][ai] / (2 ** 10), unit="V")
+        for ai in range(4)
+    ])
 
-    args_dict.update({'cmd':"modbus_1s", 'modbus_frame':read_regs_frame})
-    callback_args_dict = {}
-    callback_args_dict.update({'modbus_addr': args_dict['modbus_addr'], 'volt_range': args_dict['volt_range']})
+    args_dict.update({'cmd':"modbus_1s", 'modbus_frame':register_map.blocks[0].frame})
+    callback_args_dict = {'register_map': register_map}
 
     WMBC = WMBController(**args_dict)
     WMBC.initialize_sink()
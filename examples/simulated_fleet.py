@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+import logging
+from time import monotonic
+from wmbc.fleet import WMBFleetController
+from wmbc.sim import SimulatedNetwork
+
+logging.basicConfig(level=logging.INFO)
+
+async def main():
+    parser = argparse.ArgumentParser(description='Example of running diagnostics on a simulated fleet of WMB devices \
+        (no Wirepas sinkService needed).')
+    parser.add_argument(
+        '--devices',
+        required=False,
+        type=int,
+        default=100,
+        help='Number of simulated devices'
+    )
+    parser.add_argument(
+            '--latency',
+            required=False,
+            type=float,
+            default=0.2,
+            help='One way latency in seconds'
+    )
+    parser.add_argument(
+            '--loss',
+            required=False,
+            type=float,
+            default=0.0,
+            help='Packet loss probability'
+    )
+
+    args = parser.parse_args()
+
+    network = SimulatedNetwork.with_devices(args.devices, latency=args.latency, loss=args.loss)
+    fleet = WMBFleetController(sink_controller=network.sink_controller)
+    fleet.initialize_sink()
+
+    diag_frame = fleet.mbproto.create_diagnostics()
+    start = monotonic()
+    results = await asyncio.gather(*(fleet.request(device.address, diag_frame) for device in network.devices),
+                                   return_exceptions=True)
+    answered = sum(not isinstance(result, Exception) for result in results)
+    logging.info("%d of %d devices answered in %.2f s, network: %s", answered, args.devices, monotonic() - start,
+                 network.stats())
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import logging
+from wmbc.capture import SnifferCapture, read_capture
+from wmbc.fleet import WMBFleetController
+
+logging.basicConfig(level=logging.INFO)
+
+async def main():
+    parser = argparse.ArgumentParser(description='Example of capturing Modbus traffic sniffed by many bridges \
+        into a capture file (assumes the Sink is preconfigured with correct Network Address and Channel).')
+    parser.add_argument(
+        '--dst-addr',
+        required=True,
+        type=int,
+        nargs='+',
+        help='Wirepas destination addresses of the bridges'
+    )
+    parser.add_argument(
+            '--file',
+            required=False,
+            type=str,
+            default='capture.wmbcap',
+            help='Capture file, new records are appended'
+    )
+    parser.add_argument(
+            '--show',
+            action='store_true',
+            help='Print records of the capture file and exit'
+    )
+
+    args = parser.parse_args()
+
+    if args.show:
+        for record in read_capture(args.file):
+            logging.info("%f %d port %d: %s", record.timestamp, record.src, record.port, record.data.hex())
+        return
+
+    fleet = WMBFleetController()
+    fleet.initialize_sink()
+    # Switch the bridges to sniffer mode, their answers are captured as well
+    fleet.mbproto.device_mode = 1
+    for dst_addr in args.dst_addr:
+        fleet.send_command(dst_addr, fleet.mbproto.create_device_mode())
+    await SnifferCapture(fleet, args.file).run()
+
+if __name__ == "__main__":
+    asyncio.run(main())
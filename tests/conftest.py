@@ -0,0 +1,20 @@
+import pytest
+
+from wmbc.fleet import WMBFleetController
+from wmbc.sim import SimulatedNetwork
+
+
+@pytest.fixture
+def sim_fleet():
+    """
+    Factory of fleet controllers with initialized sinks over a simulated network
+
+    Usage: fleet = sim_fleet(network, **fleet kwargs), sink_ids default to the sinks of the network.
+    """
+    def create(network: SimulatedNetwork, **kwargs) -> WMBFleetController:
+        kwargs.setdefault("sink_ids", [sink.sink_id for sink in network.sink_manager.get_sinks()])
+        fleet = WMBFleetController(sink_controller=network.sink_controller, **kwargs)
+        fleet.initialize_sink()
+        return fleet
+
+    return create
@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from wmbc.mb_proto import crc16  # noqa: E402
+from wmbc.mb_proto.mb_protocol_batch import decode_many  # noqa: E402
+from wmbc.mb_proto.mb_protocol_iface import MBProto  # noqa: E402
+from wmbc.modbus_planner import build_read_request  # noqa: E402
+from wmbc.sim import WMBDeviceEmulator  # noqa: E402
+
+
+def _with_crc(data: bytes) -> bytes:
+    crc = crc16.crc16(data)
+    return data + bytes([crc >> 8, crc & 0xFF])
+
+
+def _frames() -> list:
+    mbproto = MBProto()
+    mbproto.target_port = 1
+    device = WMBDeviceEmulator(7)
+    device.slaves[1][0].holding_registers.update({0: 10, 1: 11, 2: 12, 3: 13})
+
+    def read(address: int, count: int) -> bytes:
+        return device.handle(mbproto.create_modbus_oneshot(build_read_request(1, 3, address, count)))[0]
+
+    four = read(0, 4)
+    return [
+        read(0, 2),
+        four,
+        # Illegal data value, the slave answers with a Modbus exception
+        read(0, 0),
+        four[:-1] + bytes([four[-1] ^ 0xFF]),
+        # Valid CRC of a truncated protobuf message
+        _with_crc(b"\x0a\xff"),
+        device.handle(mbproto.create_diagnostics())[0],
+        read(2, 1),
+    ]
+
+
+def test_registers_are_padded_to_the_longest_response():
+    batch = decode_many(_frames(), src=[7] * 7)
+    assert len(batch) == 7 and batch.registers.shape == (7, 4)
+    assert batch.register_count.tolist() == [2, 4, 0, 0, 0, 0, 1]
+    assert batch.registers.tolist() == [[10, 11, 0, 0], [10, 11, 12, 13], [0] * 4, [0] * 4, [0] * 4, [0] * 4,
+                                        [12, 0, 0, 0]]
+    assert batch.src.tolist() == [7] * 7 and batch.port[0] == batch.port[1]
+
+
+def test_error_mask():
+    batch = decode_many(_frames())
+    assert batch.error.tolist() == [False, False, True, True, True, True, False]
+    # The exception is decoded, only the CRC and parse failures leave their rows empty
+    assert batch.function_code.tolist()[:4] == [3, 3, 0x83, 0] and batch.exception_code[2] != 0
+    assert batch.dev_id.tolist() == [1, 1, 1, 0, 0, 0, 1]
+    assert batch.cmd[5] == MBProto.peek_cmd(MBProto().create_diagnostics()) and batch.cmd[3] == batch.cmd[4] == 0
+
+
+def test_empty_batch():
+    batch = decode_many([])
+    assert len(batch) == 0 and batch.registers.shape == (0, 0)
+
+
+def test_source_count_has_to_match():
+    with pytest.raises(ValueError):
+        decode_many(_frames(), src=np.arange(3))
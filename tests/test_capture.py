@@ -0,0 +1,70 @@
+import asyncio
+
+from wmbc.capture import FLAG_CRC_ERROR, FLAG_RAW, CaptureRing, SnifferCapture, encode_batch, read_capture
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.modbus_planner import build_read_request
+from wmbc.sim import PeriodicConfiguration, SimulatedNetwork, WMBDeviceEmulator
+
+READ = build_read_request(1, 3, 0, 2)
+
+
+def test_ring_wraps_around_and_counts_drops():
+    ring = CaptureRing(capacity=3, slot_size=4)
+    assert ring.put(1, 1.0, b"a")
+    assert ring.put(2, 2.0, b"bb")
+    assert not ring.put(3, 3.0, b"12345")
+    assert ring.take(1) == ([1], [1.0], [b"a"])
+    assert ring.put(3, 3.0, b"ccc")
+    assert ring.put(4, 4.0, b"dddd")
+    assert not ring.put(5, 5.0, b"e")
+    assert len(ring) == 3 and ring.dropped == 1 and ring.oversized == 1
+    assert ring.take(10) == ([2, 3, 4], [2.0, 3.0, 4.0], [b"bb", b"ccc", b"dddd"])
+    assert len(ring) == 0 and ring.take(1) == ([], [], [])
+
+
+def _payloads():
+    device = WMBDeviceEmulator(7)
+    device.configurations[1] = PeriodicConfiguration(1, 60, READ)
+    report = device.periodic_answer(1)
+    diagnostics = device.handle(MBProto().create_diagnostics())[0]
+    corrupted = report[:-1] + bytes([report[-1] ^ 0xFF])
+    return device, [report, diagnostics, corrupted]
+
+
+def test_records_round_trip(tmp_path):
+    device, payloads = _payloads()
+    records, raw = encode_batch([7, 7, 8], [1.0, 2.0, 3.0], payloads)
+    assert raw == 2
+    path = tmp_path / "capture.wmbcap"
+    with open(path, "wb") as f:
+        f.write(b"WMBCAP\x01\x00" + records + records[:5])
+    report, diagnostics, corrupted = list(read_capture(str(path)))
+    assert not report.is_raw and report.data == device.modbus_request(1, READ) and report.src == 7
+    assert diagnostics.flags == FLAG_RAW and diagnostics.data == payloads[1]
+    assert corrupted.flags == FLAG_RAW | FLAG_CRC_ERROR and corrupted.timestamp == 3.0
+
+
+def test_sniffer_capture_writes_received_payloads(tmp_path, sim_fleet):
+    network = SimulatedNetwork.with_devices(1, latency=0.001)
+    _, payloads = _payloads()
+    path = str(tmp_path / "capture.wmbcap")
+
+    async def scenario():
+        fleet = sim_fleet(network)
+        capture = SnifferCapture(fleet, path, capacity=16, batch_size=4, flush_interval=0.05)
+        task = asyncio.ensure_future(capture.run())
+        sink = network.sink_manager.get_sinks()[0]
+        for _ in range(10):
+            network.uplink(sink, network.device(1), payloads[0])
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return capture.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["captured"] == 10 and stats["raw"] == 0 and stats["buffered"] == 0
+    records = list(read_capture(path))
+    assert len(records) == 10 and all(record.src == 1 and not record.is_raw for record in records)
@@ -0,0 +1,81 @@
+import random
+import sys
+
+import pytest
+
+from wmbc.mb_proto import crc16
+
+# Reference values of crccheck.crc.Crc16Dds110, kept so the check runs without crccheck installed
+VECTORS = [
+    (b"", 0x800D),
+    (b"\x00", 0x8E03),
+    (b"\xff", 0x8C01),
+    (b"123456789", 0x9ECF),
+    (bytes(range(256)), 0xB5A1),
+    (bytes.fromhex("0847100118022a040a020a00"), 0xEC00),
+]
+
+EDGE_LENGTHS = (0, 1, 2, 3, 15, 16, 17, 101, 102, 255, 256, 257, 1024)
+
+
+def _frames(seed: int = 7, count: int = 300) -> list:
+    rnd = random.Random(seed)
+    lengths = list(EDGE_LENGTHS) + [rnd.randrange(0, 300) for _ in range(count)]
+    return [rnd.randbytes(length) for length in lengths]
+
+
+def _with_crc(data: bytes) -> bytes:
+    crc = crc16.crc16(data)
+    return data + bytes([crc >> 8, crc & 0xFF])
+
+
+@pytest.mark.parametrize("data, expected", VECTORS)
+def test_reference_vectors(data, expected):
+    assert crc16.crc16(data) == expected
+
+
+def test_matches_crccheck():
+    crc = pytest.importorskip("crccheck.crc")
+    for data in _frames():
+        assert crc16.crc16(data) == crc.Crc16Dds110.calc(data)
+
+
+def test_verify():
+    frame = _with_crc(b"\x01\x02\x03")
+    assert crc16.verify(frame)
+    assert crc16.verify(memoryview(frame))
+    assert not crc16.verify(frame[:-1] + bytes([frame[-1] ^ 1]))
+    assert not crc16.verify(b"\x80")
+
+
+def _corrupted(frames: list) -> tuple:
+    rnd = random.Random(11)
+    frames = [_with_crc(data) for data in frames]
+    expected = []
+    for i, frame in enumerate(frames):
+        if rnd.random() < 0.3:
+            position = rnd.randrange(len(frame))
+            frames[i] = frame[:position] + bytes([frame[position] ^ 0x10]) + frame[position + 1:]
+            expected.append(False)
+        else:
+            expected.append(True)
+    # Frames too short to carry a CRC
+    return frames + [b"", b"\x01"], expected + [False, False]
+
+
+def test_verify_many_numpy():
+    pytest.importorskip("numpy")
+    frames, expected = _corrupted(_frames())
+    assert list(crc16.verify_many(frames)) == expected
+    assert list(crc16.verify_many(frames)) == [crc16.verify(frame) for frame in frames]
+
+
+def test_verify_many_without_numpy(monkeypatch):
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    frames, expected = _corrupted(_frames(count=50))
+    assert list(crc16.verify_many(frames)) == expected
+
+
+def test_verify_many_empty_and_short():
+    assert list(crc16.verify_many([])) == []
+    assert list(crc16.verify_many([b"", b"\x01"])) == [False, False]
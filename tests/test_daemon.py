@@ -0,0 +1,90 @@
+import asyncio
+import os
+import stat
+
+import pytest
+
+from wmbc.client import WMBClient
+from wmbc.daemon import ControllerDaemon
+from wmbc.sim import SimulatedNetwork
+
+
+def _serve(sim_fleet, tmp_path, scenario, network=None):
+    network = network or SimulatedNetwork.with_devices(2, latency=0.005)
+    path = str(tmp_path / "wmbc.sock")
+
+    async def run():
+        fleet = sim_fleet(network)
+        daemon = ControllerDaemon(fleet, path)
+        await daemon.start()
+        try:
+            async with WMBClient(path) as client:
+                return await scenario(client, daemon, fleet, network)
+        finally:
+            await daemon.close()
+
+    return asyncio.run(run())
+
+
+def test_socket_is_private(tmp_path, sim_fleet):
+    async def scenario(client, daemon, fleet, network):
+        return stat.S_IMODE(os.stat(daemon.path).st_mode)
+
+    assert _serve(sim_fleet, tmp_path, scenario) == 0o600
+    assert not os.path.exists(tmp_path / "wmbc.sock")
+
+
+def test_request_send_and_stats(tmp_path, sim_fleet):
+    async def scenario(client, daemon, fleet, network):
+        diag = await client.request(1, cmd="diag", timeout=0.5)
+        oneshot = await client.request(2, cmd="modbus_1s", target_port=1, modbus_frame="0103000000044409",
+                                       decode_modbus=True, timeout=0.5)
+        missing = await client.request(3, cmd="diag", timeout=0.05)
+        sent = await client.send(1, cmd="reset")
+        with pytest.raises(ValueError, match="Unsupported method"):
+            await client.call("shutdown")
+        with pytest.raises(ValueError, match="Destination address"):
+            await client.request(0, cmd="diag")
+        return diag, oneshot, missing, sent, await client.stats()
+
+    diag, oneshot, missing, sent, stats = _serve(sim_fleet, tmp_path, scenario)
+    assert diag["status"] == "answered" and diag["device"] == 1
+    assert oneshot["status"] == "answered"
+    assert missing["status"] == "timeout"
+    assert sent["device"] == 1
+    assert stats["connections"] == 1 and stats["inflight"] == 0
+    assert stats["sinks"]["sink0"]["sent"] >= 4
+
+
+def test_concurrent_requests_of_same_command_get_their_own_answers(tmp_path, sim_fleet):
+    network = SimulatedNetwork.with_devices(1, latency=0.01, jitter=0.01, seed=1)
+    device = network.device(1)
+    for address in range(4):
+        device.slaves[1][0].holding_registers[address] = 100 + address
+
+    async def scenario(client, daemon, fleet, network):
+        from wmbc.modbus_planner import build_read_request
+        frames = [build_read_request(1, 3, address, 1).hex() for address in range(4)]
+        results = await asyncio.gather(*(client.request(1, cmd="modbus_1s", target_port=1, modbus_frame=frame,
+                                                        decode_modbus=True, timeout=1.0) for frame in frames))
+        return [result["answer"] for result in results]
+
+    answers = _serve(sim_fleet, tmp_path, scenario, network)
+    frames = [answer["payload"]["payload_answer_frame"]["modbus_response_frame"]["modbus_frame"] for answer in answers]
+    registers = [frame["ReadHoldingRegistersResponse"]["registers"] for frame in frames]
+    assert registers == [[100], [101], [102], [103]]
+
+
+def test_subscribers_receive_unsolicited_messages(tmp_path, sim_fleet):
+    async def scenario(client, daemon, fleet, network):
+        events = client.subscribe([2])
+        first = asyncio.ensure_future(events.__anext__())
+        await asyncio.sleep(0.05)
+        sink = network.sink_manager.get_sinks()[0]
+        for address in (1, 2):
+            device = network.device(address)
+            network.uplink(sink, device, device.handle(fleet.mbproto.create_diagnostics())[0])
+        return await asyncio.wait_for(first, 1.0)
+
+    event = _serve(sim_fleet, tmp_path, scenario)
+    assert event["event"] == "message" and event["device"] == 2
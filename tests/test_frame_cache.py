@@ -0,0 +1,65 @@
+import wmbc.mb_proto.mb_protocol_enums_pb2 as mb_enums
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.modbus_planner import build_read_request
+
+READS = [build_read_request(1, 3, address, 2) for address in range(3)]
+
+
+def _oneshot(mbproto: MBProto, modbus_frame: bytes) -> bytes:
+    mbproto.target_port = 1
+    return mbproto.create_modbus_oneshot(modbus_frame)
+
+
+def test_hit_returns_identical_frame():
+    mbproto = MBProto()
+    first = _oneshot(mbproto, READS[0])
+    assert _oneshot(mbproto, bytearray(READS[0])) is first
+    assert mbproto.create_diagnostics() is mbproto.create_diagnostics()
+    assert first == _oneshot(MBProto(frame_cache_size=0), READS[0])
+
+
+def test_least_recently_used_frame_is_evicted():
+    mbproto = MBProto(frame_cache_size=2)
+    first, second = (_oneshot(mbproto, frame) for frame in READS[:2])
+    # Hit moves the first frame to the end, the second one is evicted by the third
+    assert _oneshot(mbproto, READS[0]) is first
+    third = _oneshot(mbproto, READS[2])
+    assert _oneshot(mbproto, READS[0]) is first and _oneshot(mbproto, READS[2]) is third
+    again = _oneshot(mbproto, READS[1])
+    assert again == second and again is not second
+
+
+def test_zero_size_disables_cache():
+    mbproto = MBProto(frame_cache_size=0)
+    first = _oneshot(mbproto, READS[0])
+    again = _oneshot(mbproto, READS[0])
+    assert again == first and again is not first
+
+
+def test_clear_frame_cache():
+    mbproto = MBProto()
+    first = mbproto.create_diagnostics()
+    mbproto.clear_frame_cache()
+    again = mbproto.create_diagnostics()
+    assert again == first and again is not first
+
+
+def test_settings_are_part_of_the_key():
+    mbproto = MBProto()
+    frames = dict()
+    for port in (1, 2):
+        mbproto.target_port = port
+        frames[port] = mbproto.create_modbus_oneshot(READS[0])
+    assert frames[1] != frames[2]
+    for port, expected in ((1, mb_enums.MODBUS_PORT_ZERO), (2, mb_enums.MODBUS_PORT_ONE)):
+        ret, err, msg = mbproto.decode_response(frames[port])
+        assert ret and msg.payload.payload_cmd_frame.modbus_one_shot_frame.modbus_port == expected
+
+    modes = dict()
+    for mode in (0, 1, 0):
+        mbproto.device_mode = mode
+        modes.setdefault(mode, mbproto.create_device_mode())
+        assert mbproto.create_device_mode() is modes[mode]
+    assert modes[0] != modes[1]
+    ret, err, msg = mbproto.decode_response(modes[1])
+    assert ret and msg.payload.payload_cmd_frame.device_mode_frame.device_mode == mb_enums.MODBUS_MODE_SNIFFER
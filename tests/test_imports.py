@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+# Modules imported on first use only, importing them is slow or needs the sink services
+LAZY_MODULES = ("wsctrl", "wirepas_mesh_messaging", "pymodbus", "numpy", "yaml")
+
+# Generous wall time budget of the imports in seconds, benchmarks/bench_startup.py has the tight ones
+IMPORT_BUDGET = 2.0
+
+_IMPORTS = """
+import json, logging, signal, sys
+from time import perf_counter
+sigint_handler = signal.getsignal(signal.SIGINT)
+root_handlers = list(logging.getLogger().handlers)
+start = perf_counter()
+import wmbc.wmbc, wmbc.fleet, wmbc.client
+elapsed = perf_counter() - start
+print(json.dumps({
+    "loaded": sorted(name for name in %r if name in sys.modules),
+    "sigint_handler": signal.getsignal(signal.SIGINT) is sigint_handler,
+    "root_handlers": logging.getLogger().handlers == root_handlers,
+    "elapsed": elapsed,
+}))
+"""
+
+
+def test_import_is_lazy_and_free_of_side_effects():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (root, env.get("PYTHONPATH"))))
+    completed = subprocess.run([sys.executable, "-c", _IMPORTS % (LAZY_MODULES,)], env=env, check=True,
+                               capture_output=True, text=True)
+    imports = json.loads(completed.stdout)
+    assert imports["loaded"] == []
+    assert imports["sigint_handler"] and imports["root_handlers"]
+    assert imports["elapsed"] < IMPORT_BUDGET
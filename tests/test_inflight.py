@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from wmbc.inflight import InFlightTable
+from wmbc.sim import SimulatedNetwork
+from wmbc.wmbc import WMBController
+
+DIAG = 2
+
+
+def test_answer_completes_oldest_matching_request():
+    async def scenario():
+        table = InFlightTable()
+        first = table.add(5, DIAG)
+        second = table.add(5, DIAG)
+        assert table.match(5, DIAG, None, "a")
+        assert first.future.result() == "a" and not second.future.done()
+        assert not table.match(6, DIAG, None, "b")
+        assert len(table) == 1
+
+    asyncio.run(scenario())
+
+
+def test_tombstone_does_not_swallow_answer_of_outstanding_request():
+    async def scenario():
+        table = InFlightTable()
+        timed_out = table.add(5, DIAG)
+        table.expire(timed_out)
+        request = table.add(5, DIAG)
+        assert table.match(5, DIAG, None, "fresh")
+        assert request.future.result() == "fresh"
+        assert table.stale_dropped == 0
+
+    asyncio.run(scenario())
+
+
+def test_tombstone_drops_unsolicited_late_answer():
+    async def scenario():
+        table = InFlightTable()
+        table.expire(table.add(5, DIAG))
+        assert table.match(5, DIAG, None, "late")
+        assert table.stale_dropped == 1
+        assert not table.match(5, DIAG, None, "unsolicited")
+
+    asyncio.run(scenario())
+
+
+def test_run_periodically_recovers_after_timed_out_poll():
+    network = SimulatedNetwork.with_devices(1, latency=0.01, loss=0.0, seed=1)
+    answers = []
+
+    async def scenario():
+        controller = WMBController(sink_controller=network.sink_controller, sink_ids=["sink0"], cmd="diag", dst_addr=1)
+        controller.initialize_sink()
+        # Every packet of the first poll is lost
+        network.loss = 0.999
+        poller = asyncio.ensure_future(controller.run_periodically(0.2, 0.05, lambda msg, args: answers.append(msg)))
+        await asyncio.sleep(0.25)
+        assert not answers
+        network.loss = 0.0
+        await asyncio.sleep(1.0)
+        poller.cancel()
+
+    asyncio.run(scenario())
+    assert len(answers) >= 4
+
+
+def test_tombstone_expires_after_request_window():
+    async def scenario():
+        table = InFlightTable(stale_window=30.0)
+        request = table.add(5, DIAG)
+        request.stale_window = 0.02
+        table.expire(request)
+        await asyncio.sleep(0.03)
+        assert not table.match(5, DIAG, None, "late")
+
+    asyncio.run(scenario())
+
+
+def test_fleet_recovers_after_outage(sim_fleet):
+    network = SimulatedNetwork.with_devices(1, latency=0.005, seed=2)
+
+    async def scenario():
+        fleet = sim_fleet(network)
+        frame = fleet.mbproto.create_diagnostics()
+        network.loss = 0.999
+        with pytest.raises(asyncio.TimeoutError):
+            await fleet.request(1, frame, timeout=0.02)
+        network.loss = 0.0
+        results = []
+        for _ in range(40):
+            try:
+                await fleet.request(1, frame, timeout=0.1)
+                results.append(True)
+            except asyncio.TimeoutError:
+                results.append(False)
+        return results, fleet.inflight.stale_dropped
+
+    results, stale_dropped = asyncio.run(scenario())
+    assert all(results)
+    assert stale_dropped == 0
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+import pytest
+
+from wmbc.manifest import (STATUS_ACK, STATUS_ANSWERED, STATUS_ERROR, STATUS_TIMEOUT, ManifestEntry, ManifestRunner,
+                           load_manifest, parse_manifest, summarize)
+from wmbc.retry import NO_RETRY
+from wmbc.sim import SimulatedNetwork
+
+
+def test_load_csv(tmp_path):
+    path = tmp_path / "manifest.csv"
+    path.write_text("device,cmd,target_port,port_cfg\n21,port_cfg,1,9600 0 1\n0x16,diag,,\n")
+    assert load_manifest(str(path)) == [
+        ManifestEntry(21, "port_cfg", {"target_port": 1, "port_cfg": ["9600", "0", "1"]}),
+        ManifestEntry(22, "diag", {})]
+
+
+def test_load_json_with_defaults(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({"defaults": {"cmd": "ant_cfg", "ant_cfg": 1},
+                                "commands": [{"device": 21}, {"dst_addr": 22, "ant_cfg": "0"}]}))
+    assert load_manifest(str(path)) == [ManifestEntry(21, "ant_cfg", {"ant_cfg": 1}),
+                                        ManifestEntry(22, "ant_cfg", {"ant_cfg": 0})]
+
+
+@pytest.mark.parametrize("data", [{"commands": None}, "diag", [{"cmd": "diag"}], [{"device": 21}]])
+def test_parse_rejects_invalid_manifests(data):
+    with pytest.raises(ValueError):
+        parse_manifest(data)
+
+
+def test_unsupported_format(tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_text("")
+    with pytest.raises(ValueError):
+        load_manifest(str(path))
+
+
+def test_run_over_simulated_network(sim_fleet):
+    async def run():
+        network = SimulatedNetwork.with_devices(2, latency=0.01, seed=1)
+        fleet = sim_fleet(network)
+        first, second = 1, 2
+        entries = [ManifestEntry(first, "port_cfg", {"target_port": 1, "port_cfg": ["9600", "0", "1"]}),
+                   ManifestEntry(first, "diag"),
+                   ManifestEntry(second, "unknown"),
+                   ManifestEntry(second, "diag"),
+                   ManifestEntry(0xDEAD, "diag")]
+        return await ManifestRunner(fleet, concurrency=2, timeout=0.1, retry_policy=NO_RETRY).run(entries)
+
+    results = asyncio.run(run())
+    assert [result.status for result in results] == [STATUS_ACK, STATUS_ANSWERED, STATUS_ERROR, STATUS_ANSWERED,
+                                                     STATUS_TIMEOUT]
+    assert results[2].error and results[2].elapsed is None
+    assert all(result.elapsed is not None for result in results if result.status != STATUS_ERROR)
+    summary = summarize(results)
+    assert summary["statuses"] == {STATUS_ACK: 1, STATUS_ANSWERED: 2, STATUS_ERROR: 1, STATUS_TIMEOUT: 1}
+    assert summary["failed_devices"] == [2, 0xDEAD]
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from wmbc import metrics
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.metrics import MetricsRegistry
+from wmbc.sim import SimulatedNetwork, WMBDeviceEmulator
+from wmbc.wmbc import WMBController
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Test counter", ("device", "cmd"))
+    gauge = registry.gauge("test_value", "Test gauge")
+    histogram = registry.histogram("test_seconds", "Test histogram", ("device",), buckets=(0.1, 1.0))
+    counter.inc(21, 'a"b', amount=2)
+    gauge.set(value=1.5)
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(21, value=value)
+    assert registry.render().splitlines() == [
+        "# HELP test_total Test counter",
+        "# TYPE test_total counter",
+        'test_total{device="21",cmd="a\\"b"} 2',
+        "# HELP test_value Test gauge",
+        "# TYPE test_value gauge",
+        "test_value 1.5",
+        "# HELP test_seconds Test histogram",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{device="21",le="0.1"} 1',
+        'test_seconds_bucket{device="21",le="1.0"} 2',
+        'test_seconds_bucket{device="21",le="+Inf"} 3',
+        'test_seconds_sum{device="21"} 5.55',
+        'test_seconds_count{device="21"} 3',
+    ]
+    assert registry.snapshot()["test_seconds"]["samples"][0]["buckets"] == {0.1: 1, 1.0: 2}
+
+
+def test_labels_and_registration_are_checked():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Test counter", ("device",))
+    with pytest.raises(ValueError):
+        counter.inc(1, "extra")
+    assert registry.counter("test_total", "Test counter", ("device",)) is counter
+    with pytest.raises(ValueError):
+        registry.gauge("test_total", "Test gauge", ("device",))
+
+
+def test_decode_errors_are_labelled_by_device():
+    mbproto = MBProto()
+    frame = bytearray(WMBDeviceEmulator(5).handle(mbproto.create_diagnostics())[0])
+    frame[-1] ^= 0xFF
+    before = metrics.DECODE_ERRORS.value(5, "crc")
+    unknown = metrics.DECODE_ERRORS.value("unknown", "crc")
+    assert not mbproto.decode_response(bytes(frame), src=5)[0]
+    assert not mbproto.decode_response(bytes(frame))[0]
+    assert metrics.DECODE_ERRORS.value(5, "crc") == before + 1
+    assert metrics.DECODE_ERRORS.value("unknown", "crc") == unknown + 1
+
+
+def test_batch_decode_errors_are_labelled_by_device():
+    pytest.importorskip("numpy")
+    mbproto = MBProto()
+    good = WMBDeviceEmulator(5).handle(mbproto.create_diagnostics())[0]
+    bad = good[:-1] + bytes([good[-1] ^ 0xFF])
+    before = {device: metrics.DECODE_ERRORS.value(device, "crc") for device in (5, 6)}
+    mbproto.decode_many([bad, good, bad, bad], src=[5, 5, 6, 6])
+    assert metrics.DECODE_ERRORS.value(5, "crc") == before[5] + 1
+    assert metrics.DECODE_ERRORS.value(6, "crc") == before[6] + 2
+
+
+def test_run_records_answer():
+    network = SimulatedNetwork.with_devices(1, latency=0.005)
+    controller = WMBController(sink_controller=network.sink_controller, cmd="diag", dst_addr=1,
+                               sink_ids=["sink0"])
+    controller.initialize_sink()
+    before = metrics.ANSWERS_RECEIVED.value(1, "CMD_DIAGNOSTICS")
+    asyncio.run(asyncio.wait_for(controller.run(quit=True), 1.0))
+    assert metrics.ANSWERS_RECEIVED.value(1, "CMD_DIAGNOSTICS") == before + 1
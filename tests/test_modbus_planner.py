@@ -0,0 +1,41 @@
+import asyncio
+
+from wmbc.mb_proto import modbus_rtu
+from wmbc.modbus_planner import ModbusRead, plan_reads, read_all
+from wmbc.sim import ModbusSlaveSim, SimulatedNetwork
+
+
+def test_plan_merges_close_reads_within_limits():
+    reads = [ModbusRead(1, 1, 1, 3, 10, 2), ModbusRead(1, 1, 1, 3, 0, 4), ModbusRead(1, 1, 1, 3, 200, 1),
+             ModbusRead(1, 1, 1, 4, 0, 1), ModbusRead(1, 2, 1, 3, 0, 1)]
+    plan = plan_reads(reads, max_gap=6)
+    assert [(c.port, c.function_code, c.address, c.count, c.reads) for c in plan] == [
+        (1, 3, 0, 12, [1, 0]), (1, 3, 200, 1, [2]), (1, 4, 0, 1, [3]), (2, 3, 0, 1, [4])]
+    frame = plan[0].frame
+    assert modbus_rtu.crc16_modbus(frame[:-2]) == int.from_bytes(frame[-2:], "little")
+
+
+def test_plan_splits_reads_over_register_limit():
+    reads = [ModbusRead(1, 1, 1, 3, 0, 100), ModbusRead(1, 1, 1, 3, 100, 100)]
+    assert len(plan_reads(reads)) == 2
+
+
+def test_read_all_uses_private_mbproto(sim_fleet):
+    network = SimulatedNetwork.with_devices(1, latency=0.005)
+    device = network.device(1)
+    device.slaves[2] = [ModbusSlaveSim(2)]
+    device.slaves[1][0].holding_registers.update({0: 11, 5: 15})
+    device.slaves[2][0].input_registers[3] = 23
+    reads = [ModbusRead(1, 1, 1, 3, 0, 1), ModbusRead(1, 1, 1, 3, 5, 1), ModbusRead(1, 2, 2, 4, 3, 1),
+             ModbusRead(1, 2, 7, 4, 3, 1)]
+
+    async def scenario():
+        fleet = sim_fleet(network)
+        fleet.mbproto.target_port = 1
+        port = fleet.mbproto.target_port
+        results = await read_all(fleet, reads, timeout=0.2)
+        return results, port, fleet.mbproto.target_port
+
+    results, before, after = asyncio.run(scenario())
+    assert [None if values is None else list(values) for values in results] == [[11], [15], [23], None]
+    assert after == before
@@ -0,0 +1,71 @@
+import random
+import struct
+
+import pytest
+
+from wmbc.mb_proto import modbus_rtu
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+
+pytest.importorskip("pymodbus")
+
+
+def _frame(pdu: bytes) -> bytes:
+    return pdu + modbus_rtu.crc16_modbus(pdu).to_bytes(2, "little")
+
+
+def _responses(seed: int = 1):
+    rng = random.Random(seed)
+    for _ in range(5):
+        slave = rng.randint(1, 247)
+        for function_code in (modbus_rtu.FC_READ_HOLDING_REGISTERS, modbus_rtu.FC_READ_INPUT_REGISTERS):
+            registers = [rng.randrange(0x10000) for _ in range(rng.randint(1, 125))]
+            yield _frame(struct.pack(f">BBB{len(registers)}H", slave, function_code, 2 * len(registers), *registers))
+        for function_code in (modbus_rtu.FC_READ_COILS, modbus_rtu.FC_READ_DISCRETE_INPUTS):
+            data = rng.randbytes(rng.randint(1, 250))
+            yield _frame(bytes([slave, function_code, len(data)]) + data)
+        address = rng.randrange(0x10000)
+        yield _frame(struct.pack(">BBHH", slave, modbus_rtu.FC_WRITE_SINGLE_COIL, address, rng.choice((0, 0xFF00))))
+        yield _frame(struct.pack(">BBHH", slave, modbus_rtu.FC_WRITE_SINGLE_REGISTER, address, rng.randrange(0x10000)))
+        yield _frame(struct.pack(">BBHH", slave, modbus_rtu.FC_WRITE_MULTIPLE_COILS, address, rng.randint(1, 1968)))
+        yield _frame(struct.pack(">BBHH", slave, modbus_rtu.FC_WRITE_MULTIPLE_REGISTERS, address, rng.randint(1, 123)))
+        function_code = rng.choice(list(modbus_rtu.RESPONSE_NAMES))
+        yield _frame(bytes([slave, function_code | 0x80, rng.randint(1, 4)]))
+
+
+def _pymodbus_dict(monkeypatch, frame: bytes) -> dict:
+    with monkeypatch.context() as patch:
+        patch.setattr(modbus_rtu, "parse_response", lambda frame: None)
+        return MBProto().decode_modbus_frame(frame)
+
+
+@pytest.mark.parametrize("frame", list(_responses()), ids=lambda frame: frame[:2].hex())
+def test_native_parser_matches_pymodbus(monkeypatch, frame):
+    response = modbus_rtu.parse_response(frame)
+    assert response is not None
+    assert response.to_dict() == _pymodbus_dict(monkeypatch, frame)
+
+
+def test_unhandled_function_code_falls_back():
+    frame = _frame(bytes([1, 0x11, 2, 0xAA, 0xBB]))
+    assert modbus_rtu.parse_response(frame) is None
+
+
+@pytest.mark.parametrize("frame, message", [
+    (bytes([1, 3, 2]), "too short"),
+    (_frame(bytes([1, 3, 4, 0, 1])), "length"),
+    (_frame(bytes([1, 3, 3, 0, 1, 2])), "Odd"),
+    (_frame(bytes([1, 3, 2, 0, 1]))[:-1] + b"\x00", "CRC"),
+])
+def test_malformed_frames_raise(frame, message):
+    with pytest.raises(ValueError, match=message):
+        modbus_rtu.parse_response(frame)
+
+
+def test_crc_matches_pymodbus():
+    from pymodbus.framer import FramerRTU
+    rng = random.Random(2)
+    for length in (0, 1, 2, 7, 64, 255):
+        data = rng.randbytes(length)
+        # pymodbus returns the CRC in wire order, low byte first
+        crc = modbus_rtu.crc16_modbus(data)
+        assert crc.to_bytes(2, "little") == FramerRTU.compute_CRC(data).to_bytes(2, "big")
@@ -0,0 +1,87 @@
+import io
+import json
+
+import pytest
+
+from wmbc.commands import build_command
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.modbus_planner import build_read_request
+from wmbc.offline import (decode_frame, decode_frames, encode_command, encode_commands, parse_hex, read_frames,
+                          write_records)
+from wmbc.sim import WMBDeviceEmulator
+
+READ = build_read_request(1, 3, 0, 2)
+
+
+@pytest.mark.parametrize("text", ["0103000000044409", " 0x0103000000044409\n", "01:03:00:00:00:04:44:09",
+                                  "01 03 00 00 00 04 44 09"])
+def test_parse_hex(text):
+    assert parse_hex(text) == bytes.fromhex("0103000000044409")
+
+
+def test_encode_matches_builders():
+    mbproto = MBProto()
+    assert encode_command(mbproto, {"cmd": "diag"}) == MBProto().create_diagnostics()
+    frame = encode_command(mbproto, {"cmd": "modbus_1s", "target_port": 1, "modbus_frame": READ.hex()})
+    expected = MBProto()
+    expected.target_port = 1
+    assert frame == expected.create_modbus_oneshot(READ)
+
+
+def test_encode_reports_errors_in_order():
+    lines = [({"line": 1}, '{"cmd": "diag"}'), ({"line": 2}, "not json"), ({"line": 3}, "[1]"),
+             ({"line": 4}, '{"target_port": 1}'), ({"line": 5}, '{"cmd": "diag", "unknown": 1}'),
+             ({"line": 6}, '{"cmd": "reset"}')]
+    records = list(encode_commands(MBProto(), lines))
+    assert [record["line"] for record in records] == [1, 2, 3, 4, 5, 6]
+    assert [("error" in record) for record in records] == [False, True, True, True, True, False]
+    assert records[0]["cmd"] == "diag" and bytes.fromhex(records[0]["frame"]) == MBProto().create_diagnostics()
+    out = io.StringIO()
+    assert write_records(records, out, "hex") == 4
+    assert out.getvalue().split() == [records[0]["frame"], records[5]["frame"]]
+
+
+def test_decode_answers_and_commands():
+    mbproto = MBProto()
+    mbproto.target_port = 1
+    device = WMBDeviceEmulator(21)
+    device.slaves[1][0].holding_registers.update({0: 1, 1: 2})
+    answer = device.handle(mbproto.create_modbus_oneshot(READ))[0]
+    record = decode_frame(MBProto(), answer, decode_modbus_frame=True)
+    assert record["ok"] and record["type"] == "answer"
+    response = record["payload"]["payload_answer_frame"]["modbus_response_frame"]
+    assert response["modbus_frame"]["ReadHoldingRegistersResponse"]["registers"] == [1, 2]
+    response = decode_frame(MBProto(), answer)["payload"]["payload_answer_frame"]["modbus_response_frame"]
+    assert response["modbus_frame"] == "010304000100022a32"
+    command = decode_frame(MBProto(), MBProto().create_diagnostics())
+    assert command["ok"] and command["type"] == "command"
+    corrupted = answer[:-1] + bytes([answer[-1] ^ 0xFF])
+    assert not decode_frame(MBProto(), corrupted)["ok"]
+
+
+def test_decode_hex_lines(tmp_path):
+    answer = WMBDeviceEmulator(21).handle(MBProto().create_diagnostics())[0]
+    path = tmp_path / "frames.hex"
+    path.write_text(f"# diagnostics\n{answer.hex()}\nzz\n\n{answer[:-1].hex()}00\n")
+    records = list(decode_frames(MBProto(), read_frames([str(path)])))
+    assert [record["line"] for record in records] == [2, 3, 5]
+    assert [record["ok"] for record in records] == [True, False, False]
+    assert records[1]["error"] == "Invalid hex frame"
+    out = io.StringIO()
+    assert write_records(records, out) == 2
+    assert [json.loads(line)["ok"] for line in out.getvalue().splitlines()] == [True, False, False]
+
+
+@pytest.mark.parametrize("modbus_frame", [8, [1, 3], None, "zz"])
+def test_encode_rejects_invalid_modbus_frames(modbus_frame):
+    with pytest.raises(ValueError):
+        encode_command(MBProto(), {"cmd": "modbus_1s", "target_port": 1, "modbus_frame": modbus_frame})
+    record, = encode_commands(MBProto(), [({"line": 1}, json.dumps({"cmd": "modbus_1s", "target_port": 1,
+                                                                    "modbus_frame": modbus_frame}))])
+    assert "error" in record
+
+
+def test_build_command_accepts_bytes_and_hex():
+    frames = [build_command(MBProto(), "modbus_1s", target_port=1, modbus_frame=frame)
+              for frame in (READ, bytearray(READ), READ.hex())]
+    assert frames[0] == frames[1] == frames[2]
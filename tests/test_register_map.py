@@ -0,0 +1,85 @@
+import asyncio
+import struct
+
+import pytest
+
+from wmbc.register_map import WORD_ORDERS, RegisterDef, RegisterMap
+from wmbc.sim import ModbusSlaveSim, SimulatedNetwork
+
+VALUES = [("uint16", 0xBEEF), ("int16", -2), ("uint32", 0x11223344), ("int32", -123456), ("float32", 1.5),
+          ("uint64", 0x0102030405060708), ("int64", -(1 << 40)), ("float64", -0.25)]
+
+
+def _wire_registers(code: str, value, word_order: str) -> list:
+    """Registers of the value as a slave with the word order puts them on the wire"""
+    data = struct.pack(">" + code, value)
+    words = [data[i:i + 2] for i in range(0, len(data), 2)]
+    if word_order in ("CDAB", "DCBA"):
+        words.reverse()
+    if word_order in ("BADC", "DCBA"):
+        words = [word[::-1] for word in words]
+    return [int.from_bytes(word, "big") for word in words]
+
+
+@pytest.mark.parametrize("word_order", WORD_ORDERS)
+def test_decode_word_orders(word_order):
+    slave = ModbusSlaveSim(1)
+    registers = []
+    address = 0
+    codes = {"uint16": "H", "int16": "h", "uint32": "I", "int32": "i", "float32": "f",
+             "uint64": "Q", "int64": "q", "float64": "d"}
+    for name, value in VALUES:
+        words = _wire_registers(codes[name], value, word_order)
+        slave.holding_registers.update(enumerate(words, address))
+        registers.append(RegisterDef(name, 1, 3, address, name, word_order))
+        # Gap between values is skipped
+        address += len(words) + 1
+    register_map = RegisterMap(registers)
+    assert len(register_map.blocks) == 1
+    block = register_map.blocks[0]
+    assert register_map.decode(slave.handle(block.frame)) == dict(VALUES)
+
+
+def test_decode_scaling_and_bits():
+    slave = ModbusSlaveSim(3)
+    slave.input_registers[10] = 250
+    slave.coils.update({0: True, 9: True})
+    register_map = RegisterMap.from_dict({"slave": 3, "registers": [
+        {"name": "temperature", "function_code": 4, "address": 10, "scale": 0.1, "offset": -5},
+        {"name": "pump", "function_code": 1, "address": 0, "type": "bool"},
+        {"name": "valve", "function_code": 1, "address": 9, "type": "bool"},
+        {"name": "alarm", "function_code": 1, "address": 4, "type": "bool"}]})
+    values = dict()
+    for block in register_map.blocks:
+        values.update(block.decode(slave.handle(block.frame)))
+    assert values == {"temperature": pytest.approx(20.0), "pump": True, "valve": True, "alarm": False}
+
+
+def test_decode_rejects_corrupted_and_exception_frames():
+    register_map = RegisterMap([RegisterDef("value", 1, 3, 0)])
+    block = register_map.blocks[0]
+    response = bytearray(ModbusSlaveSim(1).handle(block.frame))
+    response[3] ^= 0xFF
+    with pytest.raises(ValueError, match="CRC"):
+        block.decode(bytes(response))
+    with pytest.raises(ValueError, match="exception 2"):
+        block.decode(bytes([1, 0x83, 2, 0xC0, 0xF1]))
+
+
+def test_read_uses_private_mbproto(sim_fleet):
+    network = SimulatedNetwork.with_devices(1, latency=0.005)
+    slave = ModbusSlaveSim(1)
+    slave.holding_registers.update({0: 7, 1: 0x1234, 2: 0x5678})
+    network.device(1).slaves[2] = [slave]
+    register_map = RegisterMap([RegisterDef("status", 1, 3, 0), RegisterDef("counter", 1, 3, 1, "uint32")])
+
+    async def scenario():
+        fleet = sim_fleet(network)
+        fleet.mbproto.target_port = 1
+        port = fleet.mbproto.target_port
+        values = await register_map.read(fleet, 1, port=2, timeout=0.2)
+        return values, port, fleet.mbproto.target_port
+
+    values, before, after = asyncio.run(scenario())
+    assert values == {"status": 7, "counter": 0x12345678}
+    assert after == before
@@ -0,0 +1,50 @@
+import pytest
+from google.protobuf.json_format import MessageToDict
+
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.mb_proto.mb_protocol_results import (AckResult, DiagnosticsResult, MbResult, ModbusResponseResult,
+                                               decode_modbus_p_config)
+from wmbc.modbus_planner import build_read_request
+from wmbc.sim import PeriodicConfiguration, WMBDeviceEmulator
+
+
+def _answers():
+    mbproto = MBProto()
+    mbproto.target_port = 1
+    device = WMBDeviceEmulator(21)
+    device.slaves[1][0].holding_registers.update({0: 1, 1: 0xFFFF})
+    device.configurations[3] = PeriodicConfiguration(1, 60, build_read_request(1, 3, 0, 2))
+    yield AckResult, device.handle(mbproto.create_device_reset())[0]
+    yield DiagnosticsResult, device.handle(mbproto.create_diagnostics())[0]
+    yield ModbusResponseResult, device.handle(mbproto.create_modbus_oneshot(build_read_request(1, 3, 0, 2)))[0]
+    yield ModbusResponseResult, device.periodic_answer(3)
+
+
+def _json_format_dict(msg) -> dict:
+    """Layout printed before the typed results, protobuf JSON format with decoded configurations and hex frames"""
+    result = MessageToDict(msg, always_print_fields_with_no_presence=True, preserving_proto_field_name=True)
+    answer = result["payload"]["payload_answer_frame"]
+    if "modbus_response_frame" in answer:
+        data = msg.payload.payload_answer_frame.modbus_response_frame.modbus_frame
+        answer["modbus_response_frame"]["modbus_frame"] = [f"0x{byte:02x}" for byte in data]
+    if "diagnostics_ans_frame" in answer:
+        configurations = answer["diagnostics_ans_frame"]["modbus_configurations"]
+        answer["diagnostics_ans_frame"]["modbus_configurations"] = [
+            {**decode_modbus_p_config(cfg["configuration"]), "id": idx + 1}
+            for idx, cfg in enumerate(configurations)]
+    return result
+
+
+@pytest.mark.parametrize("result_type, frame", list(_answers()))
+def test_to_dict_matches_protobuf_json_format(result_type, frame):
+    mbproto = MBProto()
+    ret, err, msg = mbproto.decode_response(frame)
+    assert ret, err
+    result = mbproto.decode_answer(msg)
+    assert type(result) is result_type
+    assert result.to_dict() == _json_format_dict(msg)
+
+
+def test_base_result_is_abstract():
+    with pytest.raises(TypeError):
+        MbResult(71, 1, 1)
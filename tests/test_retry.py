@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from wmbc.inflight import InFlightTable
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.modbus_planner import build_read_request
+from wmbc.retry import NO_RETRY, RetryPolicy, policy_for, request_with_retry
+from wmbc.rtt import RttEstimator
+
+DIAGNOSTICS = 2
+
+
+def _cmd_msg(frame: bytes):
+    return MBProto().decode_response(frame)[2]
+
+
+def test_attempt_timeouts_back_off_within_deadline():
+    assert list(RetryPolicy(4, backoff=2.0).attempt_timeouts(0.5)) == [0.5, 1.0, 2.0, 4.0]
+    assert list(RetryPolicy(4, backoff=2.0, deadline=2.0).attempt_timeouts(0.5)) == [0.5, 1.0, 0.5]
+    assert list(NO_RETRY.attempt_timeouts(3.0)) == [3.0]
+    with pytest.raises(ValueError):
+        RetryPolicy(backoff=0.5)
+
+
+def test_only_idempotent_commands_are_retried():
+    mbproto = MBProto()
+    mbproto.target_port = 1
+    assert policy_for(_cmd_msg(mbproto.create_device_reset())) is NO_RETRY
+    assert policy_for(_cmd_msg(mbproto.create_diagnostics())).max_attempts == 3
+    assert policy_for(_cmd_msg(mbproto.create_modbus_oneshot(build_read_request(1, 3, 0, 1)))).max_attempts == 3
+    write = bytes.fromhex("010600010003980b")
+    assert policy_for(_cmd_msg(mbproto.create_modbus_oneshot(write))) is NO_RETRY
+
+
+def _request(answer_attempt: int, policy: RetryPolicy):
+    """Runs a request whose answer is dispatched after the given attempt was sent"""
+    inflight = InFlightTable()
+    rtt = RttEstimator(initial_rto=0.05, min_rto=0.01)
+    sent = []
+
+    def send():
+        sent.append(asyncio.get_running_loop().time())
+        if len(sent) == answer_attempt:
+            asyncio.get_running_loop().call_later(0.01, inflight.match, 1, DIAGNOSTICS, None, "answer")
+
+    async def scenario():
+        result = await request_with_retry(inflight, rtt, send, 1, DIAGNOSTICS, None, policy, 0.05)
+        return result, inflight.match(1, DIAGNOSTICS, None, "duplicate")
+
+    return asyncio.run(scenario()), sent, rtt
+
+
+def test_answer_to_first_attempt_samples_rtt():
+    (result, duplicate), sent, rtt = _request(1, RetryPolicy(3))
+    assert result == "answer" and len(sent) == 1
+    assert rtt.estimate(1).samples == 1
+    # Nothing else is expected from a request sent once
+    assert not duplicate
+
+
+def test_retried_answer_is_not_sampled():
+    (result, duplicate), sent, rtt = _request(2, RetryPolicy(3))
+    assert result == "answer" and len(sent) == 2
+    # Late answer to the first attempt is dropped as a duplicate
+    assert duplicate
+    estimate = rtt.estimate(1)
+    assert estimate.samples == 0 and estimate.timeouts == 1
+
+
+def test_unanswered_request_times_out_after_all_attempts():
+    with pytest.raises(asyncio.TimeoutError):
+        _request(0, RetryPolicy(3, backoff=1.0))
@@ -0,0 +1,43 @@
+import pytest
+
+from wmbc.rtt import RttEstimator
+from wmbc.sim import SimulatedNetwork
+
+
+def test_estimate_follows_rfc6298():
+    rtt = RttEstimator(initial_rto=3.0, min_rto=0.1)
+    assert rtt.timeout(1) == 3.0
+    rtt.observe(1, 1.0)
+    assert rtt.timeout(1) == pytest.approx(1.0 + 4 * 0.5)
+    rtt.observe(1, 2.0)
+    estimate = rtt.estimate(1)
+    assert estimate.rttvar == pytest.approx(0.75 * 0.5 + 0.25 * 1.0)
+    assert estimate.srtt == pytest.approx(7 / 8 + 2 / 8)
+    assert rtt.timeout(2) == 3.0
+
+
+def test_timeouts_back_off_within_limits():
+    rtt = RttEstimator(initial_rto=1.0, min_rto=0.5, max_rto=3.0)
+    rtt.observe(1, 0.01)
+    assert rtt.timeout(1) == 0.5
+    for expected in (1.0, 2.0, 3.0, 3.0):
+        rtt.backoff(1)
+        assert rtt.timeout(1) == expected
+    assert rtt.retry_deadline(2, 3) == 1.0 + 2.0 + 3.0
+
+
+def test_initial_rto_is_clamped_to_limits():
+    assert RttEstimator(initial_rto=0.1).timeout(1) == 0.5
+    assert RttEstimator(initial_rto=100.0, max_rto=10.0).timeout(1) == 10.0
+    with pytest.raises(ValueError):
+        RttEstimator(min_rto=2.0, max_rto=1.0)
+
+
+def test_fleet_passes_rto_limits(sim_fleet):
+    network = SimulatedNetwork.with_devices(1)
+    fleet = sim_fleet(network, initial_timeout=0.2)
+    assert fleet.rtt.timeout(1) == 0.5
+    fleet = sim_fleet(network, initial_timeout=0.2, min_rto=0.05, max_rto=1.0)
+    assert fleet.rtt.timeout(1) == 0.2
+    fleet.rtt.observe(1, 0.001)
+    assert fleet.rtt.timeout(1) == 0.05
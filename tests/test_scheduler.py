@@ -0,0 +1,55 @@
+import asyncio
+import logging
+
+from wmbc.scheduler import PollScheduler
+from wmbc.sim import SimulatedNetwork
+
+
+def _run(sim_fleet, network: SimulatedNetwork, duration: float, **job) -> tuple:
+    async def scenario():
+        fleet = sim_fleet(network)
+        scheduler = PollScheduler(fleet, phase_spread=0.0, seed=1)
+        added = scheduler.add_job(1, fleet.mbproto.create_diagnostics(), **job)
+        runner = asyncio.ensure_future(scheduler.run())
+        peak = 0
+        for _ in range(int(duration / 0.01)):
+            peak = max(peak, len(fleet.inflight))
+            await asyncio.sleep(0.01)
+        runner.cancel()
+        return added, peak
+
+    return asyncio.run(scenario())
+
+
+def test_polls_are_answered_every_period(sim_fleet):
+    answers = []
+    job, _ = _run(sim_fleet, SimulatedNetwork.with_devices(1, latency=0.01), 0.55, period=0.1,
+                  _callback=lambda msg, args: answers.append(msg))
+    assert job.polls >= 5 and job.timeouts == 0
+    assert len(answers) == job.polls or len(answers) == job.polls - 1
+
+
+def test_unanswered_poll_ends_within_period_and_polls_do_not_overlap(sim_fleet):
+    network = SimulatedNetwork.with_devices(1, latency=0.01, loss=0.999)
+    # Timeout longer than the period, all attempts have to be cut by the period
+    job, peak = _run(sim_fleet, network, 1.05, period=0.1, timeout=5.0)
+    assert peak == 1
+    # Every poll ends before the next one is due, none of them is skipped
+    assert job.missed == 0
+    assert 10 <= job.polls <= 11 and job.timeouts >= job.polls - 1
+
+
+def test_round_trip_longer_than_period_does_not_overlap_polls(sim_fleet):
+    job, peak = _run(sim_fleet, SimulatedNetwork.with_devices(1, latency=0.04), 0.5, period=0.05, timeout=0.5)
+    assert peak == 1
+    assert job.timeouts + job.missed > 0
+
+
+def test_failing_callback_does_not_stop_polling(caplog, sim_fleet):
+    def callback(msg, args):
+        raise RuntimeError("broken callback")
+
+    with caplog.at_level(logging.ERROR):
+        job, _ = _run(sim_fleet, SimulatedNetwork.with_devices(1, latency=0.01), 0.45, period=0.1, _callback=callback)
+    assert job.polls >= 4
+    assert "broken callback" in caplog.text
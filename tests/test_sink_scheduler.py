@@ -0,0 +1,110 @@
+import asyncio
+from time import monotonic
+
+from wmbc.retry import NO_RETRY, RetryPolicy
+from wmbc.sim import SimulatedNetwork
+from wmbc.sink_scheduler import SinkScheduler
+
+SINKS = ["sink0", "sink1"]
+# Short timeouts, a sink taken down stays down for the whole test
+FLEET_KWARGS = dict(initial_timeout=0.1, min_rto=0.05, max_rto=0.2, sink_cooldown=60.0)
+
+
+def test_select_balances_by_expected_wait():
+    scheduler = SinkScheduler(SINKS)
+    assert scheduler.select(SINKS) == "sink0"
+    scheduler.sent("sink0")
+    assert scheduler.select(SINKS) == "sink1"
+    scheduler.answered("sink0", 0.1)
+    scheduler.answered("sink1", 1.0)
+    for _ in range(5):
+        scheduler.started("sink0")
+    # 6 * 0.1 s is still shorter than 1 * 1.0 s
+    assert scheduler.select(SINKS) == "sink0"
+    assert scheduler.select(SINKS, exclude="sink0") == "sink1"
+
+
+def test_timeouts_of_one_device_do_not_take_sink_down():
+    scheduler = SinkScheduler(SINKS, failure_threshold=3)
+    for _ in range(10):
+        scheduler.started("sink0")
+        scheduler.timed_out("sink0", 99)
+    assert scheduler.state("sink0").healthy(monotonic())
+    assert scheduler.state("sink0").timeouts == 10
+
+
+def test_timeouts_of_distinct_devices_take_sink_down_until_answered():
+    scheduler = SinkScheduler(SINKS, failure_threshold=3)
+    for dst_addr in (1, 2, 1, 3):
+        scheduler.started("sink0")
+        scheduler.timed_out("sink0", dst_addr)
+    assert not scheduler.state("sink0").healthy(monotonic())
+    assert scheduler.select(SINKS) == "sink1"
+    scheduler.started("sink0")
+    scheduler.answered("sink0")
+    assert scheduler.state("sink0").healthy(monotonic())
+
+
+def test_answers_reset_timeouts_of_other_devices():
+    scheduler = SinkScheduler(SINKS, failure_threshold=3)
+    for dst_addr in range(10):
+        scheduler.timed_out("sink0", dst_addr)
+        scheduler.answered("sink0")
+    assert scheduler.state("sink0").healthy(monotonic())
+
+
+def test_send_errors_take_sink_down():
+    scheduler = SinkScheduler(SINKS, failure_threshold=2)
+    scheduler.send_failed("sink1")
+    assert scheduler.state("sink1").healthy(monotonic())
+    scheduler.send_failed("sink1")
+    assert not scheduler.state("sink1").healthy(monotonic())
+    assert scheduler.utilization()["sink1"]["healthy"] is False
+
+
+def test_single_sink_is_never_taken_down():
+    scheduler = SinkScheduler(["sink0"], failure_threshold=1)
+    for dst_addr in range(5):
+        scheduler.timed_out("sink0", dst_addr)
+        scheduler.send_failed("sink0")
+    assert scheduler.state("sink0").healthy(monotonic())
+
+
+def test_fleet_keeps_sinks_of_dead_device(sim_fleet):
+    network = SimulatedNetwork.with_devices(2, latency=0.005, sink_ids=SINKS)
+
+    async def scenario():
+        fleet = sim_fleet(network, **FLEET_KWARGS)
+        diag = fleet.mbproto.create_diagnostics()
+        for _ in range(4):
+            try:
+                await fleet.request(99, diag, timeout=0.05, retry_policy=RetryPolicy(3, backoff=1.0))
+            except asyncio.TimeoutError:
+                pass
+        return fleet.sink_scheduler.utilization()
+
+    utilization = asyncio.run(scenario())
+    assert all(state["healthy"] for state in utilization.values())
+    assert sum(state["timeouts"] for state in utilization.values()) == 12
+
+
+def test_fleet_fails_over_from_stopped_sink(sim_fleet):
+    network = SimulatedNetwork.with_devices(4, latency=0.005, sink_ids=SINKS)
+
+    async def scenario():
+        fleet = sim_fleet(network, **FLEET_KWARGS)
+        network.sink_manager.get_sinks()[1].write_config({"started": False})
+        diag = fleet.mbproto.create_diagnostics()
+        answered = 0
+        for _ in range(3):
+            results = await asyncio.gather(*(fleet.request(dst_addr, diag) for dst_addr in range(1, 5)),
+                                           return_exceptions=True)
+            answered += sum(1 for result in results if not isinstance(result, Exception))
+        before = fleet.sink_scheduler.state("sink1").sent
+        await fleet.request(1, diag, retry_policy=NO_RETRY)
+        return answered, fleet.sink_scheduler, before
+
+    answered, scheduler, before = asyncio.run(scenario())
+    assert answered == 12
+    assert not scheduler.state("sink1").healthy(monotonic())
+    assert scheduler.state("sink1").sent == before
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.retry import NO_RETRY
+from wmbc.scheduler import PollScheduler
+from wmbc.sim import PeriodicConfiguration, SimResponse, SimulatedNetwork
+from wmbc.slot_planner import PeriodicRead, SlotPlanner
+
+READ = bytes.fromhex("0103000000044409")
+
+
+def test_plan_assigns_free_slots_and_falls_back():
+    planner = SlotPlanner(fleet=None, max_slots=2)
+    reads = [PeriodicRead(1, 60, READ), PeriodicRead(2, 10, READ), PeriodicRead(1, 10, READ)]
+    plan = planner.plan(21, reads, [0] * 64)
+    assert plan.push == [1, 2]
+    assert [plan.slots[idx].interval for idx in plan.push] == [10, 60]
+    assert plan.fallback == [PeriodicRead(2, 10, READ)]
+    assert plan.disable == []
+
+
+def test_apply_configures_device_and_keeps_unchanged_slots(sim_fleet):
+    network = SimulatedNetwork.with_devices(1, latency=0.005)
+    reads = [PeriodicRead(1, 60, READ), PeriodicRead(1, 30, READ)]
+
+    async def scenario():
+        planner = SlotPlanner(sim_fleet(network))
+        first = await planner.apply(1, reads, timeout=0.5)
+        second = await planner.apply(1, reads[:1], timeout=0.5)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert len(first.push) == 2
+    assert second.push == [] and len(second.disable) == 1
+    configurations = network.device(1).configurations
+    assert [(cfg.port, cfg.interval) for cfg in configurations.values()] == [(1, 60)]
+
+
+def test_periodical_report_does_not_complete_configuration_request(sim_fleet):
+    network = SimulatedNetwork.with_devices(1, latency=0.005)
+    device = network.device(1)
+    device.configurations[1] = PeriodicConfiguration(1, 60, READ)
+    report = device.periodic_answer(1)
+    mbproto = MBProto()
+    mbproto.target_port = 1
+    configure = mbproto.create_modbus_periodic(1, 60, READ)
+
+    async def scenario():
+        fleet = sim_fleet(network)
+        # The configuration command is lost, only a report of the same slot arrives
+        network.loss = 0.999
+        request = asyncio.ensure_future(fleet.request(1, configure, timeout=0.1, retry_policy=NO_RETRY))
+        await asyncio.sleep(0)
+        assert fleet.dispatch(SimResponse(0, 1, 66, 77, 10, 0, 1, report)) is not None
+        with pytest.raises(asyncio.TimeoutError):
+            await request
+
+    asyncio.run(scenario())
+
+
+def test_failed_configuration_falls_back_to_polling(sim_fleet):
+    network = SimulatedNetwork.with_devices(2, latency=0.005)
+    device = network.device(2)
+    handle = device.handle
+    # The second device rejects every periodical configuration
+    device.handle = lambda frame: ([device._ack(mb_protocol.Cmd.CMD_MODBUS_PERIODICAL, False)]
+                                   if MBProto.peek_cmd(frame) == mb_protocol.Cmd.CMD_MODBUS_PERIODICAL
+                                   else handle(frame))
+    reads = [PeriodicRead(1, 60, READ)]
+
+    async def scenario():
+        fleet = sim_fleet(network)
+        scheduler = PollScheduler(fleet)
+        planner = SlotPlanner(fleet, scheduler=scheduler)
+        plans = [await planner.apply(address, reads, timeout=0.5) for address in (1, 2)]
+        return plans, scheduler.jobs, planner
+
+    (configured, failed), jobs, planner = asyncio.run(scenario())
+    assert list(configured.slots.values()) == reads and configured.fallback == []
+    assert failed.slots == {} and failed.fallback == reads
+    assert [job.dst_addr for job in jobs] == [2] and jobs[0].period == 60
+    assert planner.pushed(2) == {} and network.device(2).configurations == {}
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from wmbc.sim import SimulatedNetwork
+from wmbc.stream import OVERFLOW_BLOCK, OVERFLOW_DROP, OVERFLOW_DROP_OLDEST, ResponseStream
+
+
+async def _drain(stream: ResponseStream) -> list:
+    items = []
+    while stream.qsize():
+        items.append(await stream.__anext__())
+    return items
+
+
+@pytest.mark.parametrize("overflow, expected", [(OVERFLOW_DROP, [0, 1]), (OVERFLOW_DROP_OLDEST, [2, 3])])
+def test_drop_policies(overflow, expected):
+    async def run():
+        stream = ResponseStream(2, overflow)
+        for item in range(4):
+            await stream.put(item)
+        return stream, await _drain(stream)
+
+    stream, items = asyncio.run(run())
+    assert items == expected and stream.dropped == 2
+
+
+def test_block_waits_for_consumer():
+    async def run():
+        stream = ResponseStream(1, OVERFLOW_BLOCK)
+        await stream.put(0)
+        producer = asyncio.ensure_future(stream.put(1))
+        await asyncio.sleep(0.01)
+        assert not producer.done()
+        assert await stream.__anext__() == 0
+        await producer
+        return stream, await _drain(stream)
+
+    stream, items = asyncio.run(run())
+    assert items == [1] and stream.dropped == 0
+
+
+@pytest.mark.parametrize("maxsize, overflow", [(0, OVERFLOW_BLOCK), (1, "unknown")])
+def test_invalid_arguments(maxsize, overflow):
+    with pytest.raises(ValueError):
+        ResponseStream(maxsize, overflow)
+
+
+def test_fleet_streams_unsolicited_messages(sim_fleet):
+    network = SimulatedNetwork.with_devices(2, latency=0.005)
+
+    async def run():
+        fleet = sim_fleet(network)
+        sink = network.sink_manager.get_sinks()[0]
+        received = []
+
+        async def consume():
+            async for response, msg in fleet.responses():
+                received.append(response.src)
+                if len(received) == 2:
+                    return
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.01)
+        # Answer of a request is delivered to its caller, not to the stream
+        await fleet.request(1, fleet.mbproto.create_diagnostics(), timeout=1.0)
+        for address in (2, 1):
+            device = network.device(address)
+            network.uplink(sink, device, device.handle(fleet.mbproto.create_diagnostics())[0])
+        await asyncio.wait_for(consumer, 1.0)
+        return received
+
+    assert asyncio.run(run()) == [2, 1]
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from wmbc.mb_proto.mb_protocol_iface import MBProto  # noqa: E402
+from wmbc.modbus_planner import build_read_request  # noqa: E402
+from wmbc.sim import WMBDeviceEmulator  # noqa: E402
+from wmbc.telemetry_store import TelemetryStore  # noqa: E402
+
+CMD = 6
+
+
+def test_append_and_query(tmp_path):
+    store = TelemetryStore(str(tmp_path), max_registers=4, chunk_records=2)
+    for i in range(5):
+        store.append(21, CMD, [i, i + 1, i + 2, i + 3, 99], timestamp=100.0 + i)
+    store.append(22, CMD, [7], timestamp=101.5)
+    assert store.devices == [21, 22]
+    last = store.last(21, 2)
+    assert list(last["timestamp"]) == [103.0, 104.0]
+    assert last["registers"][1].tolist() == [4, 5, 6, 7]
+    assert int(last["register_count"][1]) == 4
+    assert list(store.range(21, 101.0, 103.0)["timestamp"]) == [101.0, 102.0]
+    assert sorted(store.site_range(101.0, 102.0)) == [21, 22]
+    assert len(store.last(23, 10)) == 0
+
+
+def test_reopen_keeps_records(tmp_path):
+    store = TelemetryStore(str(tmp_path), max_registers=2)
+    store.append(5, CMD, [1, 2], timestamp=1.0)
+    store.flush()
+    reopened = TelemetryStore(str(tmp_path), max_registers=2)
+    assert reopened.last(5, 1)["registers"].tolist() == [[1, 2]]
+    with pytest.raises(ValueError):
+        TelemetryStore(str(tmp_path), max_registers=3)
+
+
+def test_clock_step_back_is_clamped(tmp_path):
+    store = TelemetryStore(str(tmp_path), max_registers=1)
+    store.append(5, CMD, [1], timestamp=1000.0)
+    # NTP step backwards must not stop ingestion
+    store.append(5, CMD, [2], timestamp=990.0)
+    store.append(5, CMD, [3], timestamp=1001.0)
+    records = store.last(5, 3)
+    assert list(records["timestamp"]) == [1000.0, 1000.0, 1001.0]
+    assert records["registers"][:, 0].tolist() == [1, 2, 3]
+    assert len(store.range(5, 1000.0, 1000.5)) == 2
+
+
+def test_coil_read_is_truncated_to_requested_count(tmp_path):
+    mbproto = MBProto()
+    mbproto.target_port = 1
+    device = WMBDeviceEmulator(21)
+    device.slaves[1][0].coils.update({0: True, 2: True})
+    answer = device.handle(mbproto.create_modbus_oneshot(build_read_request(1, 1, 0, 3)))[0]
+    ret, err, msg = mbproto.decode_response(answer)
+    assert ret
+    store = TelemetryStore(str(tmp_path), max_registers=16)
+    assert store.append_response(SimpleNamespace(src=21), msg, timestamp=1.0, count=3)
+    record = store.last(21, 1)
+    assert int(record["register_count"][0]) == 3 and int(record["function_code"][0]) == 1
+    assert record["registers"][0, :3].tolist() == [1, 0, 1] and not record["registers"][0, 3:].any()
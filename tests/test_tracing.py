@@ -0,0 +1,75 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from wmbc.tracing import _NOOP, Tracer
+
+
+def test_disabled_tracer_returns_shared_noop_span():
+    tracer = Tracer()
+    assert tracer.span("encode") is _NOOP
+    with tracer.span("encode"):
+        pass
+    tracer.record("mesh", 0.5)
+    assert tracer.breakdown() == {} and tracer.recent() == []
+
+
+def test_every_nth_span_is_sampled():
+    tracer = Tracer()
+    tracer.enable(sample_every=3)
+    spans = [tracer.span("decode") for _ in range(9)]
+    assert [span is not _NOOP for span in spans] == [False, False, True] * 3
+    for span in spans:
+        with span:
+            pass
+    # Stages are counted independently
+    assert tracer.span("encode") is _NOOP
+    assert tracer.breakdown()["decode"]["count"] == 3
+    with pytest.raises(ValueError):
+        tracer.enable(sample_every=0)
+
+
+def test_breakdown_aggregates_and_resets():
+    tracer = Tracer(history=2)
+    tracer.enable()
+    for duration in (0.001, 0.003, 0.002):
+        tracer.record("mesh", duration)
+    with tracer.span("decode"):
+        pass
+    breakdown = tracer.breakdown()
+    assert set(breakdown) == {"mesh", "decode"}
+    mesh = breakdown["mesh"]
+    assert mesh["count"] == 3 and mesh["total_s"] == pytest.approx(0.006)
+    assert mesh["mean_us"] == pytest.approx(2000) and mesh["max_us"] == pytest.approx(3000)
+    # Percentiles come from the history of the two most recent spans
+    assert mesh["p50_us"] == pytest.approx(3000) and mesh["p99_us"] == pytest.approx(3000)
+    assert [stage for stage, _, _ in tracer.recent()] == ["mesh", "decode"]
+    assert tracer.breakdown(reset=True) == breakdown
+    assert tracer.breakdown() == {} and tracer.recent() == []
+
+
+def test_run_sampler_writes_breakdowns(tmp_path):
+    tracer = Tracer()
+    output = str(tmp_path / "trace.ndjson")
+    profile_dir = str(tmp_path / "profiles")
+
+    async def scenario():
+        sampler = asyncio.ensure_future(tracer.run_sampler(0.05, output, profile_dir))
+        await asyncio.sleep(0)
+        assert tracer.enabled
+        for _ in range(4):
+            with tracer.span("request"):
+                await asyncio.sleep(0.03)
+        sampler.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await sampler
+
+    asyncio.run(scenario())
+    assert not tracer.enabled
+    with open(output) as f:
+        lines = [json.loads(line) for line in f]
+    assert len(lines) >= 2 and all(line["interval_s"] == 0.05 for line in lines)
+    assert sum(line["stages"].get("request", {}).get("count", 0) for line in lines) >= 3
+    assert len(os.listdir(profile_dir)) >= len(lines)
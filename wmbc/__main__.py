@@ -1,10 +1,10 @@
 import argparse
-import asyncio
-from wmbc.wmbc import WMBController
+import logging
 
-async def main():
+
+def parse_args() -> argparse.Namespace:
     """
-        Main for WMB Controller
+        Command line of WMB Controller, parsed before importing the controller so --help stays fast
     """
 
     parser = argparse.ArgumentParser(description='WMB Controller - sends out MB Protocol requests over Wirepas \
@@ -68,12 +68,283 @@ async def main():
             type=int,
             help='Interval for periodic modbus frame'
     )
-    args = parser.parse_args()
+    parser.add_argument(
+            '--metrics-port',
+            required=False,
+            type=int,
+            help='Serve Prometheus metrics on http://127.0.0.1:<port>/metrics'
+    )
+    parser.add_argument(
+            '--trace-interval',
+            required=False,
+            type=float,
+            help='Enable timing spans and dump per-stage breakdown every <seconds>'
+    )
+    parser.add_argument(
+            '--trace-output',
+            required=False,
+            type=str,
+            help='File the timing breakdowns are appended to as JSON lines, logged if not provided'
+    )
+    parser.add_argument(
+            '--trace-sample',
+            required=False,
+            type=int,
+            default=1,
+            help='Time every n-th span of each stage'
+    )
+    parser.add_argument(
+            '--profile-dir',
+            required=False,
+            type=str,
+            help='Capture cProfile stats of every trace interval into this directory'
+    )
+    subparsers = parser.add_subparsers(dest='mode', title='modes')
+    encode_parser = subparsers.add_parser(
+            'encode',
+            help='Encode NDJSON commands, e.g. {"cmd": "port_cfg", "target_port": 1, "port_cfg": [9600, 0, 1]}'
+    )
+    encode_parser.add_argument(
+            'inputs',
+            nargs='*',
+            default=['-'],
+            help='NDJSON files with one command per line, stdin if not provided'
+    )
+    encode_parser.add_argument(
+            '--format',
+            choices=['ndjson', 'hex'],
+            default='ndjson',
+            help='Output NDJSON records or only hex frames, one per line'
+    )
+    decode_parser = subparsers.add_parser(
+            'decode',
+            help='Decode frames into NDJSON records'
+    )
+    decode_parser.add_argument(
+            'inputs',
+            nargs='*',
+            default=['-'],
+            help='Files with frames, stdin if not provided'
+    )
+    decode_parser.add_argument(
+            '--input-format',
+            choices=['hex', 'binary', 'capture'],
+            default='hex',
+            help='hex - one frame per line, binary - one frame per file, capture - SnifferCapture file'
+    )
+    decode_parser.add_argument(
+            '--decode-modbus',
+            action='store_true',
+            help='Decode Modbus frames of Modbus responses'
+    )
+    manifest_parser = subparsers.add_parser(
+            'manifest',
+            help='Execute commands of a CSV, YAML or JSON manifest over a single sink connection and exit'
+    )
+    manifest_parser.add_argument(
+            'manifest',
+            help='Manifest file with device, cmd and parameters of every command'
+    )
+    manifest_parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=16,
+            help='Maximum number of commands in flight, commands of one device are sent one at a time'
+    )
+    manifest_parser.add_argument(
+            '--timeout',
+            type=float,
+            help='Time to wait for an answer of every attempt, derived from RTT estimates if not provided'
+    )
+    manifest_parser.add_argument(
+            '--sink-ids',
+            nargs='+',
+            help='Sinks used to send the commands'
+    )
+    manifest_parser.add_argument(
+            '--output',
+            type=str,
+            help='File the result of every command is written to as NDJSON, stdout if not provided'
+    )
+    daemon_parser = subparsers.add_parser(
+            'daemon',
+            help='Keep the sinks initialized and serve commands of local clients over a Unix socket'
+    )
+    daemon_parser.add_argument(
+            '--socket',
+            type=str,
+            help='Path of the Unix socket, $XDG_RUNTIME_DIR/wmbc.sock if not provided'
+    )
+    daemon_parser.add_argument(
+            '--sink-ids',
+            nargs='+',
+            help='Sinks used to send the commands'
+    )
+    client_parser = subparsers.add_parser(
+            'client',
+            help='Send NDJSON commands, e.g. {"device": 21, "cmd": "diag"}, over a running daemon'
+    )
+    client_parser.add_argument(
+            'inputs',
+            nargs='*',
+            help='NDJSON files with one command per line, stdin if not provided and not subscribing'
+    )
+    client_parser.add_argument(
+            '--socket',
+            type=str,
+            help='Path of the Unix socket of the daemon'
+    )
+    client_parser.add_argument(
+            '--timeout',
+            type=float,
+            help='Time to wait for an answer of every attempt, derived from RTT estimates if not provided'
+    )
+    client_parser.add_argument(
+            '--subscribe',
+            nargs='*',
+            type=int,
+            help='After the commands, stream messages of the given devices (all if none given) until interrupted'
+    )
+    return parser.parse_args()
+
+
+def run_offline(args: argparse.Namespace) -> int:
+    """
+        Encodes or decodes frames without a sink, returns exit code
+    """
+    import sys
+    from wmbc import offline
+    from wmbc.mb_proto.mb_protocol_iface import MBProto
+
+    mbproto = MBProto()
+    if args.mode == 'encode':
+        records = offline.encode_commands(mbproto, offline.read_lines(args.inputs))
+        failed = offline.write_records(records, sys.stdout, args.format)
+    else:
+        frames = offline.read_frames(args.inputs, args.input_format)
+        failed = offline.write_records(offline.decode_frames(mbproto, frames, args.decode_modbus), sys.stdout)
+    return 1 if failed else 0
+
+
+async def main(args: argparse.Namespace):
+    """
+        Main for WMB Controller
+    """
+    import asyncio
+    from wmbc.metrics import REGISTRY
+    from wmbc.tracing import TRACER
+    from wmbc.wmbc import WMBController
+
     args_dict = vars(args)
+    args_dict.pop("mode")
+    metrics_port = args_dict.pop("metrics_port")
+    if metrics_port is not None:
+        REGISTRY.serve(metrics_port)
+    trace_args = {name: args_dict.pop(name) for name in ("trace_interval", "trace_output", "trace_sample", "profile_dir")}
 
     WMBC = WMBController(**args_dict)
     WMBC.initialize_sink()
-    await WMBC.run()
+    if trace_args["trace_interval"] is None:
+        await WMBC.run()
+        return
+    sampler = asyncio.ensure_future(TRACER.run_sampler(trace_args["trace_interval"], trace_args["trace_output"],
+                                                       trace_args["profile_dir"], trace_args["trace_sample"]))
+    try:
+        await WMBC.run()
+    finally:
+        sampler.cancel()
+
+
+async def run_manifest(args: argparse.Namespace) -> int:
+    """
+        Executes a manifest over a shared sink connection, returns exit code
+    """
+    import json
+    import sys
+    from wmbc.fleet import WMBFleetController
+    from wmbc.manifest import ManifestRunner, load_manifest, summarize
+
+    entries = load_manifest(args.manifest)
+    fleet = WMBFleetController(sink_ids=args.sink_ids)
+    fleet.initialize_sink()
+    try:
+        results = await ManifestRunner(fleet, args.concurrency, args.timeout).run(entries)
+    finally:
+        fleet.deinitialize_sink()
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in results:
+            out.write(json.dumps(result.to_dict()) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    summary = summarize(results)
+    logging.info(f"Manifest summary: {summary['statuses']}")
+    if summary["failed_devices"]:
+        logging.error(f"Failed devices: {summary['failed_devices']}")
+        return 1
+    return 0
+
+
+async def run_daemon(args: argparse.Namespace) -> None:
+    """
+        Serves a fleet controller to local clients until interrupted
+    """
+    from wmbc import daemon
+    from wmbc.client import DEFAULT_SOCKET
+    from wmbc.fleet import WMBFleetController
+    from wmbc.metrics import REGISTRY
+
+    if args.metrics_port is not None:
+        REGISTRY.serve(args.metrics_port)
+    fleet = WMBFleetController(sink_ids=args.sink_ids)
+    fleet.initialize_sink()
+    try:
+        await daemon.run_daemon(fleet, args.socket or DEFAULT_SOCKET)
+    finally:
+        fleet.deinitialize_sink()
+
+
+def run_client(args: argparse.Namespace) -> int:
+    """
+        Executes commands over a running daemon, returns exit code
+    """
+    import asyncio
+    from wmbc import client
+
+    inputs = args.inputs or ([] if args.subscribe is not None else ['-'])
+    try:
+        commands = list(client.read_commands(inputs))
+    except ValueError as e:
+        logging.error(f"Invalid command: {e}")
+        return 2
+    try:
+        return asyncio.run(client.run_client(args.socket or client.DEFAULT_SOCKET, commands,
+                                             args.subscribe, args.timeout))
+    except (ConnectionError, FileNotFoundError) as e:
+        logging.error(f"Daemon is not reachable: {e}")
+        return 2
+    except KeyboardInterrupt:
+        return 130
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    if args.mode in ('encode', 'decode'):
+        logging.basicConfig(level=logging.WARNING)
+        raise SystemExit(run_offline(args))
+    if args.mode == 'client':
+        # The client only talks to the daemon, the controller is not imported
+        logging.basicConfig(level=logging.WARNING)
+        raise SystemExit(run_client(args))
+    logging.basicConfig(level=logging.INFO)
+    from wmbc.wmbc import install_signal_handlers
+    install_signal_handlers()
+    import asyncio
+    if args.mode == 'manifest':
+        raise SystemExit(asyncio.run(run_manifest(args)))
+    elif args.mode == 'daemon':
+        asyncio.run(run_daemon(args))
+    else:
+        asyncio.run(main(args))
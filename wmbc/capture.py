@@ -0,0 +1,251 @@
+"""Capture of sniffed Modbus traffic into an append-only capture file"""
+
+import asyncio
+import logging
+import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from time import time
+from typing import Iterator, List, Tuple
+
+import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
+from wmbc.mb_proto import crc16
+
+CAPTURE_MAGIC = b"WMBCAP"
+CAPTURE_VERSION = 1
+_FILE_HEADER = struct.Struct("<6sBx")
+# timestamp, source address, Modbus port, flags, data length
+_RECORD_HEADER = struct.Struct("<dIBBH")
+
+# Record data is the raw MB Protocol payload which could not be decoded into a Modbus frame
+FLAG_RAW = 0x01
+# Raw payload failed MB Protocol CRC verification
+FLAG_CRC_ERROR = 0x02
+
+# Wirepas payloads are far below this, longer payloads are not captured
+DEFAULT_SLOT_SIZE = 512
+
+
+class CaptureRing():
+    """
+    Preallocated ring buffer of received payloads
+
+    Payloads are copied into fixed size slots of a single bytearray, source addresses,
+    timestamps and lengths live in parallel arrays, so buffering a payload allocates nothing.
+    When the ring is full new payloads are dropped and counted.
+    """
+
+    def __init__(self, capacity: int = 65536, slot_size: int = DEFAULT_SLOT_SIZE):
+        if capacity < 1 or slot_size < 1:
+            raise ValueError("Capacity and slot size must be positive")
+        self._capacity = capacity
+        self._slot_size = slot_size
+        self._data = bytearray(capacity * slot_size)
+        self._view = memoryview(self._data)
+        self._src = array("L", bytes(array("L").itemsize * capacity))
+        self._timestamp = array("d", bytes(array("d").itemsize * capacity))
+        self._length = array("H", bytes(array("H").itemsize * capacity))
+        self._head = 0
+        self._count = 0
+        self.dropped = 0
+        self.oversized = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def put(self, src: int, timestamp: float, payload: bytes) -> bool:
+        """Buffers a payload, returns False if it was dropped"""
+        length = len(payload)
+        if length > self._slot_size:
+            self.oversized += 1
+            return False
+        if self._count == self._capacity:
+            self.dropped += 1
+            return False
+        slot = (self._head + self._count) % self._capacity
+        offset = slot * self._slot_size
+        self._view[offset:offset + length] = payload
+        self._src[slot] = src
+        self._timestamp[slot] = timestamp
+        self._length[slot] = length
+        self._count += 1
+        return True
+
+    def take(self, max_count: int) -> Tuple[List[int], List[float], List[bytes]]:
+        """Removes up to max_count oldest payloads, returns their sources, timestamps and copies of payloads"""
+        count = min(max_count, self._count)
+        srcs, timestamps, payloads = [], [], []
+        slot = self._head
+        for _ in range(count):
+            offset = slot * self._slot_size
+            srcs.append(self._src[slot])
+            timestamps.append(self._timestamp[slot])
+            payloads.append(bytes(self._view[offset:offset + self._length[slot]]))
+            slot += 1
+            if slot == self._capacity:
+                slot = 0
+        self._head = slot
+        self._count -= count
+        return srcs, timestamps, payloads
+
+
+@dataclass(slots=True)
+class CaptureRecord:
+    timestamp: float
+    src: int
+    port: int
+    flags: int
+    data: bytes
+
+    @property
+    def is_raw(self) -> bool:
+        return bool(self.flags & FLAG_RAW)
+
+
+def encode_batch(srcs: List[int], timestamps: List[float], payloads: List[bytes]) -> Tuple[bytes, int]:
+    """
+    Decodes a batch of MB Protocol payloads into capture records
+
+    Modbus frames of Modbus response answers are stored with their port, anything else is
+    stored as raw payload, so nothing received is lost.
+
+    Returns:
+        Encoded records and number of raw records
+    """
+    out = bytearray()
+    raw = 0
+    crc_ok = crc16.verify_many(payloads)
+    message = mb_protocol.MbMessage()
+    pack = _RECORD_HEADER.pack
+    for src, timestamp, payload, ok in zip(srcs, timestamps, payloads, crc_ok):
+        port = 0
+        flags = FLAG_RAW
+        data = payload
+        if not ok:
+            flags |= FLAG_CRC_ERROR
+        else:
+            try:
+                message.ParseFromString(payload[:-2])
+                answer_frame = message.payload.payload_answer_frame
+                if answer_frame.WhichOneof('answer_frame') == 'modbus_response_frame':
+                    port = answer_frame.modbus_response_frame.modbus_port
+                    data = answer_frame.modbus_response_frame.modbus_frame
+                    flags = 0
+            except Exception:
+                pass
+        if flags:
+            raw += 1
+        out += pack(timestamp, src, port, flags, len(data))
+        out += data
+    return bytes(out), raw
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """Reads records of a capture file, a truncated last record is ignored"""
+    with open(path, "rb") as f:
+        header = f.read(_FILE_HEADER.size)
+        if len(header) < _FILE_HEADER.size:
+            return
+        magic, version = _FILE_HEADER.unpack(header)
+        if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+            raise ValueError(f"{path} is not a supported capture file")
+        while True:
+            record_header = f.read(_RECORD_HEADER.size)
+            if len(record_header) < _RECORD_HEADER.size:
+                return
+            timestamp, src, port, flags, length = _RECORD_HEADER.unpack(record_header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield CaptureRecord(timestamp, src, port, flags, data)
+
+
+class SnifferCapture():
+    """
+    Captures traffic of bridges in sniffer mode (MBProto.device_mode = 1) into a capture file
+
+    The receive loop only copies raw payloads into a CaptureRing. A separate consumer takes
+    them in batches of up to batch_size (or whatever arrived within flush_interval seconds),
+    decodes them and appends them to the file in a single writer thread, so decoding and disk
+    writes never hold up receiving. Buffered payloads are written out when the capture stops.
+    The controller (WMBController or WMBFleetController) must not receive anything else while
+    the capture runs.
+    """
+
+    def __init__(self, controller, path: str, capacity: int = 65536, batch_size: int = 512,
+                 flush_interval: float = 0.5, slot_size: int = DEFAULT_SLOT_SIZE):
+        if batch_size < 1 or batch_size > capacity:
+            raise ValueError("Batch size must be between 1 and ring capacity")
+        self._controller = controller
+        self._path = path
+        self._ring = CaptureRing(capacity, slot_size)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._ready = asyncio.Event()
+        self.captured = 0
+        self.raw = 0
+
+    @property
+    def ring(self) -> CaptureRing:
+        return self._ring
+
+    def stats(self) -> dict:
+        return {
+            "captured": self.captured,
+            "raw": self.raw,
+            "buffered": len(self._ring),
+            "dropped": self._ring.dropped,
+            "oversized": self._ring.oversized
+        }
+
+    async def _drain(self):
+        ring = self._ring
+        while True:
+            response = await self._controller.async_receive()
+            ring.put(response.src, time(), response.payload)
+            if len(ring) >= self._batch_size:
+                self._ready.set()
+                # Let the consumer take the batch even if receive never blocks
+                await asyncio.sleep(0)
+
+    def _write(self, f, srcs, timestamps, payloads):
+        # Runs in the writer thread only
+        records, raw = encode_batch(srcs, timestamps, payloads)
+        f.write(records)
+        f.flush()
+        self.captured += len(payloads)
+        self.raw += raw
+
+    async def _consume(self, f, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._ready.clear()
+            while len(self._ring):
+                batch = self._ring.take(self._batch_size)
+                await loop.run_in_executor(executor, self._write, f, *batch)
+
+    async def run(self):
+        logging.info(f"Capturing sniffed traffic to {self._path}, press Ctrl+C to exit")
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wmbc-capture")
+        with open(self._path, "ab") as f:
+            if f.tell() == 0:
+                f.write(_FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION))
+            drain = asyncio.ensure_future(self._drain())
+            try:
+                await asyncio.gather(drain, self._consume(f, executor))
+            finally:
+                drain.cancel()
+                # Queued after a batch possibly still being written
+                while len(self._ring):
+                    executor.submit(self._write, f, *self._ring.take(self._batch_size))
+                executor.shutdown(wait=True)
+                logging.info(f"Capture finished: {self.stats()}")
@@ -0,0 +1,165 @@
+"""
+Client of the WMB controller daemon (see wmbc.daemon)
+
+The daemon keeps the sink connection and the correlation table, so a short-lived tool pays
+only for a Unix socket round trip instead of the sink initialization. This module imports
+nothing but the standard library to keep the start-up of such tools short.
+
+Protocol: newline delimited JSON objects. Requests are {"id": <id>, "method": <name>,
+"params": {...}}, replies are {"id": <id>, "result": ...} or {"id": <id>, "error": <message>}
+and messages of subscriptions are pushed as {"event": "message", "device": <addr>, ...}.
+"""
+
+import asyncio
+import json
+import os
+import sys
+from typing import AsyncIterator, Iterable, Optional
+
+DEFAULT_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or "/tmp", "wmbc.sock")
+
+# Longest accepted line, Modbus payloads are short but decoded answers may be verbose
+LINE_LIMIT = 1024 * 1024
+
+
+class WMBClient():
+    """
+    Connection to a running daemon
+
+    Usage:
+        async with WMBClient() as client:
+            result = await client.request(21, cmd="diag")
+
+    Requests can be issued concurrently, replies are matched by their id.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        self._path = path
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+        self._pending = dict()
+        self._events = asyncio.Queue()
+        self._next_id = 0
+
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_unix_connection(self._path, limit=LINE_LIMIT)
+        self._receiver = asyncio.ensure_future(self._receive_loop())
+
+    async def close(self) -> None:
+        if self._writer is None:
+            return
+        self._receiver.cancel()
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        self._writer = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _receive_loop(self) -> None:
+        try:
+            while line := await self._reader.readline():
+                message = json.loads(line)
+                if "event" in message:
+                    self._events.put_nowait(message)
+                    continue
+                future = self._pending.pop(message.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(ValueError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to the daemon closed"))
+            self._pending.clear()
+            self._events.put_nowait(None)
+
+    async def call(self, method: str, **params):
+        """Calls a daemon method, raises ValueError with the message of an error reply"""
+        if self._writer is None:
+            raise ConnectionError("Not connected to the daemon")
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        self._writer.write((json.dumps({"id": self._next_id, "method": method, "params": params}) + "\n").encode())
+        await self._writer.drain()
+        return await future
+
+    async def request(self, device: int, cmd: Optional[str] = None, frame: Optional[str] = None,
+                      timeout: Optional[float] = None, **params) -> dict:
+        """
+        Sends a command and waits for its answer
+
+        The command is either cmd with the parameters of build_command (modbus_frame as hex) or
+        an encoded hex frame. Returns the result with status ack, nack, answered or timeout.
+        """
+        return await self.call("request", device=device, cmd=cmd, frame=frame, timeout=timeout, **params)
+
+    async def send(self, device: int, cmd: Optional[str] = None, frame: Optional[str] = None, **params) -> dict:
+        """Sends a command without waiting for its answer"""
+        return await self.call("send", device=device, cmd=cmd, frame=frame, **params)
+
+    async def stats(self) -> dict:
+        return await self.call("stats")
+
+    async def subscribe(self, devices: Optional[Iterable[int]] = None) -> AsyncIterator[dict]:
+        """Yields messages not consumed by requests of any client, of the given devices or all of them"""
+        await self.call("subscribe", devices=list(devices) if devices else None)
+        while (event := await self._events.get()) is not None:
+            yield event
+
+
+async def run_client(path: str, commands: Iterable[dict], subscribe: Optional[list] = None,
+                     timeout: Optional[float] = None, out=sys.stdout) -> int:
+    """
+    Executes commands one at a time and writes their results as NDJSON, returns exit code
+
+    Every command is an object with device and the keys of WMBClient.request. With subscribe
+    (a list of devices, empty for all) messages are streamed after the commands until interrupted.
+    """
+    failed = 0
+    async with WMBClient(path) as client:
+        for command in commands:
+            params = dict(command)
+            try:
+                device = params.pop("device", params.pop("dst_addr", None))
+                if device is None:
+                    raise ValueError("Command without device")
+                params.setdefault("timeout", timeout)
+                result = await client.request(device, **params)
+            except ValueError as e:
+                result = {"device": command.get("device"), "status": "error", "error": str(e)}
+            if result["status"] not in ("ack", "answered"):
+                failed += 1
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+        if subscribe is not None:
+            async for event in client.subscribe(subscribe):
+                out.write(json.dumps(event) + "\n")
+                out.flush()
+    return 1 if failed else 0
+
+
+def read_commands(paths: Iterable[str]):
+    """Yields NDJSON command objects of the files, '-' reads stdin and # comments are skipped"""
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path)
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield json.loads(line)
+        finally:
+            if f is not sys.stdin:
+                f.close()
@@ -0,0 +1,65 @@
+"""Encoding of commands described by the command line parameters of WMB Controller"""
+
+from typing import Optional, Sequence, Union
+
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+
+COMMAND_TYPES = ('reset', 'diag', 'dev_mode', 'ant_cfg', 'port_cfg', 'modbus_1s', 'modbus_p')
+
+
+def _modbus_payload(modbus_file: Optional[str], modbus_frame: Union[bytes, str, None]) -> bytes:
+    if (modbus_file is not None and modbus_frame is not None):
+        raise ValueError("Both file and frame defined as payload")
+    if isinstance(modbus_frame, str):
+        return bytes.fromhex(modbus_frame)
+    if isinstance(modbus_frame, (bytes, bytearray)):
+        return bytes(modbus_frame)
+    if modbus_frame is not None:
+        raise ValueError("Modbus frame has to be bytes or a hex string")
+    if modbus_file is None:
+        raise ValueError("No Modbus Payload!")
+    try:
+        with open(modbus_file, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"File {modbus_file} does not exist!")
+
+
+def build_command(mbproto: MBProto, cmd: str, dev_mode: Optional[int] = None, ant_cfg: Optional[int] = None,
+                  target_port: Optional[int] = None, port_cfg: Optional[Sequence] = None,
+                  modbus_file: Optional[str] = None, modbus_frame: Union[bytes, str, None] = None,
+                  modbus_interval: Optional[int] = None, modbus_cfg_idx: Optional[int] = None) -> bytes:
+    """
+    Encodes command of the given type, parameters have the meaning of the command line options
+
+    Settings of mbproto (device mode, port etc.) are updated with the parameters the command uses.
+    The Modbus payload of modbus_1s and modbus_p is either modbus_frame (bytes or a hex string) or the
+    content of modbus_file.
+    """
+    if cmd == "reset":
+        return mbproto.create_device_reset()
+    elif cmd == "diag":
+        return mbproto.create_diagnostics()
+    elif cmd == "dev_mode":
+        mbproto.device_mode = dev_mode
+        return mbproto.create_device_mode()
+    elif cmd == "ant_cfg":
+        mbproto.antenna_config = ant_cfg
+        return mbproto.create_antenna_config()
+    elif cmd == "port_cfg":
+        if port_cfg is None or len(port_cfg) != 3:
+            raise ValueError("Port config requires <baudrate> <parity> <stop_bits>")
+        mbproto.target_port = target_port
+        mbproto.baudrate_config = int(port_cfg[0])
+        mbproto.parity_bit = int(port_cfg[1])
+        mbproto.stop_bits = int(port_cfg[2])
+        return mbproto.create_port_config()
+    elif cmd == "modbus_1s":
+        payload = _modbus_payload(modbus_file, modbus_frame)
+        mbproto.target_port = target_port
+        return mbproto.create_modbus_oneshot(payload)
+    elif cmd == "modbus_p":
+        payload = _modbus_payload(modbus_file, modbus_frame)
+        mbproto.target_port = target_port
+        return mbproto.create_modbus_periodic(modbus_cfg_idx, modbus_interval, payload)
+    raise ValueError("Unsupported command type!")
@@ -0,0 +1,255 @@
+"""
+Long-running controller daemon sharing one fleet controller over a Unix socket
+
+The daemon initializes the sinks once and serves the protocol described in wmbc.client:
+- request: sends a command to a device and replies with its answer, params are device, timeout,
+  decode_modbus and either frame (hex) or cmd with the parameters of build_command
+- send: sends a command without waiting for the answer
+- subscribe / unsubscribe: pushes messages not consumed by requests, optionally of given devices only
+- stats: connections, in-flight requests, RTT estimates, sink utilization and the metrics snapshot
+
+All clients share the correlation table and RTT estimates of the fleet controller. Answers
+carry nothing but the command (and port or configuration index) to match them by, so requests
+of all clients with the same device and command are sent one at a time and every answer
+reaches the client whose command it answers.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from time import monotonic
+from typing import Optional
+
+from wmbc.client import DEFAULT_SOCKET, LINE_LIMIT
+from wmbc.manifest import STATUS_TIMEOUT, answer_status
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.metrics import REGISTRY
+from wmbc.offline import encode_command, json_default, message_record, parse_hex
+from wmbc.stream import ResponseStream, OVERFLOW_DROP_OLDEST
+
+# Request params which are not passed to build_command
+_REQUEST_KEYS = ('device', 'frame', 'timeout', 'decode_modbus')
+
+
+class _Connection():
+    """State of a connected client"""
+
+    __slots__ = ("writer", "devices", "events", "sender", "tasks")
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        # Subscribed devices, None if not subscribed and an empty set for all devices
+        self.devices = None
+        self.events = None
+        self.sender = None
+        self.tasks = set()
+
+    def wants(self, src: int) -> bool:
+        return self.devices is not None and (not self.devices or src in self.devices)
+
+    async def write(self, message: dict) -> None:
+        self.writer.write((json.dumps(message, default=json_default) + "\n").encode())
+        await self.writer.drain()
+
+
+class ControllerDaemon():
+    """
+    Serves a WMBFleetController to local clients
+
+    Args:
+        fleet: Fleet controller with initialized sinks
+        path: Path of the Unix socket, a stale socket file is replaced
+        event_queue: Messages queued for every subscriber, the oldest ones are dropped when a subscriber
+                     falls behind, so a slow client never delays the others
+    """
+
+    def __init__(self, fleet, path: str = DEFAULT_SOCKET, event_queue: int = 1024):
+        self._fleet = fleet
+        self._path = path
+        self._event_queue = event_queue
+        # Encoding updates settings of MBProto, the fleet's own instance is left untouched
+        self._mbproto = MBProto()
+        self._server = None
+        self._fanout = None
+        self._connections = set()
+        self._requests = 0
+        # Request serialization per (device, cmd, index)
+        self._locks = dict()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    async def _remove_stale_socket(self) -> None:
+        if not os.path.exists(self._path):
+            return
+        try:
+            _, writer = await asyncio.open_unix_connection(self._path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(self._path)
+            return
+        writer.close()
+        raise ValueError(f"Daemon is already running on {self._path}")
+
+    async def start(self) -> None:
+        await self._remove_stale_socket()
+        # Commands reach the devices with the permissions of the daemon, the socket is private
+        # from its creation on
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle_connection, self._path, limit=LINE_LIMIT)
+        finally:
+            os.umask(umask)
+        self._fanout = asyncio.ensure_future(self._fanout_loop())
+        logging.info(f"Controller daemon listening on {self._path}")
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        self._fanout.cancel()
+        for connection in list(self._connections):
+            for task in connection.tasks:
+                task.cancel()
+            connection.writer.close()
+        self._server = None
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+    async def _fanout_loop(self) -> None:
+        async for response, msg in self._fleet.responses(self._event_queue, OVERFLOW_DROP_OLDEST):
+            subscribers = [connection for connection in self._connections if connection.wants(response.src)]
+            if not subscribers:
+                continue
+            event = {"event": "message", "device": response.src, "travel_time": response.travel_time,
+                     **message_record(self._mbproto, msg)}
+            for connection in subscribers:
+                connection.events.put_nowait(event)
+
+    async def _send_events(self, connection: _Connection) -> None:
+        async for event in connection.events:
+            await connection.write(event)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = _Connection(writer)
+        self._connections.add(connection)
+        try:
+            while line := await reader.readline():
+                task = asyncio.ensure_future(self._handle_line(connection, line))
+                connection.tasks.add(task)
+                task.add_done_callback(connection.tasks.discard)
+        except (ValueError, ConnectionError) as e:
+            # ValueError is raised for lines over the limit
+            logging.warning(f"Closing daemon connection: {e}")
+        finally:
+            self._connections.discard(connection)
+            if connection.sender is not None:
+                connection.sender.cancel()
+            for task in connection.tasks:
+                task.cancel()
+            writer.close()
+
+    async def _handle_line(self, connection: _Connection, line: bytes) -> None:
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Request has to be a JSON object")
+            request_id = request.get("id")
+            result = await self._call(connection, request.get("method"), request.get("params") or {})
+            reply = {"id": request_id, "result": result}
+        except (ValueError, OSError) as e:
+            reply = {"id": request_id, "error": str(e)}
+        except Exception as e:
+            logging.exception("Daemon request failed")
+            reply = {"id": request_id, "error": f"{type(e).__name__}: {e}"}
+        try:
+            await connection.write(reply)
+        except ConnectionError:
+            pass
+
+    async def _call(self, connection: _Connection, method: str, params: dict):
+        self._requests += 1
+        if method == "request":
+            return await self._request(params)
+        elif method == "send":
+            device, frame = self._command(params)
+            self._fleet.send_command(device, frame)
+            return {"device": device, "frame": frame.hex()}
+        elif method == "subscribe":
+            devices = params.get("devices")
+            connection.devices = {int(device) & 0xFFFFFFFF for device in devices or ()}
+            if connection.sender is None:
+                connection.events = ResponseStream(self._event_queue, OVERFLOW_DROP_OLDEST)
+                connection.sender = asyncio.ensure_future(self._send_events(connection))
+            return {"devices": sorted(connection.devices)}
+        elif method == "unsubscribe":
+            connection.devices = None
+            return {}
+        elif method == "stats":
+            return self.stats()
+        raise ValueError(f"Unsupported method: {method}")
+
+    def _command(self, params: dict):
+        device = params.get("device")
+        if device is None:
+            raise ValueError("Device address is missing")
+        device = int(device, 0) if isinstance(device, str) else int(device)
+        if device <= 0:
+            raise ValueError("Destination address cannot be 0!")
+        if params.get("frame") is not None:
+            return device, parse_hex(params["frame"])
+        command = {key: value for key, value in params.items() if key not in _REQUEST_KEYS and value is not None}
+        return device, encode_command(self._mbproto, command)
+
+    async def _request(self, params: dict) -> dict:
+        device, frame = self._command(params)
+        ret, err, cmd_msg = self._mbproto.decode_response(frame)
+        if (not ret):
+            raise ValueError(f"Invalid command frame: {err}")
+        key = (device, *self._mbproto.correlation_key(cmd_msg))
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        start = monotonic()
+        try:
+            async with lock:
+                response, msg = await self._fleet.request(device, frame, params.get("timeout"))
+        except asyncio.TimeoutError:
+            return {"device": device, "status": STATUS_TIMEOUT, "elapsed": monotonic() - start}
+        answer = message_record(self._mbproto, msg, bool(params.get("decode_modbus")))
+        return {"device": device, "status": answer_status(self._mbproto.decode_answer(msg)),
+                "elapsed": monotonic() - start, "travel_time": response.travel_time, "answer": answer}
+
+    def stats(self) -> dict:
+        """Returns state of the daemon and the shared fleet controller"""
+        return {
+            "connections": len(self._connections),
+            "subscribers": sum(1 for connection in self._connections if connection.devices is not None),
+            "requests": self._requests,
+            "inflight": len(self._fleet.inflight),
+            "rtt": self._fleet.rtt.estimates(),
+            "sinks": self._fleet.sink_scheduler.utilization(),
+            "metrics": REGISTRY.snapshot(),
+        }
+
+
+async def run_daemon(fleet, path: str = DEFAULT_SOCKET) -> None:
+    """Serves the fleet controller until cancelled or terminated with SIGTERM"""
+    import signal
+    daemon = ControllerDaemon(fleet, path)
+    task = asyncio.ensure_future(daemon.serve_forever())
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        logging.info("Controller daemon stopped")
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+from dataclasses import replace
+from time import monotonic
+
+from wmbc import metrics
+from wmbc.inflight import InFlightTable
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.retry import RetryPolicy, DEFAULT_RETRY_POLICIES, NO_RETRY, policy_for, request_with_retry
+from wmbc.rtt import RttEstimator
+from wmbc.sink_scheduler import SinkScheduler
+from wmbc.stream import ResponseStream, OVERFLOW_BLOCK
+from wmbc.tracing import TRACER
+from wmbc.wmbc import WMBController
+
+
+class WMBFleetController():
+    """
+    Implementation of fleet-level WMB controller
+
+    A single SinkController is shared by all devices: commands can be sent to any
+    destination address and incoming answers are demultiplexed by their source address
+    to per-device handlers. Commands sent with request() are tracked in an in-flight table,
+    so many of them can be outstanding at once and their answers are delivered to the awaiting
+    caller instead of the device handler.
+
+    With several sinks every command is sent over one of them chosen by a SinkScheduler, which
+    balances the load, moves retries to another sink and takes sinks which stopped answering
+    out of rotation (see sink_failure_threshold and sink_cooldown).
+
+    Timeouts of requests start at initial_timeout and adapt to the round trip time of every device
+    within min_rto and max_rto (see RttEstimator).
+    """
+
+    MB_PROTO_SRC_EP = WMBController.MB_PROTO_SRC_EP
+    MB_PROTO_DST_EP = WMBController.MB_PROTO_DST_EP
+
+    def __init__(self, **kwargs):
+
+        logging.info("Starting WMB Fleet Controller")
+        self._sink_ids = kwargs.get("sink_ids")
+        self._mbproto = MBProto()
+        self._devices = dict()
+        self._inflight = InFlightTable(stale_window=kwargs.get("stale_window", 30.0))
+        self._receiver = None
+        self._streams = list()
+        self._rtt = RttEstimator(kwargs.get("initial_timeout", 5.0), kwargs.get("min_rto", 0.5),
+                                 kwargs.get("max_rto", 60.0))
+        self._retry_policies = kwargs.get("retry_policies", DEFAULT_RETRY_POLICIES)
+        # Provide default sink_ids if not provided in init
+        if (self._sink_ids is None):
+            self._sink_ids = ["sink0", "sink1"]
+        self._sink_scheduler = SinkScheduler(self._sink_ids, kwargs.get("sink_failure_threshold", 3),
+                                             kwargs.get("sink_cooldown", 30.0))
+        # SinkController class or a factory with its signature, e.g. SimulatedNetwork.sink_controller
+        sink_controller = kwargs.get("sink_controller")
+        if sink_controller is None:
+            # Imported on demand, wsctrl pulls in D-Bus bindings
+            from wsctrl.sink_ctrl import SinkController as sink_controller
+        # Destination address of the client is not used, every send provides its own
+        self._client = sink_controller(0, self.MB_PROTO_SRC_EP, self.MB_PROTO_DST_EP, sink_ids=self._sink_ids)
+
+    @property
+    def mbproto(self) -> MBProto:
+        return self._mbproto
+
+    @property
+    def devices(self) -> list:
+        return list(self._devices.keys())
+
+    def add_device(self, dst_addr: int, _callback=None, callback_args=None) -> None:
+        """
+        Registers a device handler
+
+        Args:
+            dst_addr: Wirepas address of the device
+            _callback: Called as _callback(msg, callback_args) for every decoded answer of the device,
+                       answers are printed with print_msg if not provided
+            callback_args: Arguments passed to the callback
+        """
+        assert dst_addr > 0, "Destination address cannot be 0!"
+        self._devices[dst_addr & 0xFFFFFFFF] = (_callback, callback_args)
+
+    def remove_device(self, dst_addr: int) -> None:
+        self._devices.pop(dst_addr & 0xFFFFFFFF, None)
+
+    def _send(self, dst_addr: int, payload_coded: bytes, exclude: str = None) -> str:
+        sinks = {sink.sink_id: sink for sink in self._client.sink_manager.get_sinks() if sink.sink_id in self._sink_ids}
+        error = None
+        while sinks:
+            sink_id = self._sink_scheduler.select(sinks, exclude)
+            try:
+                sinks.pop(sink_id).send_data(
+                    dst_addr & 0xFFFFFFFF, self.MB_PROTO_SRC_EP, self.MB_PROTO_DST_EP,
+                    self._client.DEFAULT_QOS, self._client.DEFAULT_DELAY_MS, payload_coded,
+                    False, self._client.MAX_HOP_LIMIT
+                )
+            except Exception as e:
+                # Next sink is tried right away, the command fails only if no sink takes it
+                logging.warning(f"Sending to {dst_addr} over {sink_id} failed: {e}")
+                self._sink_scheduler.send_failed(sink_id)
+                error = e
+                continue
+            self._sink_scheduler.sent(sink_id)
+            logging.debug(f"Data sent to {dst_addr} over {sink_id}")
+            return sink_id
+        raise error or ValueError(f"None of the sinks {self._sink_ids} is available")
+
+    def send_command(self, dst_addr: int, payload_coded: bytes, exclude_sink: str = None) -> str:
+        """Sends a command over the sink chosen by the sink scheduler, returns id of the sink"""
+        assert dst_addr > 0, "Destination address cannot be 0!"
+        try:
+            with TRACER.span("send"):
+                sink_id = self._send(dst_addr, payload_coded, exclude_sink)
+        except Exception as e:
+            from wsctrl.exceptions import SinkCtrlNoComms
+            raise SinkCtrlNoComms(f"Bus error: {e}") from e
+        metrics.COMMANDS_SENT.inc(dst_addr & 0xFFFFFFFF, metrics.cmd_label(MBProto.peek_cmd(payload_coded)))
+        return sink_id
+
+    async def request(self, dst_addr: int, payload_coded: bytes, timeout: float = None,
+                      retry_policy: RetryPolicy = None, deadline: float = None):
+        """
+        Sends a command and waits for its answer, resending it according to its retry policy
+
+        Args:
+            dst_addr: Wirepas address of the device
+            payload_coded: Command frame created with MBProto
+            timeout: Time to wait for the first answer in seconds, derived from RTT estimate of the device if None
+            retry_policy: Overrides the retry policy of the command (see retry.policy_for), non-idempotent
+                          commands like device reset are never retried
+            deadline: Limits the total time of all attempts in seconds, e.g. to the period of a recurring poll
+
+        Returns:
+            Tuple of received Wirepas response and decoded MbMessage
+
+        Raises:
+            asyncio.TimeoutError: The device did not answer any attempt in time
+        """
+        ret, err, cmd_msg = self._mbproto.decode_response(payload_coded)
+        if (not ret):
+            raise ValueError(f"Invalid command frame: {err}")
+        cmd, index = self._mbproto.correlation_key(cmd_msg)
+        policy = policy_for(cmd_msg, self._retry_policies)
+        if retry_policy is not None and policy is not NO_RETRY:
+            policy = retry_policy
+        if deadline is not None:
+            policy = replace(policy, deadline=deadline if policy.deadline is None else min(policy.deadline, deadline))
+        dst_addr &= 0xFFFFFFFF
+        if timeout is None:
+            timeout = self._rtt.timeout(dst_addr)
+        self._ensure_receiver()
+        scheduler = self._sink_scheduler
+        # Sink and send time of the last attempt, which is waiting for the answer
+        attempts, sink_id, sent_at = 0, None, None
+
+        def send():
+            nonlocal attempts, sink_id, sent_at
+            previous, sink_id = sink_id, None
+            if previous is not None:
+                # Retried because the previous attempt was not answered, it goes over another sink if possible
+                scheduler.timed_out(previous, dst_addr)
+            sink_id = self.send_command(dst_addr, payload_coded, previous)
+            scheduler.started(sink_id)
+            attempts, sent_at = attempts + 1, monotonic()
+
+        try:
+            with TRACER.span("request"):
+                result = await request_with_retry(self._inflight, self._rtt, send, dst_addr, cmd, index, policy,
+                                                  timeout)
+        except asyncio.TimeoutError:
+            if sink_id is not None:
+                scheduler.timed_out(sink_id, dst_addr)
+            raise
+        except BaseException:
+            if sink_id is not None:
+                scheduler.cancelled(sink_id)
+            raise
+        # Like the device RTT, the sink RTT is sampled only from commands answered on the first attempt
+        scheduler.answered(sink_id, monotonic() - sent_at if attempts == 1 else None)
+        return result
+
+    @property
+    def inflight(self) -> InFlightTable:
+        return self._inflight
+
+    @property
+    def sink_scheduler(self) -> SinkScheduler:
+        """Per-sink load and health, see SinkScheduler.utilization"""
+        return self._sink_scheduler
+
+    @property
+    def rtt(self) -> RttEstimator:
+        """Per-device RTT estimates used for adaptive timeouts, see RttEstimator.estimates"""
+        return self._rtt
+
+    def initialize_sink(self):
+        self._client.initialize_sink()
+
+    def deinitialize_sink(self):
+        self._client.deinitialize_sink()
+
+    def dispatch(self, response):
+        """
+        Routes a received Wirepas response to a pending request or the handler of its source device
+
+        Returns decoded MbMessage if it was not consumed by a pending request, None otherwise
+        """
+        ret, err, msg = self._mbproto.decode_response(response.payload, src=response.src)
+        if (not ret):
+            logging.error("Failed to decode frame from %d!: %s", response.src, err)
+            return None
+        metrics.record_answer(response.src, msg)
+        TRACER.record("mesh", response.travel_time / 1000)
+        cmd, index = self._mbproto.correlation_key(msg)
+        # Periodical reports share the key of the configuration command, they must not complete it
+        if not MBProto.is_report(msg) and self._inflight.match(response.src, cmd, index, (response, msg)):
+            return None
+        device = self._devices.get(response.src)
+        if device is None:
+            if not self._streams:
+                logging.debug(f"Ignoring message from unregistered device: {response.src}")
+            return msg
+        _callback, callback_args = device
+        if _callback is None:
+            if not self._streams:
+                logging.info(f"Got message from: {response.src}")
+                self._mbproto.print_msg(msg)
+        else:
+            with TRACER.span("callback"):
+                _callback(msg, callback_args)
+        return msg
+
+    async def async_receive(self):
+        """Receives next raw Wirepas response, do not combine with run(), request() or responses()"""
+        return await self._client.async_receive()
+
+    async def _receive_loop(self):
+        while True:
+            response = await self._client.async_receive()
+            try:
+                msg = self.dispatch(response)
+            except Exception:
+                logging.exception(f"Failed to handle message from: {response.src}")
+                continue
+            if msg is not None:
+                for stream in self._streams:
+                    await stream.put((response, msg))
+
+    async def responses(self, maxsize=1024, overflow=OVERFLOW_BLOCK):
+        """
+        Streams received messages not consumed by request() as (Wirepas response, decoded MbMessage) tuples
+
+        Usage: async for response, msg in fleet.responses(): ...
+        Every subscriber gets its own bounded queue, overflow selects what happens when the consumer
+        falls behind (see ResponseStream). With block policy a slow subscriber delays the receive loop.
+        """
+        stream = ResponseStream(maxsize, overflow)
+        self._streams.append(stream)
+        self._ensure_receiver()
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            self._streams.remove(stream)
+            if stream.dropped:
+                logging.warning(f"Response stream dropped {stream.dropped} messages")
+
+    def _ensure_receiver(self):
+        if self._receiver is None or self._receiver.done():
+            self._receiver = asyncio.ensure_future(self._receive_loop())
+
+    async def run(self):
+        logging.info("Entering fleet polling, press Ctrl+C to exit")
+        self._ensure_receiver()
+        await self._receiver
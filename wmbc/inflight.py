@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from time import monotonic
+from typing import Optional
+
+from wmbc import metrics
+
+
+class InFlightRequest():
+    """Single outstanding command waiting for its answer"""
+
+    __slots__ = ("src", "cmd", "index", "future", "sent_at", "attempts", "stale_window")
+
+    def __init__(self, src: int, cmd: int, index: Optional[int], future: asyncio.Future):
+        self.src = src
+        self.cmd = cmd
+        self.index = index
+        self.future = future
+        self.sent_at = monotonic()
+        # Number of times the command was sent, each send may produce an answer
+        self.attempts = 1
+        # Time late answers are still expected after the request completes, the table default if None
+        self.stale_window = None
+
+
+class InFlightTable():
+    """
+    Correlates MB Protocol answers with outstanding commands
+
+    Requests are keyed on (source address, cmd, index) where index is the configuration index
+    or the Modbus port of the command (see MBProto.correlation_key). Answers which do not carry
+    an index (ACK/NACK, diagnostics) match the oldest outstanding request with the same
+    (source address, cmd). Requests which timed out leave a tombstone for their own stale_window
+    (set by request_with_retry to the RTO of the device) or the stale_window of the table,
+    so their late answers are dropped instead of being delivered as unsolicited messages. An answer
+    is matched with an outstanding request first, tombstones never hold back an answer somebody waits for.
+    Requests which were sent more than once (retried) leave a tombstone for every answer still
+    expected after the first one, so late duplicates are not delivered twice.
+    """
+
+    def __init__(self, stale_window: float = 30.0):
+        self._stale_window = stale_window
+        self._pending = dict()
+        self._stale = dict()
+        self.stale_dropped = 0
+
+    def __len__(self):
+        return sum(len(requests) for requests in self._pending.values())
+
+    @staticmethod
+    def _index_matches(a: Optional[int], b: Optional[int]) -> bool:
+        return a is None or b is None or a == b
+
+    def add(self, src: int, cmd: int, index: Optional[int] = None) -> InFlightRequest:
+        """Registers an outstanding command, its answer is delivered through the returned request future"""
+        request = InFlightRequest(src, cmd, index, asyncio.get_running_loop().create_future())
+        self._pending.setdefault((src, cmd), []).append(request)
+        return request
+
+    def discard(self, request: InFlightRequest) -> None:
+        """Removes a request which will never be answered (e.g. failed to be sent)"""
+        requests = self._pending.get((request.src, request.cmd))
+        if requests is not None and request in requests:
+            requests.remove(request)
+            if not requests:
+                del self._pending[(request.src, request.cmd)]
+        if not request.future.done():
+            request.future.cancel()
+
+    def _add_stale(self, request: InFlightRequest, count: int) -> None:
+        tombstones = self._stale.setdefault((request.src, request.cmd), [])
+        window = self._stale_window if request.stale_window is None else request.stale_window
+        expires_at = monotonic() + window
+        for _ in range(count):
+            tombstones.append([request.index, expires_at])
+
+    def expire(self, request: InFlightRequest) -> None:
+        """Removes a timed out request and marks possible late answers to all its attempts as stale"""
+        self.discard(request)
+        self._add_stale(request, request.attempts)
+
+    def _consume_stale(self, src: int, cmd: int, index: Optional[int]) -> bool:
+        tombstones = self._stale.get((src, cmd))
+        if tombstones is None:
+            return False
+        now = monotonic()
+        tombstones[:] = [t for t in tombstones if t[1] > now]
+        for tombstone in tombstones:
+            if self._index_matches(tombstone[0], index):
+                tombstones.remove(tombstone)
+                break
+        else:
+            tombstone = None
+        if not tombstones:
+            del self._stale[(src, cmd)]
+        return tombstone is not None
+
+    def match(self, src: int, cmd: int, index: Optional[int], result) -> bool:
+        """
+        Matches a received answer with an outstanding request
+
+        Args:
+            src: Source address of the answer
+            cmd: Command of the answer
+            index: Configuration index or Modbus port of the answer, None if not carried
+            result: Object the matched request future is resolved with
+
+        Returns:
+            True if the answer was consumed (delivered or dropped as stale), False if it is unsolicited
+        """
+        requests = self._pending.get((src, cmd), ())
+        for request in requests:
+            if self._index_matches(request.index, index):
+                break
+        else:
+            # Tombstones only filter answers nobody waits for, an outstanding request always takes the answer
+            if self._consume_stale(src, cmd, index):
+                self.stale_dropped += 1
+                metrics.STALE_ANSWERS.inc(src)
+                logging.debug(f"Dropping stale answer from: {src}")
+                return True
+            return False
+        requests.remove(request)
+        if not requests:
+            del self._pending[(src, cmd)]
+        if request.attempts > 1:
+            self._add_stale(request, request.attempts - 1)
+        if not request.future.done():
+            request.future.set_result(result)
+        return True
@@ -0,0 +1,181 @@
+"""
+Execution of command manifests over a shared fleet controller
+
+A manifest lists commands for many devices, every entry has the device address, the command
+type and its parameters with the names of the command line options, e.g. a CSV file:
+
+    device,cmd,target_port,port_cfg
+    21,port_cfg,1,9600 0 1
+    22,port_cfg,1,9600 0 1
+
+or a YAML (requires PyYAML) / JSON file with a list of entries or a mapping with common
+parameters under "defaults" and the entries under "commands".
+"""
+
+import asyncio
+import csv
+import json
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Dict, Iterable, List, Optional
+
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.mb_proto.mb_protocol_results import AckResult
+from wmbc.offline import encode_command
+from wmbc.retry import RetryPolicy
+
+# Statuses of executed entries, only the first two count as success
+STATUS_ACK = "ack"
+STATUS_ANSWERED = "answered"
+STATUS_NACK = "nack"
+STATUS_TIMEOUT = "timeout"
+STATUS_ERROR = "error"
+
+# Parameters given as integers, CSV cells are strings
+_INT_PARAMS = ('dev_mode', 'ant_cfg', 'target_port', 'modbus_interval', 'modbus_cfg_idx')
+
+
+@dataclass(slots=True)
+class ManifestEntry:
+    """Command of a manifest, params are the keyword arguments of commands.build_command"""
+    dst_addr: int
+    cmd: str
+    params: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class ManifestResult:
+    entry: ManifestEntry
+    status: str
+    error: Optional[str] = None
+    elapsed: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (STATUS_ACK, STATUS_ANSWERED)
+
+    def to_dict(self) -> dict:
+        return {"device": self.entry.dst_addr, "cmd": self.entry.cmd, "status": self.status,
+                "error": self.error, "elapsed": self.elapsed}
+
+
+def answer_status(answer) -> str:
+    """Classifies decoded answer of a command as ack, nack or answered"""
+    if isinstance(answer, AckResult):
+        return STATUS_ACK if answer.is_ack else STATUS_NACK
+    return STATUS_ANSWERED
+
+
+def _entry(item: dict, defaults: dict) -> ManifestEntry:
+    params = {**defaults, **{key: value for key, value in item.items() if value not in (None, "")}}
+    dst_addr = params.pop("device", params.pop("dst_addr", None))
+    cmd = params.pop("cmd", None)
+    if dst_addr is None or cmd is None:
+        raise ValueError(f"Manifest entry without device or cmd: {item}")
+    for key in _INT_PARAMS:
+        if isinstance(params.get(key), str):
+            params[key] = int(params[key], 0)
+    if isinstance(params.get("port_cfg"), str):
+        params["port_cfg"] = params["port_cfg"].split()
+    return ManifestEntry(int(dst_addr, 0) if isinstance(dst_addr, str) else int(dst_addr), cmd, params)
+
+
+def parse_manifest(data, defaults: Optional[dict] = None) -> List[ManifestEntry]:
+    """Creates entries of a manifest loaded from YAML or JSON"""
+    defaults = dict(defaults or {})
+    if isinstance(data, dict):
+        defaults.update(data.get("defaults") or {})
+        data = data.get("commands")
+    if not isinstance(data, list):
+        raise ValueError("Manifest has to be a list of commands or a mapping with 'commands'")
+    return [_entry(item, defaults) for item in data]
+
+
+def load_manifest(path: str) -> List[ManifestEntry]:
+    """Loads manifest from a CSV, YAML or JSON file, the format is selected by the extension"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="") as f:
+        if extension == ".csv":
+            return [_entry(row, {}) for row in csv.DictReader(f)]
+        if extension in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("YAML manifests require PyYAML, install wmbc[yaml]") from e
+            return parse_manifest(yaml.safe_load(f))
+        if extension == ".json":
+            return parse_manifest(json.load(f))
+    raise ValueError(f"Unsupported manifest format: {path}")
+
+
+class ManifestRunner():
+    """
+    Executes manifest entries over a WMBFleetController
+
+    Commands of a single device are sent in the manifest order, one at a time. Devices are served
+    concurrently, at most concurrency commands are in flight at once. All frames are encoded
+    before anything is sent, so an invalid entry fails without touching the network.
+    """
+
+    def __init__(self, fleet, concurrency: int = 16, timeout: Optional[float] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1")
+        self._fleet = fleet
+        self._concurrency = concurrency
+        self._timeout = timeout
+        self._retry_policy = retry_policy
+        # Encoding updates settings of MBProto, the fleet's own instance is left untouched
+        self._mbproto = MBProto()
+
+    async def _execute(self, semaphore: asyncio.Semaphore, result: ManifestResult, frame: bytes) -> None:
+        async with semaphore:
+            start = monotonic()
+            try:
+                _, msg = await self._fleet.request(result.entry.dst_addr, frame, self._timeout, self._retry_policy)
+            except asyncio.TimeoutError:
+                result.status = STATUS_TIMEOUT
+                return
+            except Exception as e:
+                result.status, result.error = STATUS_ERROR, str(e)
+                return
+            finally:
+                result.elapsed = monotonic() - start
+        result.status = answer_status(self._mbproto.decode_answer(msg))
+
+    async def _run_device(self, semaphore: asyncio.Semaphore, jobs: list) -> None:
+        for result, frame in jobs:
+            await self._execute(semaphore, result, frame)
+
+    async def run(self, entries: Iterable[ManifestEntry]) -> List[ManifestResult]:
+        """Executes the entries, returns their results in the manifest order"""
+        results = []
+        devices: Dict[int, list] = dict()
+        for entry in entries:
+            result = ManifestResult(entry, STATUS_ERROR)
+            results.append(result)
+            try:
+                frame = encode_command(self._mbproto, {"cmd": entry.cmd, **entry.params})
+            except (ValueError, OSError) as e:
+                result.error = str(e)
+                continue
+            devices.setdefault(entry.dst_addr & 0xFFFFFFFF, []).append((result, frame))
+
+        semaphore = asyncio.Semaphore(self._concurrency)
+        logging.info(f"Executing {len(results)} commands for {len(devices)} devices")
+        await asyncio.gather(*(self._run_device(semaphore, jobs) for jobs in devices.values()))
+        return results
+
+
+def summarize(results: Iterable[ManifestResult]) -> dict:
+    """Returns number of results per status and devices with failed commands"""
+    statuses = Counter()
+    failed = set()
+    for result in results:
+        statuses[result.status] += 1
+        if not result.ok:
+            failed.add(result.entry.dst_addr)
+    return {"statuses": dict(statuses), "failed_devices": sorted(failed)}
@@ -0,0 +1,87 @@
+"""Table-driven CRC-16/DDS-110 used to protect MB Protocol frames"""
+
+from typing import Iterable, Union
+
+CRC16_POLY = 0x8005
+CRC16_INIT = 0x800D
+
+
+def _create_table() -> tuple:
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ CRC16_POLY) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _create_table()
+
+
+def crc16(data: Union[bytes, bytearray, memoryview]) -> int:
+    """Calculates CRC-16/DDS-110 of data (bit-exact with crccheck.crc.Crc16Dds110)"""
+    crc = CRC16_INIT
+    table = CRC16_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+def verify(frame: Union[bytes, bytearray, memoryview]) -> bool:
+    """Verifies a frame with big endian CRC appended in its last 2 bytes"""
+    if len(frame) < 2:
+        return False
+    return crc16(frame[:-2]) == (frame[-2] << 8 | frame[-1])
+
+
+def verify_many(frames: Iterable[bytes]):
+    """
+    Verifies CRC of many frames at once
+
+    Uses NumPy to process all frames byte column by byte column if it is available,
+    falls back to verifying frames one by one otherwise.
+
+    Args:
+        frames: Frames with big endian CRC appended in their last 2 bytes
+
+    Returns:
+        Sequence of verification results (NumPy bool array if NumPy is available)
+    """
+    frames = list(frames)
+    try:
+        import numpy as np
+    except ImportError:
+        return [verify(frame) for frame in frames]
+
+    count = len(frames)
+    lengths = np.fromiter((len(frame) for frame in frames), dtype=np.int64, count=count)
+    result = np.zeros(count, dtype=bool)
+    valid = lengths >= 2
+    if not valid.any():
+        return result
+    rows = np.flatnonzero(valid)
+    data_lengths = lengths[rows] - 2
+    width = int(data_lengths.max())
+
+    # Left aligned matrix of message data, one frame per row
+    data = np.zeros((len(rows), max(width, 1)), dtype=np.uint8, order="F")
+    flat = np.frombuffer(b"".join(bytes(frames[row][:-2]) for row in rows), dtype=np.uint8)
+    row_idx = np.repeat(np.arange(len(rows)), data_lengths)
+    starts = np.cumsum(data_lengths) - data_lengths
+    col_idx = np.arange(len(flat)) - np.repeat(starts, data_lengths)
+    data[row_idx, col_idx] = flat
+
+    table = np.array(CRC16_TABLE, dtype=np.uint32)
+    crc = np.full(len(rows), CRC16_INIT, dtype=np.uint32)
+    for col in range(width):
+        updated = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ data[:, col]]
+        crc = np.where(data_lengths > col, updated, crc)
+
+    received = np.fromiter(((frames[row][-2] << 8) | frames[row][-1] for row in rows),
+                           dtype=np.uint32, count=len(rows))
+    result[rows] = crc == received
+    return result
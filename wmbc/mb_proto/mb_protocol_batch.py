@@ -0,0 +1,121 @@
+"""Columnar batch decoding of MB Protocol Modbus responses (requires NumPy)"""
+
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence
+
+import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
+from wmbc import metrics
+from wmbc.mb_proto import crc16
+from wmbc.mb_proto import modbus_rtu
+
+
+@dataclass(slots=True)
+class ModbusBatch:
+    """
+    Decoded batch of frames, row i of every column describes frame i
+
+    registers is a (frames x max register count) uint16 matrix, rows are zero padded
+    past register_count. error is set for frames which failed CRC or parsing, are not
+    Modbus responses or carry a Modbus exception.
+    """
+    src: "np.ndarray"
+    cmd: "np.ndarray"
+    configuration_index: "np.ndarray"
+    port: "np.ndarray"
+    dev_id: "np.ndarray"
+    function_code: "np.ndarray"
+    exception_code: "np.ndarray"
+    register_count: "np.ndarray"
+    registers: "np.ndarray"
+    error: "np.ndarray"
+
+    def __len__(self):
+        return len(self.error)
+
+
+def decode_many(frames: Iterable[bytes], src: Optional[Sequence[int]] = None) -> ModbusBatch:
+    """
+    Decodes many MB Protocol frames into columnar NumPy arrays
+
+    Args:
+        frames: MB Protocol frames (Wirepas payloads) with CRC
+        src: Source addresses of the frames, zeros if not provided
+
+    Returns:
+        ModbusBatch with one row per frame
+    """
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise ImportError("decode_many requires NumPy, install wmbc[numpy]") from e
+
+    frames = list(frames)
+    count = len(frames)
+    if src is None:
+        src_col = np.zeros(count, dtype=np.uint32)
+    else:
+        src_col = np.asarray(src, dtype=np.uint32)
+        if len(src_col) != count:
+            raise ValueError("Number of source addresses does not match number of frames")
+    cmd = np.zeros(count, dtype=np.uint8)
+    configuration_index = np.zeros(count, dtype=np.uint32)
+    port = np.zeros(count, dtype=np.uint8)
+    dev_id = np.zeros(count, dtype=np.uint8)
+    function_code = np.zeros(count, dtype=np.uint8)
+    exception_code = np.zeros(count, dtype=np.uint8)
+    register_count = np.zeros(count, dtype=np.uint16)
+    error = np.ones(count, dtype=bool)
+
+    crc_ok = crc16.verify_many(frames)
+    if src is None:
+        crc_failed = {metrics.device_label(None): count - int(np.count_nonzero(crc_ok))}
+    else:
+        devices, amounts = np.unique(src_col[~crc_ok], return_counts=True)
+        crc_failed = dict(zip(devices.tolist(), amounts.tolist()))
+    for device, amount in crc_failed.items():
+        if amount:
+            metrics.DECODE_ERRORS.inc(device, "crc", amount=amount)
+    register_data = []
+    message = mb_protocol.MbMessage()
+    for row in np.flatnonzero(crc_ok):
+        try:
+            message.ParseFromString(frames[row][:-2])
+        except Exception:
+            metrics.DECODE_ERRORS.inc(metrics.device_label(None if src is None else int(src_col[row])), "parse")
+            continue
+        cmd[row] = message.cmd
+        answer_frame = message.payload.payload_answer_frame
+        if answer_frame.WhichOneof('answer_frame') != 'modbus_response_frame':
+            continue
+        response_frame = answer_frame.modbus_response_frame
+        configuration_index[row] = response_frame.configuration_index
+        port[row] = response_frame.modbus_port
+        try:
+            response = modbus_rtu.parse_response(response_frame.modbus_frame)
+        except ValueError:
+            continue
+        if response is None:
+            continue
+        dev_id[row] = response.dev_id
+        function_code[row] = response.function_code
+        if response.exception_code is not None:
+            exception_code[row] = response.exception_code
+            continue
+        error[row] = False
+        if response.registers:
+            register_count[row] = len(response.registers)
+            register_data.append(response.registers.tobytes())
+
+    # Scatter native-endian register words of all frames into the padded matrix at once
+    width = int(register_count.max()) if count else 0
+    registers = np.zeros((count, width), dtype=np.uint16)
+    if register_data:
+        flat = np.frombuffer(b"".join(register_data), dtype=np.uint16)
+        counts = register_count.astype(np.int64)
+        rows = np.repeat(np.arange(count), counts)
+        starts = np.cumsum(counts) - counts
+        cols = np.arange(len(flat)) - np.repeat(starts, counts)
+        registers[rows, cols] = flat
+
+    return ModbusBatch(src_col, cmd, configuration_index, port, dev_id, function_code, exception_code,
+                       register_count, registers, error)
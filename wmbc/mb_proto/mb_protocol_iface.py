@@ -1,26 +1,29 @@
 import logging
 import json
+from collections import OrderedDict
 import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
 import wmbc.mb_proto.mb_protocol_commands_pb2 as mb_commands
 import wmbc.mb_proto.mb_protocol_enums_pb2 as mb_enums
 import wmbc.mb_proto.mb_protocol_answers_pb2 as mb_answers
-from google.protobuf.json_format import MessageToJson
-from crccheck.crc import Crc16Dds110
+from wmbc import metrics
+from wmbc.tracing import TRACER
+from wmbc.mb_proto import crc16
+from wmbc.mb_proto import modbus_rtu
+from wmbc.mb_proto import mb_protocol_results as mb_results
 from typing import List, Optional, Tuple, Union
 
-from pymodbus.client import ModbusFrameGenerator
-from pymodbus.framer import FramerType
-
-logging.basicConfig(level=logging.INFO)
-
 
 class MBProto():
     # Protocol constants
     PROTOCOL_HEADER = 0x47
     PROTOCOL_VERSION = 0x01
 
-    def __init__(self):
-        pass
+    # Maximum number of encoded command frames kept in the frame cache
+    FRAME_CACHE_SIZE = 1024
+
+    def __init__(self, frame_cache_size: int = FRAME_CACHE_SIZE):
+        self._frame_cache = OrderedDict()
+        self._frame_cache_size = frame_cache_size
 
     def _create_message(self):
         """Creates a base message with common fields"""
@@ -31,118 +34,110 @@ class MBProto():
     
     def _add_crc(self, data: bytes) -> bytes:
         """Add CRC to serialized message"""
-        crcinst = Crc16Dds110()
-        crcinst.process(data)
-        crc = crcinst.final()
+        with TRACER.span("encode.crc"):
+            crc = crc16.crc16(data)
         return data + bytes([crc >> 8, crc & 0xFF])
-    
-    def create_device_reset(self) -> bytes:
-        """Creates device reset command"""
+
+    def _cached_frame(self, key: tuple, builder, *args) -> bytes:
+        """
+        Returns encoded frame for the key from the LRU frame cache, builds and stores it on miss
+
+        Key has to contain the command and every parameter the frame depends on.
+        """
+        frame = self._frame_cache.get(key)
+        if frame is not None:
+            self._frame_cache.move_to_end(key)
+            return frame
+        with TRACER.span("encode"):
+            frame = builder(*args)
+        if self._frame_cache_size > 0:
+            self._frame_cache[key] = frame
+            if len(self._frame_cache) > self._frame_cache_size:
+                self._frame_cache.popitem(last=False)
+        return frame
+
+    def clear_frame_cache(self) -> None:
+        self._frame_cache.clear()
+
+    def _build_empty_cmd(self, cmd: int) -> bytes:
+        """Builds command with empty frame"""
         message = self._create_message()
-        message.cmd = mb_protocol.Cmd.CMD_DEV_RESET
-        
-        # Create command frame with empty frame
-        cmd_frame = mb_commands.CmdFrame()
-        cmd_frame.empty_frame.CopyFrom(mb_commands.EmptyFrame())
-        message.payload.payload_cmd_frame.CopyFrom(cmd_frame)
-        
+        message.cmd = cmd
+        message.payload.payload_cmd_frame.empty_frame.SetInParent()
         return self._add_crc(message.SerializeToString())
+
+    def create_device_reset(self) -> bytes:
+        """Creates device reset command"""
+        return self._cached_frame((mb_protocol.Cmd.CMD_DEV_RESET,), self._build_empty_cmd,
+                                  mb_protocol.Cmd.CMD_DEV_RESET)
     
     def create_diagnostics(self) -> bytes:
         """Creates diagnostics request command"""
+        return self._cached_frame((mb_protocol.Cmd.CMD_DIAGNOSTICS,), self._build_empty_cmd,
+                                  mb_protocol.Cmd.CMD_DIAGNOSTICS)
+
+    def _build_device_mode(self, device_mode: int) -> bytes:
         message = self._create_message()
-        message.cmd = mb_protocol.Cmd.CMD_DIAGNOSTICS
-        
-        # Create command frame with empty frame
-        cmd_frame = mb_commands.CmdFrame()
-        cmd_frame.empty_frame.CopyFrom(mb_commands.EmptyFrame())
-        message.payload.payload_cmd_frame.CopyFrom(cmd_frame)
-        
+        message.cmd = mb_protocol.Cmd.CMD_DEV_MODE
+        message.payload.payload_cmd_frame.device_mode_frame.device_mode = device_mode
         return self._add_crc(message.SerializeToString())
-    
+
     def create_device_mode(self) -> bytes:
         """Creates device mode command"""
+        return self._cached_frame((mb_protocol.Cmd.CMD_DEV_MODE, self._device_mode), self._build_device_mode,
+                                  self._device_mode)
+
+    def _build_antenna_config(self, antenna_config: int) -> bytes:
         message = self._create_message()
-        message.cmd = mb_protocol.Cmd.CMD_DEV_MODE
-        
-        # Step 1: Create the device mode frame
-        device_mode_frame = mb_commands.DeviceModeFrame()
-        device_mode_frame.device_mode = self._device_mode
-        
-        # Step 2: Create the command frame and attach device mode frame
-        cmd_frame = mb_commands.CmdFrame()
-        cmd_frame.device_mode_frame.CopyFrom(device_mode_frame)
-        
-        # Step 3: Attach the command frame to the message
-        message.payload.payload_cmd_frame.CopyFrom(cmd_frame)
-        
-        # Step 4: Serialize and add CRC
+        message.cmd = mb_protocol.Cmd.CMD_ANTENA_CONFIG
+        message.payload.payload_cmd_frame.antenna_settings_frame.antenna_settings = antenna_config
         return self._add_crc(message.SerializeToString())
-    
+
     def create_antenna_config(self) -> bytes:
-        # Step 1: Create the base message
-        message = self._create_message()  # This sets header and version
-        message.cmd = mb_protocol.Cmd.CMD_ANTENA_CONFIG  # Set command type
-        
-        # Step 2: Create the antenna settings frame
-        antenna_frame = mb_commands.AntennaSettingsFrame()
-        antenna_frame.antenna_settings = self._antenna_config
-        
-        # Step 3: Create the command frame and attach antenna settings frame
-        cmd_frame = mb_commands.CmdFrame()
-        cmd_frame.antenna_settings_frame.CopyFrom(antenna_frame)
-        
-        # Step 4: Attach the command frame to the message
-        message.payload.payload_cmd_frame.CopyFrom(cmd_frame)
-     
-        # Step 5: Serialize and add CRC
+        """Creates antenna configuration command"""
+        return self._cached_frame((mb_protocol.Cmd.CMD_ANTENA_CONFIG, self._antenna_config),
+                                  self._build_antenna_config, self._antenna_config)
+
+    def _build_port_config(self, port: int, baudrate: int, parity: int, stop_bits: int) -> bytes:
+        message = self._create_message()
+        message.cmd = mb_protocol.Cmd.CMD_PORT_CONFIG
+        port_settings_frame = message.payload.payload_cmd_frame.port_settings_frame
+        port_settings_frame.modbus_port = port
+        port_settings_frame.port_baud = baudrate
+        port_settings_frame.port_parity = parity
+        port_settings_frame.port_stop_bits = stop_bits
         return self._add_crc(message.SerializeToString())
     
     def create_port_config(self) -> bytes:
         """Creates port configuration command"""
-        # Step 1: Create the base message
+        params = (self._target_port, self._baudrate_config, self._parity_bit, self._stop_bits)
+        return self._cached_frame((mb_protocol.Cmd.CMD_PORT_CONFIG, *params), self._build_port_config, *params)
+
+    def _build_modbus_oneshot(self, port: int, modbus_frame: bytes) -> bytes:
         message = self._create_message()
-        message.cmd = mb_protocol.Cmd.CMD_PORT_CONFIG
-        
-        # Step 2: Create the port settings frame
-        port_settings_frame = mb_commands.PortSettingsFrame()
-        port_settings_frame.modbus_port = self._target_port
-        port_settings_frame.port_baud = self._baudrate_config
-        port_settings_frame.port_parity = self._parity_bit
-        port_settings_frame.port_stop_bits = self._stop_bits
-        
-        # Step 3: Create the command frame and attach port settings frame
-        cmd_frame = mb_commands.CmdFrame()
-        cmd_frame.port_settings_frame.CopyFrom(port_settings_frame)
-        
-        # Step 4: Attach the command frame to the message
-        message.payload.payload_cmd_frame.CopyFrom(cmd_frame)
-        
-        # Step 5: Serialize and add CRC
+        message.cmd = mb_protocol.Cmd.CMD_MODBUS_ONE_SHOT
+        oneshot_frame = message.payload.payload_cmd_frame.modbus_one_shot_frame
+        oneshot_frame.modbus_port = port
+        oneshot_frame.modbus_frame = modbus_frame
         return self._add_crc(message.SerializeToString())
     
     def create_modbus_oneshot(self, modbus_frame: bytes) -> bytes:
         """Creates Modbus one-shot command"""
         if len(modbus_frame) > 256:
             raise ValueError("Modbus frame exceeds maximum size of 256 bytes")
-        
-        # Step 1: Create the base message
+        modbus_frame = bytes(modbus_frame)
+        return self._cached_frame((mb_protocol.Cmd.CMD_MODBUS_ONE_SHOT, self._target_port, modbus_frame),
+                                  self._build_modbus_oneshot, self._target_port, modbus_frame)
+
+    def _build_modbus_periodic(self, port: int, config_index: int, interval_seconds: int,
+                               modbus_frame: bytes) -> bytes:
         message = self._create_message()
-        message.cmd = mb_protocol.Cmd.CMD_MODBUS_ONE_SHOT
-        
-        # Step 2: Create the modbus one-shot frame
-        oneshot_frame = mb_commands.ModbusOneShotFrame()
-        oneshot_frame.modbus_port = self._target_port
-        oneshot_frame.modbus_frame = modbus_frame
-        
-        # Step 3: Create the command frame and attach one-shot frame
-        cmd_frame = mb_commands.CmdFrame()
-        cmd_frame.modbus_one_shot_frame.CopyFrom(oneshot_frame)
-        
-        # Step 4: Attach the command frame to the message
-        message.payload.payload_cmd_frame.CopyFrom(cmd_frame)
-        
-        # Step 5: Serialize and add CRC
+        message.cmd = mb_protocol.Cmd.CMD_MODBUS_PERIODICAL
+        periodic_frame = message.payload.payload_cmd_frame.modbus_periodical_frame
+        periodic_frame.modbus_port = port
+        periodic_frame.configuration_index = config_index
+        periodic_frame.interval = interval_seconds
+        periodic_frame.modbus_frame = modbus_frame
         return self._add_crc(message.SerializeToString())
     
     def create_modbus_periodic(
@@ -158,34 +153,19 @@ class MBProto():
             raise ValueError("Interval must be between 0 and 2592000 seconds")
         if len(modbus_frame) > 256:
             raise ValueError("Modbus frame exceeds maximum size of 256 bytes")
-        
-        # Step 1: Create the base message
-        message = self._create_message()
-        message.cmd = mb_protocol.Cmd.CMD_MODBUS_PERIODICAL
-        
-        # Step 2: Create the modbus periodic frame
-        periodic_frame = mb_commands.ModbusPeriodicalFrame()
-        periodic_frame.modbus_port = self._target_port
-        periodic_frame.configuration_index = config_index
-        periodic_frame.interval = interval_seconds
-        periodic_frame.modbus_frame = modbus_frame
-        
-        # Step 3: Create the command frame and attach periodic frame
-        cmd_frame = mb_commands.CmdFrame()
-        cmd_frame.modbus_periodical_frame.CopyFrom(periodic_frame)
-        
-        # Step 4: Attach the command frame to the message
-        message.payload.payload_cmd_frame.CopyFrom(cmd_frame)
-        
-        # Step 5: Serialize and add CRC
-        return self._add_crc(message.SerializeToString())
+        params = (self._target_port, config_index, interval_seconds, bytes(modbus_frame))
+        return self._cached_frame((mb_protocol.Cmd.CMD_MODBUS_PERIODICAL, *params),
+                                  self._build_modbus_periodic, *params)
 
-    def decode_response(self, frame: bytes) -> Tuple[bool, Optional[str], Optional[mb_protocol.MbMessage]]:
+    def decode_response(self, frame: bytes, crc_verified: bool = False,
+                        src: Optional[int] = None) -> Tuple[bool, Optional[str], Optional[mb_protocol.MbMessage]]:
         """
         Main decoder function that validates and decodes response frames
         
         Args:
             frame: Bytes containing the response frame to decode
+            crc_verified: CRC of the frame was already verified, e.g. by verify_many
+            src: Wirepas address the frame was received from, labels decode error metrics
             
         Returns:
             Tuple containing:
@@ -193,36 +173,128 @@ class MBProto():
             - Error message (str) if success is False, None otherwise
             - Decoded message if success is True, None otherwise
         """
+        with TRACER.span("decode"):
+            return self._decode_response(frame, crc_verified, metrics.device_label(src))
+
+    def _decode_response(self, frame: bytes, crc_verified: bool,
+                         device) -> Tuple[bool, Optional[str], Optional[mb_protocol.MbMessage]]:
         if len(frame) < 2:  # Need at least 2 bytes for CRC
+            metrics.DECODE_ERRORS.inc(device, "short")
             return False, "Frame too short", None
     
         # Separate message data from CRC
         message_data = frame[:-2]
         received_crc_bytes = frame[-2:]
     
-        # Calculate CRC
-        crcinst = Crc16Dds110()
-        crcinst.process(message_data)
-        calculated_crc = crcinst.final()
-        received_crc = int.from_bytes(received_crc_bytes, 'big')
-    
-        # Verify CRC
-        if calculated_crc != received_crc:
-            return False, f"CRC verification failed. Calculated: {calculated_crc:04x}, Received: {received_crc:04x}", None
+        if not crc_verified:
+            # Calculate CRC
+            with TRACER.span("decode.crc"):
+                calculated_crc = crc16.crc16(message_data)
+            received_crc = int.from_bytes(received_crc_bytes, 'big')
+
+            # Verify CRC
+            if calculated_crc != received_crc:
+                metrics.DECODE_ERRORS.inc(device, "crc")
+                return False, f"CRC verification failed. Calculated: {calculated_crc:04x}, Received: {received_crc:04x}", None
     
         try:
             # Parse message using protobuf
-            message = mb_protocol.MbMessage()
-            message.ParseFromString(message_data)
+            with TRACER.span("decode.protobuf"):
+                message = mb_protocol.MbMessage()
+                message.ParseFromString(message_data)
             return True, None, message
     
         except Exception as e:
+            metrics.DECODE_ERRORS.inc(device, "parse")
             return False, f"Error parsing message: {str(e)}", None
 
+    @staticmethod
+    def peek_cmd(frame: bytes) -> Optional[int]:
+        """
+        Returns command of an encoded frame without validating or decoding it
+
+        Scalar fields are serialized in field number order, so the command follows the
+        header and version varints. Returns None if the frame does not start that way.
+        """
+        idx = 0
+        while idx + 1 < len(frame):
+            tag = frame[idx]
+            if tag == 0x18:  # Field 3 (cmd), varint
+                return frame[idx + 1] if frame[idx + 1] < 0x80 else None
+            if tag not in (0x08, 0x10):  # Field 1 (header) and 2 (version), varint
+                return None
+            idx += 1
+            while idx < len(frame) and frame[idx] & 0x80:
+                idx += 1
+            idx += 1
+        return None
+
+    def verify_many(self, frames: List[bytes]):
+        """Verifies CRC of a batch of frames, see crc16.verify_many"""
+        return crc16.verify_many(frames)
+
+    def decode_many(self, frames: List[bytes], src: Optional[List[int]] = None):
+        """Decodes a batch of Modbus response frames into columnar NumPy arrays, see mb_protocol_batch.decode_many"""
+        from wmbc.mb_proto.mb_protocol_batch import decode_many
+        return decode_many(frames, src)
+
+    def correlation_key(self, msg: mb_protocol.MbMessage) -> Tuple[int, Optional[int]]:
+        """
+        Returns (cmd, index) used to correlate answers with commands
+
+        Index is the configuration index for periodical Modbus frames, the Modbus port for
+        one-shot Modbus frames and port configuration, None if the message does not carry it
+        """
+        if msg.payload.WhichOneof('payload_frame') == 'payload_cmd_frame':
+            cmd_frame = msg.payload.payload_cmd_frame
+            frame_type = cmd_frame.WhichOneof('cmd_frame')
+            if frame_type == 'modbus_periodical_frame':
+                return msg.cmd, cmd_frame.modbus_periodical_frame.configuration_index
+            if frame_type == 'modbus_one_shot_frame':
+                return msg.cmd, cmd_frame.modbus_one_shot_frame.modbus_port
+            if frame_type == 'port_settings_frame':
+                return msg.cmd, cmd_frame.port_settings_frame.modbus_port
+        else:
+            answer_frame = msg.payload.payload_answer_frame
+            if answer_frame.WhichOneof('answer_frame') == 'modbus_response_frame':
+                if msg.cmd == mb_protocol.Cmd.CMD_MODBUS_PERIODICAL:
+                    return msg.cmd, answer_frame.modbus_response_frame.configuration_index
+                return msg.cmd, answer_frame.modbus_response_frame.modbus_port
+        return msg.cmd, None
+
+    @staticmethod
+    def is_report(msg: mb_protocol.MbMessage) -> bool:
+        """
+        Checks if the message is Modbus data of a periodical configuration sent by the device on its own
+
+        Reports are not answers to commands, the periodical configuration command itself is answered with ACK/NACK
+        """
+        return (msg.cmd == mb_protocol.Cmd.CMD_MODBUS_PERIODICAL
+                and msg.payload.WhichOneof('payload_frame') == 'payload_answer_frame'
+                and msg.payload.payload_answer_frame.WhichOneof('answer_frame') == 'modbus_response_frame')
+
+    def parse_modbus_frame(self, frame: bytes) -> Optional[modbus_rtu.RtuResponse]:
+        """
+        Parses Modbus RTU response natively, registers are returned as compact array
+
+        Returns None if the function code is not handled natively, raises ValueError on malformed frame
+        """
+        return modbus_rtu.parse_response(frame)
+
     def decode_modbus_frame(self, frame: bytes) -> dict:
+        with TRACER.span("modbus_decode"):
+            return self._decode_modbus_frame(frame)
+
+    def _decode_modbus_frame(self, frame: bytes) -> dict:
+        response = modbus_rtu.parse_response(frame)
+        if response is not None:
+            return response.to_dict()
+        # Fallback for function codes not handled natively, pymodbus is imported on first use
+        from pymodbus.client import ModbusFrameGenerator
         generator = ModbusFrameGenerator()
         try:
-            decoded_frame = generator.parse_response(frame)
+            with TRACER.span("modbus_decode.pymodbus"):
+                decoded_frame = generator.parse_response(frame)
         except Exception as e:
             raise ValueError(e)
         parameters = {}
@@ -242,43 +314,45 @@ class MBProto():
         return result
 
     def decode_modbus_p_config(self, value):
-        modp_cfg = dict()
-        modp_cfg["enable"] = ((value & 0xF0000000) != 0)
-        modp_cfg["port"] = ((value & 0xF000000) >> 24)
-        modp_cfg["interval"] = value & 0xFFFFFF
-        return modp_cfg
+        return mb_results.decode_modbus_p_config(value)
+
+    def decode_answer(self, msg: mb_protocol.MbMessage,
+                      decode_modbus_frame: bool = False) -> Optional[mb_results.MbResult]:
+        """
+        Decodes answer message directly into a typed result
+
+        Args:
+            msg: Decoded MB Protocol message
+            decode_modbus_frame: Decode Modbus frame of Modbus responses into ModbusResponseResult.decoded_frame
+
+        Returns:
+            AckResult, DiagnosticsResult or ModbusResponseResult, None if the message is not an answer
+        """
+        result = mb_results.decode_answer(msg)
+        if decode_modbus_frame and isinstance(result, mb_results.ModbusResponseResult):
+            try:
+                result.decoded_frame = self.decode_modbus_frame(result.modbus_frame)
+            except Exception as e:
+                logging.error("Faild to decode Modbus Frame")
+        return result
 
     def print_decoded_msg(self, frame: bytes, decode_modbus_frame=True) -> None:
         ret, err, msg = self.decode_response(frame)
         if (not ret):
             logging.error("Failed to decode frame!:%s", err)
             return
-        json_str = MessageToJson(msg, always_print_fields_with_no_presence=True, preserving_proto_field_name=True)
-        _dict = json.loads(json_str)
-        if (msg.cmd == mb_protocol.Cmd.CMD_MODBUS_ONE_SHOT or msg.cmd == mb_protocol.Cmd.CMD_MODBUS_PERIODICAL):
-            if (msg.payload.payload_answer_frame.ack_frame.acknowladge == 0):
-                # Swap ASCII to binary
-                data = msg.payload.payload_answer_frame.modbus_response_frame.modbus_frame
-                if decode_modbus_frame:
-                    try:
-                        modbus_frame = self.decode_modbus_frame(data)
-                    except Exception as e:
-                        logging.error("Faild to decode Modbus Frame")
-                        hex_list = [f"0x{byte:02x}" for byte in data]
-                        _dict['payload']['payload_answer_frame']['modbus_response_frame']['modbus_frame'] = hex_list
-                    else:
-                        _dict['payload']['payload_answer_frame']['modbus_response_frame']['modbus_frame'] = modbus_frame
-                else:
-                    hex_list = [f"0x{byte:02x}" for byte in data]
-                    _dict['payload']['payload_answer_frame']['modbus_response_frame']['modbus_frame'] = hex_list
-
-        if (msg.cmd == mb_protocol.Cmd.CMD_DIAGNOSTICS):
-            decoded_cfgs = list()
-            for idx, cfg in enumerate(_dict['payload']['payload_answer_frame']['diagnostics_ans_frame']['modbus_configurations']):
-                cfg = self.decode_modbus_p_config(cfg['configuration'])
-                cfg['id'] = idx + 1
-                decoded_cfgs.append(cfg)
-            _dict['payload']['payload_answer_frame']['diagnostics_ans_frame']['modbus_configurations'] = decoded_cfgs
+        self.print_msg(msg, decode_modbus_frame)
+
+    def print_msg(self, msg: mb_protocol.MbMessage, decode_modbus_frame=True) -> None:
+        """Logs already decoded message like print_decoded_msg"""
+        if not logging.getLogger().isEnabledFor(logging.INFO):
+            return
+        result = self.decode_answer(msg, decode_modbus_frame)
+        if result is not None:
+            _dict = result.to_dict()
+        else:
+            from google.protobuf.json_format import MessageToDict
+            _dict = MessageToDict(msg, always_print_fields_with_no_presence=True, preserving_proto_field_name=True)
         logging.info(json.dumps(_dict, indent=2))
 
     @property
@@ -0,0 +1,150 @@
+"""Compact typed results of decoded MB Protocol answers"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
+import wmbc.mb_proto.mb_protocol_answers_pb2 as mb_answers
+import wmbc.mb_proto.mb_protocol_enums_pb2 as mb_enums
+
+
+def decode_modbus_p_config(value: int) -> dict:
+    """Decodes periodical Modbus configuration word reported in diagnostics"""
+    modp_cfg = dict()
+    modp_cfg["enable"] = ((value & 0xF0000000) != 0)
+    modp_cfg["port"] = ((value & 0xF000000) >> 24)
+    modp_cfg["interval"] = value & 0xFFFFFF
+    return modp_cfg
+
+
+def _enum_name(enum_type, value: int):
+    """Renders enum value the same way as protobuf JSON format (name or number if unknown)"""
+    try:
+        return enum_type.Name(value)
+    except ValueError:
+        return value
+
+
+@dataclass(slots=True)
+class MbResult(ABC):
+    """Base of the typed answers, see decode_answer"""
+    header: int
+    version: int
+    cmd: int
+
+    @abstractmethod
+    def _frame_dict(self) -> dict:
+        """Renders the answer frame of the result"""
+
+    def to_dict(self) -> dict:
+        """Renders result as dictionary with the layout of the protobuf JSON format"""
+        return {
+            "header": self.header,
+            "version": self.version,
+            "cmd": _enum_name(mb_protocol.Cmd, self.cmd),
+            "payload": {"payload_answer_frame": self._frame_dict()}
+        }
+
+
+@dataclass(slots=True)
+class AckResult(MbResult):
+    acknowladge: int
+
+    @property
+    def is_ack(self) -> bool:
+        return self.acknowladge == mb_answers.ACKNOWLADGE_ACK
+
+    def _frame_dict(self) -> dict:
+        return {"ack_frame": {"acknowladge": _enum_name(mb_answers.Acknowladge, self.acknowladge)}}
+
+
+@dataclass(slots=True)
+class DiagnosticsResult(MbResult):
+    firmware_version: int
+    device_id: int
+    transport_type: int
+    last_reset_cause: int
+    last_fault_address: int
+    device_mode: int
+    antenna_settings: int
+    uptime: int
+    baud_port_0: int
+    baud_port_1: int
+    parity_port_0: int
+    parity_port_1: int
+    stop_bits_port_0: int
+    stop_bits_port_1: int
+    # Raw periodical configuration words, see MBProto.decode_modbus_p_config
+    modbus_configurations: List[int] = field(default_factory=list)
+
+    def decoded_modbus_configurations(self) -> List[dict]:
+        decoded_cfgs = list()
+        for idx, value in enumerate(self.modbus_configurations):
+            cfg = decode_modbus_p_config(value)
+            cfg["id"] = idx + 1
+            decoded_cfgs.append(cfg)
+        return decoded_cfgs
+
+    def _frame_dict(self) -> dict:
+        return {"diagnostics_ans_frame": {
+            "firmware_version": self.firmware_version,
+            "device_id": self.device_id,
+            "transport_type": _enum_name(mb_answers.TransportType, self.transport_type),
+            "last_reset_cause": self.last_reset_cause,
+            "last_fault_address": self.last_fault_address,
+            "device_mode": _enum_name(mb_enums.ModbusMode, self.device_mode),
+            "antenna_settings": _enum_name(mb_enums.AntennaSettings, self.antenna_settings),
+            "uptime": self.uptime,
+            "baud_port_0": _enum_name(mb_enums.PortBaud, self.baud_port_0),
+            "baud_port_1": _enum_name(mb_enums.PortBaud, self.baud_port_1),
+            "parity_port_0": _enum_name(mb_enums.PortParity, self.parity_port_0),
+            "parity_port_1": _enum_name(mb_enums.PortParity, self.parity_port_1),
+            "stop_bits_port_0": _enum_name(mb_enums.PortStopBits, self.stop_bits_port_0),
+            "stop_bits_port_1": _enum_name(mb_enums.PortStopBits, self.stop_bits_port_1),
+            "modbus_configurations": self.decoded_modbus_configurations()
+        }}
+
+
+@dataclass(slots=True)
+class ModbusResponseResult(MbResult):
+    modbus_port: int
+    configuration_index: int
+    modbus_frame: bytes
+    # Decoded Modbus frame rendered instead of the raw bytes, see MBProto.decode_modbus_frame
+    decoded_frame: Optional[dict] = None
+
+    def _frame_dict(self) -> dict:
+        if self.decoded_frame is not None:
+            modbus_frame = self.decoded_frame
+        else:
+            modbus_frame = [f"0x{byte:02x}" for byte in self.modbus_frame]
+        return {"modbus_response_frame": {
+            "modbus_port": _enum_name(mb_enums.ModbusPort, self.modbus_port),
+            "configuration_index": self.configuration_index,
+            "modbus_frame": modbus_frame
+        }}
+
+
+def decode_answer(msg: mb_protocol.MbMessage) -> Optional[MbResult]:
+    """Walks answer frame of the message into a typed result, returns None if the message is not an answer"""
+    if msg.payload.WhichOneof('payload_frame') != 'payload_answer_frame':
+        return None
+    answer_frame = msg.payload.payload_answer_frame
+    frame_type = answer_frame.WhichOneof('answer_frame')
+    if frame_type == 'ack_frame':
+        return AckResult(msg.header, msg.version, msg.cmd, answer_frame.ack_frame.acknowladge)
+    if frame_type == 'modbus_response_frame':
+        frame = answer_frame.modbus_response_frame
+        return ModbusResponseResult(msg.header, msg.version, msg.cmd, frame.modbus_port,
+                                    frame.configuration_index, frame.modbus_frame)
+    if frame_type == 'diagnostics_ans_frame':
+        frame = answer_frame.diagnostics_ans_frame
+        return DiagnosticsResult(
+            msg.header, msg.version, msg.cmd, frame.firmware_version, frame.device_id, frame.transport_type,
+            frame.last_reset_cause, frame.last_fault_address, frame.device_mode, frame.antenna_settings,
+            frame.uptime, frame.baud_port_0, frame.baud_port_1, frame.parity_port_0, frame.parity_port_1,
+            frame.stop_bits_port_0, frame.stop_bits_port_1,
+            [cfg.configuration for cfg in frame.modbus_configurations]
+        )
+    return None
@@ -0,0 +1,150 @@
+"""Lightweight Modbus RTU response parser for the most common function codes"""
+
+import struct
+import sys
+from array import array
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
+
+# Function codes handled natively, anything else falls back to pymodbus
+FC_READ_COILS = 0x01
+FC_READ_DISCRETE_INPUTS = 0x02
+FC_READ_HOLDING_REGISTERS = 0x03
+FC_READ_INPUT_REGISTERS = 0x04
+FC_WRITE_SINGLE_COIL = 0x05
+FC_WRITE_SINGLE_REGISTER = 0x06
+FC_WRITE_MULTIPLE_COILS = 0x0F
+FC_WRITE_MULTIPLE_REGISTERS = 0x10
+
+# Response class names as reported by pymodbus
+RESPONSE_NAMES = {
+    FC_READ_COILS: "ReadCoilsResponse",
+    FC_READ_DISCRETE_INPUTS: "ReadDiscreteInputsResponse",
+    FC_READ_HOLDING_REGISTERS: "ReadHoldingRegistersResponse",
+    FC_READ_INPUT_REGISTERS: "ReadInputRegistersResponse",
+    FC_WRITE_SINGLE_COIL: "WriteSingleCoilResponse",
+    FC_WRITE_SINGLE_REGISTER: "WriteSingleRegisterResponse",
+    FC_WRITE_MULTIPLE_COILS: "WriteMultipleCoilsResponse",
+    FC_WRITE_MULTIPLE_REGISTERS: "WriteMultipleRegistersResponse",
+}
+EXCEPTION_RESPONSE_NAME = "ExceptionResponse"
+
+_WRITE_ECHO = struct.Struct(">HH")
+
+
+def _create_crc_table() -> tuple:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC_TABLE = _create_crc_table()
+
+
+def crc16_modbus(data: Union[bytes, bytearray, memoryview]) -> int:
+    """Calculates CRC-16/MODBUS of data, transmitted low byte first in RTU frames"""
+    crc = 0xFFFF
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def _unpack_bits(data: memoryview) -> List[bool]:
+    return [bool(byte >> bit & 1) for byte in data for bit in range(8)]
+
+
+@dataclass(slots=True)
+class RtuResponse:
+    dev_id: int
+    function_code: int
+    address: int = 0
+    count: int = 0
+    registers: array = field(default_factory=lambda: array("H"))
+    bits: List[bool] = field(default_factory=list)
+    exception_code: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        if self.exception_code is not None:
+            return EXCEPTION_RESPONSE_NAME
+        return RESPONSE_NAMES[self.function_code]
+
+    def to_dict(self) -> dict:
+        """Renders response in the layout of MBProto.decode_modbus_frame"""
+        parameters = {
+            'dev_id': self.dev_id,
+            'transaction_id': 0,
+            'address': self.address,
+            'count': self.count,
+            'bits': self.bits,
+            'registers': self.registers.tolist(),
+            'status': 1,
+        }
+        if self.exception_code is not None:
+            parameters['exception_code'] = self.exception_code
+        parameters['function_code'] = self.function_code
+        return {self.name: parameters}
+
+
+def parse_response(frame: Union[bytes, bytearray, memoryview]) -> Optional[RtuResponse]:
+    """
+    Parses Modbus RTU response frame
+
+    Args:
+        frame: RTU frame including slave address and CRC
+
+    Returns:
+        Parsed response or None if the function code is not handled natively
+
+    Raises:
+        ValueError: Frame is malformed or CRC does not match
+    """
+    frame = memoryview(frame)
+    length = len(frame)
+    if length < 5:
+        raise ValueError("Modbus frame too short")
+    dev_id = frame[0]
+    function_code = frame[1]
+    if function_code & 0x80:
+        expected = 5
+    elif function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS,
+                           FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS):
+        expected = 5 + frame[2]
+    elif function_code in (FC_WRITE_SINGLE_COIL, FC_WRITE_SINGLE_REGISTER,
+                           FC_WRITE_MULTIPLE_COILS, FC_WRITE_MULTIPLE_REGISTERS):
+        expected = 8
+    else:
+        return None
+    if length != expected:
+        raise ValueError(f"Invalid Modbus frame length {length}, expected {expected}")
+    if crc16_modbus(frame[:-2]) != (frame[-2] | frame[-1] << 8):
+        raise ValueError("Modbus frame CRC verification failed")
+
+    if function_code & 0x80:
+        if (function_code & 0x7F) not in RESPONSE_NAMES:
+            return None
+        return RtuResponse(dev_id, function_code, exception_code=frame[2])
+    if function_code in (FC_READ_HOLDING_REGISTERS, FC_READ_INPUT_REGISTERS):
+        if frame[2] & 1:
+            raise ValueError("Odd register data length")
+        registers = array("H")
+        registers.frombytes(frame[3:-2])
+        if sys.byteorder == "little":
+            registers.byteswap()
+        return RtuResponse(dev_id, function_code, registers=registers)
+    if function_code in (FC_READ_COILS, FC_READ_DISCRETE_INPUTS):
+        return RtuResponse(dev_id, function_code, bits=_unpack_bits(frame[3:-2]))
+    address, value = _WRITE_ECHO.unpack_from(frame, 2)
+    if function_code == FC_WRITE_SINGLE_COIL:
+        return RtuResponse(dev_id, function_code, address=address, bits=[value == 0xFF00])
+    if function_code == FC_WRITE_SINGLE_REGISTER:
+        return RtuResponse(dev_id, function_code, address=address, registers=array("H", [value]))
+    return RtuResponse(dev_id, function_code, address=address, count=value)
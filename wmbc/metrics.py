@@ -0,0 +1,274 @@
+"""Metrics registry with Prometheus text exposition"""
+
+import logging
+import threading
+from bisect import bisect_left
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
+import wmbc.mb_proto.mb_protocol_answers_pb2 as mb_answers
+
+# Latency buckets in seconds, spanning single hop answers to heavily loaded meshes
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_CMD_NAMES = {value: name for name, value in mb_protocol.Cmd.items()}
+
+
+def cmd_label(cmd: Optional[int]) -> str:
+    """Label value of MB Protocol command"""
+    if cmd is None:
+        return "unknown"
+    name = _CMD_NAMES.get(cmd)
+    return name if name is not None else str(cmd)
+
+
+def device_label(src: Optional[int]) -> Union[int, str]:
+    """Label value of the device a frame was received from"""
+    return "unknown" if src is None else src
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric():
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _check(self, labels: tuple) -> None:
+        # Called only when labels are seen for the first time, keeping updates to a dictionary lookup
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+
+
+class Counter(_Metric):
+    """
+    Monotonic counter
+
+    Labels are passed positionally in the order of labelnames and converted to strings
+    when the metric is exported, e.g. counter.inc(dst_addr, "CMD_DIAGNOSTICS").
+    """
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = dict()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        value = self._values.get(labels)
+        if value is None:
+            self._check(labels)
+            value = 0
+        self._values[labels] = value + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> list:
+        return [{"labels": dict(zip(self.labelnames, map(str, key))), "value": value}
+                for key, value in dict(self._values).items()]
+
+    def render(self) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                for key, value in dict(self._values).items()]
+
+
+class Gauge(Counter):
+    """Value which can go up and down"""
+    type = "gauge"
+
+    def set(self, *labels, value: float) -> None:
+        if labels not in self._values:
+            self._check(labels)
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Histogram with fixed upper bounds, observations are counted per bucket and summed"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        if list(buckets) != sorted(buckets) or not buckets:
+            raise ValueError("Buckets must be sorted and not empty")
+        self.buckets = tuple(buckets)
+        # Per labels: [count of every bucket..., count over the last bucket, sum]
+        self._values: Dict[tuple, list] = dict()
+
+    def observe(self, *labels, value: float) -> None:
+        counts = self._values.get(labels)
+        if counts is None:
+            self._check(labels)
+            counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def _cumulative(self, counts: list) -> Tuple[list, int]:
+        cumulative, total = [], 0
+        for count in counts[:-1]:
+            total += count
+            cumulative.append(total)
+        return cumulative, total
+
+    def samples(self) -> list:
+        result = []
+        for key, counts in dict(self._values).items():
+            cumulative, total = self._cumulative(list(counts))
+            result.append({
+                "labels": dict(zip(self.labelnames, map(str, key))),
+                "buckets": dict(zip(self.buckets, cumulative)),
+                "count": total,
+                "sum": counts[-1],
+            })
+        return result
+
+    def render(self) -> list:
+        lines = []
+        for key, counts in dict(self._values).items():
+            counts = list(counts)
+            cumulative, total = self._cumulative(counts)
+            for bound, count in zip(self.buckets, cumulative):
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {total}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {total}")
+        return lines
+
+
+class MetricsRegistry():
+    """
+    Collection of metrics exposed together
+
+    Updating a metric is a dictionary update on the caller thread, rendering for the HTTP
+    endpoint works on copies, so a scrape may see updates of one metric done after another
+    one was copied but never blocks the updates.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = dict()
+        self._server = None
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"Metric {metric.name} is already registered with a different definition")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def snapshot(self) -> dict:
+        """Returns current values of all metrics"""
+        return {name: {"type": metric.type, "help": metric.documentation, "samples": metric.samples()}
+                for name, metric in list(self._metrics.items())}
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, metric in list(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+        """Starts HTTP endpoint serving the metrics on /metrics in a background thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        if self._server is not None:
+            raise RuntimeError("Metrics endpoint is already running")
+        registry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug("Metrics endpoint: " + format, *args)
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=self._server.serve_forever, name="wmbc-metrics", daemon=True).start()
+        logging.info(f"Serving metrics on http://{host}:{self._server.server_port}/metrics")
+        return self._server
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Registry of the metrics below, used by the controllers
+REGISTRY = MetricsRegistry()
+
+COMMANDS_SENT = REGISTRY.counter(
+    "wmbc_commands_sent_total", "Commands sent to devices including retries", ("device", "cmd"))
+ANSWERS_RECEIVED = REGISTRY.counter(
+    "wmbc_answers_received_total", "Decoded answers received from devices", ("device", "cmd"))
+NACKS = REGISTRY.counter(
+    "wmbc_nacks_total", "Commands rejected by devices with NACK", ("device", "cmd"))
+RETRIES = REGISTRY.counter(
+    "wmbc_retries_total", "Commands resent after an unanswered attempt", ("device", "cmd"))
+TIMEOUTS = REGISTRY.counter(
+    "wmbc_request_timeouts_total", "Requests whose every attempt timed out", ("device", "cmd"))
+STALE_ANSWERS = REGISTRY.counter(
+    "wmbc_stale_answers_total", "Late or duplicated answers dropped by the in-flight table", ("device",))
+DECODE_ERRORS = REGISTRY.counter(
+    "wmbc_decode_errors_total", "Frames which failed MB Protocol decoding", ("device", "reason"))
+REQUEST_LATENCY = REGISTRY.histogram(
+    "wmbc_request_latency_seconds", "Round trip time of requests answered on the first attempt", ("device", "cmd"))
+RTT_SMOOTHED = REGISTRY.gauge(
+    "wmbc_rtt_smoothed_seconds", "Smoothed round trip time of the device", ("device",))
+RTT_TIMEOUT = REGISTRY.gauge(
+    "wmbc_rtt_timeout_seconds", "Current adaptive timeout of the device", ("device",))
+
+SINK_COMMANDS_SENT = REGISTRY.counter(
+    "wmbc_sink_commands_sent_total", "Commands sent over the sink including retries", ("sink",))
+SINK_TIMEOUTS = REGISTRY.counter(
+    "wmbc_sink_timeouts_total", "Attempts left unanswered after being sent over the sink", ("sink",))
+SINK_OUTSTANDING = REGISTRY.gauge(
+    "wmbc_sink_outstanding_requests", "Requests sent over the sink waiting for their answer", ("sink",))
+SINK_HEALTHY = REGISTRY.gauge(
+    "wmbc_sink_healthy", "1 if the sink is in rotation, 0 if it was taken out after failures", ("sink",))
+
+
+def record_answer(src: int, msg: mb_protocol.MbMessage) -> None:
+    """Counts a decoded answer and its NACK"""
+    cmd = _CMD_NAMES.get(msg.cmd) or str(msg.cmd)
+    ANSWERS_RECEIVED.inc(src, cmd)
+    if msg.payload.payload_answer_frame.ack_frame.acknowladge == mb_answers.ACKNOWLADGE_NACK:
+        NACKS.inc(src, cmd)
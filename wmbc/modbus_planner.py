@@ -0,0 +1,172 @@
+"""Coalescing of Modbus read requests into the fewest one-shot frames"""
+
+import asyncio
+import logging
+import struct
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+from wmbc.mb_proto import modbus_rtu
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.mb_proto.mb_protocol_results import ModbusResponseResult
+
+# Maximum quantity of a single read request (Modbus Application Protocol, sections 6.1 - 6.4),
+# responses of these sizes also fit into the 256 byte RTU frame limit
+MAX_READ_REGISTERS = 125
+MAX_READ_BITS = 2000
+
+READ_LIMITS = {
+    modbus_rtu.FC_READ_COILS: MAX_READ_BITS,
+    modbus_rtu.FC_READ_DISCRETE_INPUTS: MAX_READ_BITS,
+    modbus_rtu.FC_READ_HOLDING_REGISTERS: MAX_READ_REGISTERS,
+    modbus_rtu.FC_READ_INPUT_REGISTERS: MAX_READ_REGISTERS,
+}
+
+_READ_REQUEST = struct.Struct(">BBHH")
+
+
+def build_read_request(slave: int, function_code: int, address: int, count: int) -> bytes:
+    """Builds Modbus RTU read request frame"""
+    pdu = _READ_REQUEST.pack(slave, function_code, address, count)
+    return pdu + modbus_rtu.crc16_modbus(pdu).to_bytes(2, "little")
+
+
+@dataclass(slots=True, frozen=True)
+class ModbusRead:
+    """
+    Logical read of count registers (or bits) starting at address
+
+    Args:
+        dst_addr: Wirepas address of the bridge
+        port: Target port of the bridge (1 or 2)
+        slave: Modbus slave address
+        function_code: Read function code (1, 2, 3 or 4)
+        address: First register/bit address
+        count: Number of registers/bits
+    """
+    dst_addr: int
+    port: int
+    slave: int
+    function_code: int
+    address: int
+    count: int
+
+    def __post_init__(self):
+        limit = READ_LIMITS.get(self.function_code)
+        if limit is None:
+            raise ValueError(f"Unsupported read function code {self.function_code}")
+        if not (1 <= self.count <= limit):
+            raise ValueError(f"Read count must be between 1 and {limit}")
+        if not (0 <= self.address and self.address + self.count <= 0x10000):
+            raise ValueError("Read exceeds register address space")
+
+
+@dataclass(slots=True)
+class CoalescedRead:
+    """Single Modbus request covering one or more logical reads (referenced by their index in the plan input)"""
+    dst_addr: int
+    port: int
+    slave: int
+    function_code: int
+    address: int
+    count: int
+    reads: List[int] = field(default_factory=list)
+
+    @property
+    def frame(self) -> bytes:
+        return build_read_request(self.slave, self.function_code, self.address, self.count)
+
+    def split(self, response: modbus_rtu.RtuResponse, reads: Sequence[ModbusRead]) -> list:
+        """
+        Splits response of the combined request back into values of the logical reads
+
+        Returns:
+            List of (read index, values) tuples, values are registers or bits of the read
+        """
+        if response.exception_code is not None:
+            raise ValueError(f"Modbus exception {response.exception_code}")
+        if response.function_code != self.function_code or response.dev_id != self.slave:
+            raise ValueError("Response does not match the request")
+        if self.function_code in (modbus_rtu.FC_READ_HOLDING_REGISTERS, modbus_rtu.FC_READ_INPUT_REGISTERS):
+            values = response.registers
+        else:
+            values = response.bits
+        if len(values) < self.count:
+            raise ValueError("Response is shorter than the request")
+        result = []
+        for idx in self.reads:
+            offset = reads[idx].address - self.address
+            result.append((idx, values[offset:offset + reads[idx].count]))
+        return result
+
+
+def plan_reads(reads: Sequence[ModbusRead], max_gap: int = 4) -> List[CoalescedRead]:
+    """
+    Merges reads of the same (bridge, port, slave, function code) into the fewest requests
+
+    Reads are sorted by address and merged greedily while the gap between them is at most max_gap
+    registers/bits (gaps are read and thrown away) and the merged request stays within the Modbus
+    quantity limit of the function code.
+    """
+    if max_gap < 0:
+        raise ValueError("Gap must not be negative")
+    groups = dict()
+    for idx, read in enumerate(reads):
+        groups.setdefault((read.dst_addr, read.port, read.slave, read.function_code), []).append(idx)
+
+    plan = []
+    for (dst_addr, port, slave, function_code), indices in groups.items():
+        limit = READ_LIMITS[function_code]
+        indices.sort(key=lambda idx: (reads[idx].address, reads[idx].count))
+        current = None
+        for idx in indices:
+            read = reads[idx]
+            end = read.address + read.count
+            if current is not None:
+                current_end = current.address + current.count
+                if read.address <= current_end + max_gap and max(current_end, end) - current.address <= limit:
+                    current.count = max(current_end, end) - current.address
+                    current.reads.append(idx)
+                    continue
+            current = CoalescedRead(dst_addr, port, slave, function_code, read.address, read.count, [idx])
+            plan.append(current)
+    return plan
+
+
+async def read_all(fleet, reads: Sequence[ModbusRead], max_gap: int = 4, timeout: float = None) -> List[Optional[object]]:
+    """
+    Executes reads with the fewest round trips over a WMBFleetController
+
+    Requests to different bridges and ports run concurrently, requests sharing a bridge port are
+    sent one at a time since the serial bus serves them in order and their answers carry no other
+    correlation than the port.
+
+    Returns:
+        Values of every read in input order, None for reads whose request failed
+    """
+    plan = plan_reads(reads, max_gap)
+    results = [None] * len(reads)
+    # Encoding updates settings of MBProto, the fleet's own instance is left untouched
+    mbproto = MBProto()
+    locks = dict()
+
+    async def execute(coalesced: CoalescedRead):
+        mbproto.target_port = coalesced.port
+        payload_coded = mbproto.create_modbus_oneshot(coalesced.frame)
+        lock = locks.setdefault((coalesced.dst_addr, coalesced.port), asyncio.Lock())
+        try:
+            async with lock:
+                response, msg = await fleet.request(coalesced.dst_addr, payload_coded, timeout=timeout)
+            answer = mbproto.decode_answer(msg)
+            if not isinstance(answer, ModbusResponseResult):
+                raise ValueError("No Modbus response")
+            modbus_response = mbproto.parse_modbus_frame(answer.modbus_frame)
+            if modbus_response is None:
+                raise ValueError("Unsupported Modbus response")
+            for idx, values in coalesced.split(modbus_response, reads):
+                results[idx] = values
+        except Exception as e:
+            logging.warning(f"Read of slave {coalesced.slave} on {coalesced.dst_addr} failed: {e!r}")
+
+    await asyncio.gather(*(execute(coalesced) for coalesced in plan))
+    return results
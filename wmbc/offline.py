@@ -0,0 +1,186 @@
+"""
+Offline encoding and decoding of MB Protocol frames, no sink is needed
+
+Commands are read as NDJSON objects with the keys of the command line options, e.g.
+{"cmd": "modbus_1s", "target_port": 1, "modbus_frame": "0103000000044409"}, and encoded
+frames are written as NDJSON or hex lines. Frames to decode are read as hex lines, binary
+files (one frame per file) or capture files of SnifferCapture, results are written as NDJSON.
+"""
+
+import json
+import logging
+import sys
+from itertools import islice
+from typing import IO, Iterable, Iterator, Optional, Tuple
+
+from wmbc.capture import read_capture
+from wmbc.commands import build_command
+from wmbc.mb_proto import crc16
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.mb_proto.mb_protocol_results import ModbusResponseResult
+
+# Keys of a command object which hold hex encoded bytes
+_HEX_KEYS = ('modbus_frame',)
+
+# Frames whose CRC is verified at once with crc16.verify_many
+DECODE_BATCH_SIZE = 1024
+
+
+def parse_hex(text: str) -> bytes:
+    """Parses hex frame, whitespace, colons and the 0x prefix are ignored"""
+    text = text.strip()
+    if text[:2].lower() == "0x":
+        text = text[2:]
+    return bytes.fromhex(text.replace(":", " "))
+
+
+def _open_text(path: str) -> IO:
+    return sys.stdin if path == "-" else open(path)
+
+
+def read_lines(paths: Iterable[str]) -> Iterator[Tuple[dict, str]]:
+    """Yields (location, line) of non-empty lines which are not # comments, '-' reads stdin"""
+    for path in paths:
+        f = _open_text(path)
+        try:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield {"source": path, "line": number}, line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def read_frames(paths: Iterable[str], input_format: str = "hex") -> Iterator[Tuple[dict, bytes, bool]]:
+    """
+    Yields (location, frame, is_mb_frame) of every frame of the inputs
+
+    is_mb_frame is False for capture records holding Modbus frames already extracted from MB Protocol
+    answers. Malformed hex lines are yielded with None frame so they are reported in order.
+    """
+    if input_format == "hex":
+        for location, line in read_lines(paths):
+            try:
+                yield location, parse_hex(line), True
+            except ValueError:
+                yield location, None, True
+    elif input_format == "binary":
+        for path in paths:
+            if path == "-":
+                yield {"source": path}, sys.stdin.buffer.read(), True
+            else:
+                with open(path, "rb") as f:
+                    yield {"source": path}, f.read(), True
+    elif input_format == "capture":
+        for path in paths:
+            for number, record in enumerate(read_capture(path)):
+                location = {"source": path, "record": number, "timestamp": record.timestamp, "src": record.src}
+                yield location, record.data, record.is_raw
+    else:
+        raise ValueError(f"Unsupported input format: {input_format}")
+
+
+def encode_command(mbproto: MBProto, command: dict) -> bytes:
+    """Encodes command object, see build_command for its keys"""
+    params = dict(command)
+    cmd = params.pop("cmd", None)
+    if cmd is None:
+        raise ValueError("Command type (cmd) is missing")
+    for key in _HEX_KEYS:
+        if isinstance(params.get(key), str):
+            params[key] = parse_hex(params[key])
+    try:
+        return build_command(mbproto, cmd, **params)
+    except TypeError as e:
+        raise ValueError(f"Invalid command parameters: {e}")
+
+
+def encode_commands(mbproto: MBProto, lines: Iterable[Tuple[dict, str]]) -> Iterator[dict]:
+    """Encodes NDJSON command lines, yields records with the hex frame or the error of every line"""
+    for location, line in lines:
+        try:
+            command = json.loads(line)
+            if not isinstance(command, dict):
+                raise ValueError("Command has to be a JSON object")
+            frame = encode_command(mbproto, command)
+        except (ValueError, OSError) as e:
+            yield {**location, "error": str(e)}
+            continue
+        yield {**location, "cmd": command["cmd"], "frame": frame.hex()}
+
+
+def decode_frame(mbproto: MBProto, frame: bytes, decode_modbus_frame: bool = False,
+                 crc_verified: bool = False) -> dict:
+    """Decodes MB Protocol frame into a JSON serializable record"""
+    ret, err, msg = mbproto.decode_response(frame, crc_verified)
+    if not ret:
+        return {"ok": False, "error": err}
+    return message_record(mbproto, msg, decode_modbus_frame)
+
+
+def message_record(mbproto: MBProto, msg, decode_modbus_frame: bool = False) -> dict:
+    """Converts decoded MbMessage into a JSON serializable record"""
+    result = mbproto.decode_answer(msg, decode_modbus_frame)
+    if result is not None:
+        record = {"ok": True, "type": "answer", **result.to_dict()}
+        if isinstance(result, ModbusResponseResult) and result.decoded_frame is None:
+            # Written as hex instead of the list of bytes used for logging, which is many times longer
+            record["payload"]["payload_answer_frame"]["modbus_response_frame"]["modbus_frame"] = \
+                result.modbus_frame.hex()
+        return record
+    from google.protobuf.json_format import MessageToDict
+    return {"ok": True, "type": "command",
+            **MessageToDict(msg, always_print_fields_with_no_presence=True, preserving_proto_field_name=True)}
+
+
+def decode_frames(mbproto: MBProto, frames: Iterable[Tuple[dict, Optional[bytes], bool]],
+                  decode_modbus_frame: bool = False) -> Iterator[dict]:
+    """Decodes frames of read_frames, yields a record for every frame"""
+    frames = iter(frames)
+    while True:
+        batch = list(islice(frames, DECODE_BATCH_SIZE))
+        if not batch:
+            return
+        crc_ok = crc16.verify_many([frame for _, frame, is_mb_frame in batch if frame is not None and is_mb_frame])
+        yield from _decode_batch(mbproto, batch, iter(crc_ok), decode_modbus_frame)
+
+
+def _decode_batch(mbproto: MBProto, batch: list, crc_ok: Iterator[bool], decode_modbus_frame: bool) -> Iterator[dict]:
+    for location, frame, is_mb_frame in batch:
+        if frame is None:
+            yield {**location, "ok": False, "error": "Invalid hex frame"}
+        elif is_mb_frame:
+            # Frames failing the batch check are decoded again to report the CRC error
+            yield {**location, **decode_frame(mbproto, frame, decode_modbus_frame, bool(next(crc_ok)))}
+        else:
+            try:
+                yield {**location, "ok": True, "type": "modbus", "modbus_frame": frame.hex(),
+                       "decoded_frame": mbproto.decode_modbus_frame(frame)}
+            except ValueError as e:
+                yield {**location, "ok": False, "modbus_frame": frame.hex(), "error": str(e)}
+
+
+def write_records(records: Iterable[dict], out: IO, output_format: str = "ndjson") -> int:
+    """Writes records as NDJSON (or only their frames as hex lines), returns number of failed records"""
+    failed = 0
+    for record in records:
+        if "error" in record:
+            failed += 1
+            if output_format == "hex":
+                logging.error(f"{record.get('source')}:{record.get('line')}: {record['error']}")
+                continue
+        if output_format == "hex":
+            out.write(record["frame"] + "\n")
+        else:
+            out.write(json.dumps(record, default=json_default) + "\n")
+    return failed
+
+
+def json_default(value):
+    """Serializes bytes and NumPy values of decoded records, used as default of json.dumps"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
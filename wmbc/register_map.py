@@ -0,0 +1,274 @@
+"""Declarative Modbus register maps compiled into request frames and struct based decoders"""
+
+import json
+import logging
+import struct
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence
+
+from wmbc.mb_proto import modbus_rtu
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.mb_proto.mb_protocol_results import ModbusResponseResult
+from wmbc.modbus_planner import ModbusRead, plan_reads
+
+# Register value types: (struct code, size in registers)
+REGISTER_TYPES = {
+    "uint16": ("H", 1),
+    "int16": ("h", 1),
+    "uint32": ("I", 2),
+    "int32": ("i", 2),
+    "float32": ("f", 2),
+    "uint64": ("Q", 4),
+    "int64": ("q", 4),
+    "float64": ("d", 4),
+}
+# Bit value type of coils and discrete inputs
+BIT_TYPE = "bool"
+
+# Byte order of multi-register values on the wire, A is the most significant byte.
+# CDAB swaps 16-bit words, BADC swaps bytes within the words, DCBA does both.
+WORD_ORDERS = ("ABCD", "CDAB", "BADC", "DCBA")
+
+BIT_FUNCTION_CODES = (modbus_rtu.FC_READ_COILS, modbus_rtu.FC_READ_DISCRETE_INPUTS)
+
+
+@dataclass(slots=True, frozen=True)
+class RegisterDef:
+    """
+    Single value of a register map
+
+    Engineering value is raw value * scale + offset, integer values are kept as int if
+    scale is 1 and offset 0.
+
+    Args:
+        name: Name of the value
+        slave: Modbus slave address
+        function_code: Read function code (1, 2, 3 or 4)
+        address: First register/bit address
+        type: One of REGISTER_TYPES, or "bool" for coils and discrete inputs
+        word_order: One of WORD_ORDERS
+        scale: Multiplier of the raw value
+        offset: Added to the scaled value
+        unit: Unit of the engineering value, informative only
+    """
+    name: str
+    slave: int
+    function_code: int
+    address: int
+    type: str = "uint16"
+    word_order: str = "ABCD"
+    scale: float = 1.0
+    offset: float = 0.0
+    unit: str = ""
+
+    def __post_init__(self):
+        if self.function_code in BIT_FUNCTION_CODES:
+            if self.type != BIT_TYPE:
+                raise ValueError(f"Register {self.name}: bit reads must be of type {BIT_TYPE}")
+        elif self.type not in REGISTER_TYPES:
+            raise ValueError(f"Register {self.name}: unsupported type {self.type}")
+        if self.word_order not in WORD_ORDERS:
+            raise ValueError(f"Register {self.name}: unsupported word order {self.word_order}")
+
+    @property
+    def count(self) -> int:
+        """Number of registers/bits of the value"""
+        if self.type == BIT_TYPE:
+            return 1
+        return REGISTER_TYPES[self.type][1]
+
+    def permutation(self) -> List[int]:
+        """Returns wire byte offset of every byte of the value in big-endian (ABCD) order"""
+        words = self.count
+        word_swap = self.word_order in ("CDAB", "DCBA")
+        byte_swap = self.word_order in ("BADC", "DCBA")
+        result = []
+        for j in range(2 * words):
+            word = words - 1 - j // 2 if word_swap else j // 2
+            byte = 1 - j % 2 if byte_swap else j % 2
+            result.append(2 * word + byte)
+        return result
+
+
+class CompiledBlock():
+    """
+    Single Modbus request of a compiled register map with its precomputed decoder
+
+    Register values are unpacked from the response with one struct covering the whole block
+    (gaps are skipped as pad bytes), values with other than ABCD word order are brought to
+    big-endian order by a precomputed byte permutation first.
+    """
+
+    __slots__ = ("slave", "function_code", "address", "count", "frame", "registers",
+                 "_struct", "_permute", "_byte_count", "_header", "_scaled")
+
+    def __init__(self, slave: int, function_code: int, address: int, count: int, frame: bytes,
+                 registers: Sequence[RegisterDef]):
+        self.slave = slave
+        self.function_code = function_code
+        self.address = address
+        self.count = count
+        self.frame = frame
+        self.registers = sorted(registers, key=lambda register: register.address)
+
+        if function_code in BIT_FUNCTION_CODES:
+            self._byte_count = (count + 7) // 8
+            self._struct = None
+            self._permute = None
+        else:
+            self._byte_count = 2 * count
+            self._compile_registers()
+        self._header = bytes([slave, function_code, self._byte_count])
+        # (index, scale, offset) of values which need scaling
+        self._scaled = [(idx, register.scale, register.offset) for idx, register in enumerate(self.registers)
+                        if register.scale != 1.0 or register.offset != 0.0]
+
+    def _compile_registers(self):
+        fmt = [">"]
+        permutation = list(range(self._byte_count))
+        position = self.address
+        for register in self.registers:
+            if register.address < position:
+                raise ValueError(f"Register {register.name} overlaps another register")
+            if register.address > position:
+                fmt.append(f"{2 * (register.address - position)}x")
+            fmt.append(REGISTER_TYPES[register.type][0])
+            base = 2 * (register.address - self.address)
+            for j, src in enumerate(register.permutation()):
+                permutation[base + j] = base + src
+            position = register.address + register.count
+        if position < self.address + self.count:
+            fmt.append(f"{2 * (self.address + self.count - position)}x")
+        self._struct = struct.Struct("".join(fmt))
+        if permutation == sorted(permutation):
+            self._permute = None
+        else:
+            # Offsets in the RTU frame, register data starts after slave, function code and byte count
+            self._permute = itemgetter(*(3 + src for src in permutation))
+
+    def decode(self, modbus_frame: bytes) -> Dict[str, object]:
+        """
+        Decodes RTU response to the block request into engineering values
+
+        Raises:
+            ValueError: Frame is not a valid response to the block request
+        """
+        frame = memoryview(modbus_frame)
+        if len(frame) != self._byte_count + 5 or frame[:3] != self._header:
+            if len(frame) >= 3 and frame[0] == self.slave and frame[1] == self.function_code | 0x80:
+                raise ValueError(f"Modbus exception {frame[2]}")
+            raise ValueError("Response does not match the request")
+        if modbus_rtu.crc16_modbus(frame[:-2]) != (frame[-2] | frame[-1] << 8):
+            raise ValueError("Modbus frame CRC verification failed")
+
+        if self._struct is None:
+            values = [bool(frame[3 + bit // 8] >> (bit % 8) & 1)
+                      for bit in (register.address - self.address for register in self.registers)]
+        elif self._permute is None:
+            values = list(self._struct.unpack_from(frame, 3))
+        else:
+            values = list(self._struct.unpack(bytes(self._permute(frame))))
+        for idx, scale, offset in self._scaled:
+            values[idx] = values[idx] * scale + offset
+        return {register.name: value for register, value in zip(self.registers, values)}
+
+
+class RegisterMap():
+    """
+    Declarative description of values read from Modbus slaves
+
+    The map is compiled once into the fewest read requests (see modbus_planner.plan_reads)
+    with prebuilt RTU frames and decoders, so decoding a response needs no per-message
+    interpretation.
+    """
+
+    def __init__(self, registers: Sequence[RegisterDef], max_gap: int = 4):
+        names = set()
+        for register in registers:
+            if register.name in names:
+                raise ValueError(f"Duplicated register name {register.name}")
+            names.add(register.name)
+        self._registers = list(registers)
+        self._blocks = self._compile(max_gap)
+
+    @classmethod
+    def from_dict(cls, description: dict, max_gap: int = 4) -> 'RegisterMap':
+        """
+        Creates register map from a dictionary (e.g. loaded from JSON)
+
+        Top level "slave", "function_code", "type" and "word_order" keys are defaults of the
+        entries of the "registers" list, which are keyword arguments of RegisterDef.
+        """
+        defaults = {key: description[key] for key in ("slave", "function_code", "type", "word_order")
+                    if key in description}
+        try:
+            registers = [RegisterDef(**{**defaults, **entry}) for entry in description["registers"]]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid register map: {e}") from e
+        return cls(registers, max_gap)
+
+    @classmethod
+    def load(cls, path: str, max_gap: int = 4) -> 'RegisterMap':
+        """Loads register map from a JSON file"""
+        with open(path) as f:
+            return cls.from_dict(json.load(f), max_gap)
+
+    def _compile(self, max_gap: int) -> List[CompiledBlock]:
+        # The map is independent of the bridge placement, address and port are filled in on read
+        reads = [ModbusRead(0, 0, register.slave, register.function_code, register.address, register.count)
+                 for register in self._registers]
+        blocks = []
+        for coalesced in plan_reads(reads, max_gap):
+            blocks.append(CompiledBlock(coalesced.slave, coalesced.function_code, coalesced.address,
+                                        coalesced.count, coalesced.frame,
+                                        [self._registers[idx] for idx in coalesced.reads]))
+        return blocks
+
+    @property
+    def registers(self) -> List[RegisterDef]:
+        return self._registers
+
+    @property
+    def blocks(self) -> List[CompiledBlock]:
+        return self._blocks
+
+    def decode(self, modbus_frame: bytes, block: Optional[CompiledBlock] = None) -> Dict[str, object]:
+        """
+        Decodes RTU response into engineering values
+
+        Responses carry no register address, so without block the response is matched
+        by slave, function code and length and must match exactly one block.
+        """
+        if block is None:
+            candidates = [candidate for candidate in self._blocks
+                          if len(modbus_frame) >= 3 and modbus_frame[:3] == candidate._header]
+            if len(candidates) != 1:
+                raise ValueError("Response does not match exactly one block of the map")
+            block = candidates[0]
+        return block.decode(modbus_frame)
+
+    async def read(self, fleet, dst_addr: int, port: int = 1, timeout: float = None) -> Dict[str, object]:
+        """
+        Reads all values of the map from a bridge over a WMBFleetController
+
+        Blocks are requested one at a time as they share the serial bus of the port.
+
+        Returns:
+            Engineering values by name, values of the blocks whose request failed are missing
+        """
+        # Encoding updates settings of MBProto, the fleet's own instance is left untouched
+        mbproto = MBProto()
+        mbproto.target_port = port
+        values = dict()
+        for block in self._blocks:
+            payload_coded = mbproto.create_modbus_oneshot(block.frame)
+            try:
+                response, msg = await fleet.request(dst_addr, payload_coded, timeout=timeout)
+                answer = mbproto.decode_answer(msg)
+                if not isinstance(answer, ModbusResponseResult):
+                    raise ValueError("No Modbus response")
+                values.update(block.decode(answer.modbus_frame))
+            except Exception as e:
+                logging.warning(f"Read of slave {block.slave} on {dst_addr} failed: {e!r}")
+        return values
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from time import monotonic
+from typing import Callable, Iterator, Optional
+
+import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
+from wmbc import metrics
+from wmbc.mb_proto import modbus_rtu
+
+# Modbus function codes which only read data and are safe to repeat
+MODBUS_READ_FUNCTION_CODES = (
+    modbus_rtu.FC_READ_COILS,
+    modbus_rtu.FC_READ_DISCRETE_INPUTS,
+    modbus_rtu.FC_READ_HOLDING_REGISTERS,
+    modbus_rtu.FC_READ_INPUT_REGISTERS,
+)
+
+
+@dataclass(slots=True, frozen=True)
+class RetryPolicy:
+    """
+    Retry policy of a command
+
+    Args:
+        max_attempts: Number of sends including the first one
+        backoff: Multiplier of the timeout applied after every unanswered attempt
+        deadline: Total time budget of all attempts in seconds, unlimited if None
+    """
+    max_attempts: int = 3
+    backoff: float = 2.0
+    deadline: Optional[float] = None
+
+    def __post_init__(self):
+        if self.max_attempts < 1:
+            raise ValueError("At least one attempt is required")
+        if self.backoff < 1.0:
+            raise ValueError("Backoff must not shrink timeouts")
+
+    def attempt_timeouts(self, timeout: float) -> Iterator[float]:
+        """Yields timeout of every attempt starting with timeout, truncated by the deadline"""
+        remaining = self.deadline
+        for _ in range(self.max_attempts):
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                timeout = min(timeout, remaining)
+                remaining -= timeout
+            yield timeout
+            timeout *= self.backoff
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+DEFAULT_RETRY_POLICIES = {
+    mb_protocol.Cmd.CMD_DEV_RESET: NO_RETRY,
+    mb_protocol.Cmd.CMD_DIAGNOSTICS: RetryPolicy(),
+    mb_protocol.Cmd.CMD_DEV_MODE: RetryPolicy(),
+    mb_protocol.Cmd.CMD_ANTENA_CONFIG: RetryPolicy(),
+    mb_protocol.Cmd.CMD_PORT_CONFIG: RetryPolicy(),
+    mb_protocol.Cmd.CMD_MODBUS_ONE_SHOT: RetryPolicy(),
+    mb_protocol.Cmd.CMD_MODBUS_PERIODICAL: RetryPolicy(),
+}
+
+
+def is_idempotent(cmd_msg: mb_protocol.MbMessage) -> bool:
+    """
+    Checks if the command can be safely sent more than once
+
+    Device reset is never repeated, Modbus one-shot frames are repeated only for read
+    function codes. Configuration commands set absolute values and are safe to repeat.
+    """
+    if cmd_msg.cmd == mb_protocol.Cmd.CMD_DEV_RESET:
+        return False
+    if cmd_msg.cmd == mb_protocol.Cmd.CMD_MODBUS_ONE_SHOT:
+        modbus_frame = cmd_msg.payload.payload_cmd_frame.modbus_one_shot_frame.modbus_frame
+        return len(modbus_frame) > 1 and modbus_frame[1] in MODBUS_READ_FUNCTION_CODES
+    return True
+
+
+def policy_for(cmd_msg: mb_protocol.MbMessage, policies: Optional[dict] = None) -> RetryPolicy:
+    """Returns retry policy of the command, non-idempotent commands are never retried"""
+    if not is_idempotent(cmd_msg):
+        return NO_RETRY
+    if policies is None:
+        policies = DEFAULT_RETRY_POLICIES
+    return policies.get(cmd_msg.cmd, NO_RETRY)
+
+
+async def request_with_retry(inflight, rtt, send: Callable[[], None], dst_addr: int, cmd: int,
+                             index: Optional[int], policy: RetryPolicy, timeout: float):
+    """
+    Sends a command until it is answered or its retry policy is exhausted
+
+    A single in-flight entry serves all attempts, the answer to any of them completes the request
+    and answers to the remaining attempts are dropped as duplicates by the in-flight table.
+    RTT is sampled only from commands answered on the first attempt (Karn's rule).
+
+    Args:
+        inflight: InFlightTable the answers are matched in
+        rtt: RttEstimator updated with samples and timeouts
+        send: Sends the command once
+        dst_addr, cmd, index: Correlation key of the command
+        policy: Retry policy of the command
+        timeout: Timeout of the first attempt in seconds
+
+    Returns:
+        Object the in-flight request was resolved with
+
+    Raises:
+        asyncio.TimeoutError: No attempt was answered in time
+    """
+    request = inflight.add(dst_addr, cmd, index)
+    request.attempts = 0
+    cmd_label = metrics.cmd_label(cmd)
+    try:
+        for attempt_timeout in policy.attempt_timeouts(timeout):
+            if request.attempts:
+                logging.debug(f"Retrying command {cmd} to {dst_addr}, attempt {request.attempts + 1}")
+                metrics.RETRIES.inc(dst_addr, cmd_label)
+            request.attempts += 1
+            request.sent_at = monotonic()
+            # Late answers to this attempt may arrive until about one RTO after it was sent
+            request.stale_window = rtt.timeout(dst_addr)
+            send()
+            try:
+                result = await asyncio.wait_for(asyncio.shield(request.future), timeout=attempt_timeout)
+            except asyncio.TimeoutError:
+                rtt.backoff(dst_addr)
+                metrics.RTT_TIMEOUT.set(dst_addr, value=rtt.timeout(dst_addr))
+                continue
+            if request.attempts == 1:
+                sample = monotonic() - request.sent_at
+                rtt.observe(dst_addr, sample)
+                metrics.REQUEST_LATENCY.observe(dst_addr, cmd_label, value=sample)
+                estimate = rtt.estimate(dst_addr)
+                metrics.RTT_SMOOTHED.set(dst_addr, value=estimate.srtt)
+                metrics.RTT_TIMEOUT.set(dst_addr, value=estimate.rto)
+            return result
+    except BaseException:
+        inflight.discard(request)
+        raise
+    inflight.expire(request)
+    metrics.TIMEOUTS.inc(dst_addr, cmd_label)
+    raise asyncio.TimeoutError(f"No response from the device {dst_addr}")
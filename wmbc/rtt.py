@@ -0,0 +1,95 @@
+from typing import Optional
+
+
+class RttEstimate():
+    """Smoothed round trip time state of a single destination address"""
+
+    __slots__ = ("srtt", "rttvar", "rto", "samples", "last_rtt", "timeouts")
+
+    def __init__(self, rto: float):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = rto
+        self.samples = 0
+        self.last_rtt = None
+        self.timeouts = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "srtt": self.srtt,
+            "rttvar": self.rttvar,
+            "rto": self.rto,
+            "samples": self.samples,
+            "last_rtt": self.last_rtt,
+            "timeouts": self.timeouts
+        }
+
+
+class RttEstimator():
+    """
+    Per-destination round trip time estimator (TCP RTO-style, RFC 6298)
+
+    The first sample initializes SRTT = RTT and RTTVAR = RTT / 2, further samples update
+    RTTVAR = (1 - beta) * RTTVAR + beta * |SRTT - RTT| and SRTT = (1 - alpha) * SRTT + alpha * RTT.
+    Timeout is RTO = SRTT + k * RTTVAR clamped to [min_rto, max_rto]. Every timeout doubles RTO
+    until the next valid sample. Samples must not be taken from retransmitted commands (Karn's rule).
+    Initial RTO used before the first sample is clamped to the same limits.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_rto: float = 5.0, min_rto: float = 0.5, max_rto: float = 60.0):
+        if not (0 < min_rto <= max_rto):
+            raise ValueError("RTO limits must satisfy 0 < min_rto <= max_rto")
+        self._initial_rto = min(max(initial_rto, min_rto), max_rto)
+        self._min_rto = min_rto
+        self._max_rto = max_rto
+        self._estimates = dict()
+
+    def _get(self, dst_addr: int) -> RttEstimate:
+        estimate = self._estimates.get(dst_addr)
+        if estimate is None:
+            estimate = self._estimates[dst_addr] = RttEstimate(self._initial_rto)
+        return estimate
+
+    def observe(self, dst_addr: int, rtt: float) -> None:
+        """Updates estimate of the destination with measured round trip time in seconds"""
+        estimate = self._get(dst_addr)
+        if estimate.srtt is None:
+            estimate.srtt = rtt
+            estimate.rttvar = rtt / 2
+        else:
+            estimate.rttvar = (1 - self.BETA) * estimate.rttvar + self.BETA * abs(estimate.srtt - rtt)
+            estimate.srtt = (1 - self.ALPHA) * estimate.srtt + self.ALPHA * rtt
+        estimate.rto = min(max(estimate.srtt + self.K * estimate.rttvar, self._min_rto), self._max_rto)
+        estimate.samples += 1
+        estimate.last_rtt = rtt
+
+    def backoff(self, dst_addr: int) -> None:
+        """Doubles timeout of the destination after a command timed out"""
+        estimate = self._get(dst_addr)
+        estimate.rto = min(estimate.rto * 2, self._max_rto)
+        estimate.timeouts += 1
+
+    def timeout(self, dst_addr: int) -> float:
+        """Returns current timeout for a command sent to the destination"""
+        estimate = self._estimates.get(dst_addr)
+        return self._initial_rto if estimate is None else estimate.rto
+
+    def retry_deadline(self, dst_addr: int, attempts: int) -> float:
+        """Returns total time needed for attempts with exponentially backed off timeouts"""
+        rto = self.timeout(dst_addr)
+        deadline = 0.0
+        for _ in range(attempts):
+            deadline += rto
+            rto = min(rto * 2, self._max_rto)
+        return deadline
+
+    def estimate(self, dst_addr: int) -> Optional[RttEstimate]:
+        return self._estimates.get(dst_addr)
+
+    def estimates(self) -> dict:
+        """Returns current estimates of all destinations for monitoring"""
+        return {dst_addr: estimate.as_dict() for dst_addr, estimate in self._estimates.items()}
@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+import logging
+import random
+from itertools import count
+from time import monotonic
+from typing import Optional
+
+# Share of the period left between the deadline of a poll and the next due time of its job
+DEADLINE_MARGIN = 0.1
+
+
+class PollJob():
+    """Recurring command sent to a single device, see PollScheduler.add_job"""
+
+    __slots__ = ("dst_addr", "payload_coded", "period", "timeout", "_callback", "callback_args",
+                 "cancelled", "next_due", "in_flight", "polls", "missed", "timeouts", "last_lateness",
+                 "max_lateness", "total_lateness")
+
+    def __init__(self, dst_addr: int, payload_coded: bytes, period: float, timeout: Optional[float],
+                 _callback=None, callback_args=None):
+        self.dst_addr = dst_addr
+        self.payload_coded = payload_coded
+        self.period = period
+        self.timeout = timeout
+        self._callback = _callback
+        self.callback_args = callback_args
+        self.cancelled = False
+        self.next_due = 0.0
+        self.in_flight = False
+        # Statistics
+        self.polls = 0
+        self.missed = 0
+        self.timeouts = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "dst_addr": self.dst_addr,
+            "period": self.period,
+            "polls": self.polls,
+            "missed": self.missed,
+            "timeouts": self.timeouts,
+            "last_lateness": self.last_lateness,
+            "max_lateness": self.max_lateness,
+            "mean_lateness": self.total_lateness / self.polls if self.polls else 0.0
+        }
+
+
+class PollScheduler():
+    """
+    Drift-free scheduler of periodic polls over a WMBFleetController
+
+    Jobs live in a heap ordered by their next due time on the monotonic clock. Every poll is due
+    exactly one period after the previous due time regardless of round trip time or timeouts,
+    polls of different jobs are sent without waiting for each other (up to max_outstanding at once)
+    and the first poll of each job is spread randomly over phase_spread * period to avoid phase
+    locking of jobs added together. All attempts of a poll have to end DEADLINE_MARGIN of the period
+    before the next poll of its job is due, a poll which is due while the previous one of the same
+    job is still in flight is skipped.
+    Lateness (actual send time - due time) is tracked per job. When a job falls behind by a whole
+    period the missed polls are skipped and counted.
+    """
+
+    def __init__(self, fleet, max_outstanding: int = 256, phase_spread: float = 1.0, seed: Optional[int] = None):
+        if not (0.0 <= phase_spread <= 1.0):
+            raise ValueError("Phase spread must be between 0 and 1")
+        self._fleet = fleet
+        self._heap = list()
+        self._seq = count()
+        self._phase_spread = phase_spread
+        self._random = random.Random(seed)
+        self._outstanding = asyncio.Semaphore(max_outstanding)
+        self._wakeup = asyncio.Event()
+        self._tasks = set()
+
+    def add_job(self, dst_addr: int, payload_coded: bytes, period: float, timeout: Optional[float] = None,
+                _callback=None, callback_args=None) -> PollJob:
+        """
+        Adds recurring poll
+
+        Args:
+            dst_addr: Wirepas address of the device
+            payload_coded: Command frame created with MBProto
+            period: Poll period in seconds
+            timeout: Time to wait for each answer in seconds, adaptive per device RTT if None
+            _callback: Called as _callback(msg, callback_args) for every answer
+            callback_args: Arguments passed to the callback
+        """
+        if period <= 0:
+            raise ValueError("Period must be positive")
+        job = PollJob(dst_addr, payload_coded, period, timeout, _callback, callback_args)
+        job.next_due = monotonic() + self._random.uniform(0, period * self._phase_spread)
+        heapq.heappush(self._heap, (job.next_due, next(self._seq), job))
+        self._wakeup.set()
+        return job
+
+    def remove_job(self, job: PollJob) -> None:
+        job.cancelled = True
+
+    @property
+    def jobs(self) -> list:
+        return [job for _, _, job in self._heap if not job.cancelled]
+
+    def stats(self) -> list:
+        return [job.stats() for job in self.jobs]
+
+    async def _poll(self, job: PollJob, deadline: float):
+        try:
+            response, msg = await self._fleet.request(job.dst_addr, job.payload_coded, timeout=job.timeout,
+                                                      deadline=deadline)
+        except asyncio.TimeoutError:
+            job.timeouts += 1
+            logging.warning(f"No response from the device {job.dst_addr}!")
+            return
+        except Exception:
+            logging.exception(f"Failed to poll device {job.dst_addr}")
+            return
+        finally:
+            job.in_flight = False
+            self._outstanding.release()
+        if job._callback is not None:
+            try:
+                job._callback(msg, job.callback_args)
+            except Exception:
+                logging.exception(f"Callback of device {job.dst_addr} failed")
+
+    def _start_poll(self, job: PollJob, now: float):
+        lateness = now - job.next_due
+        # Deadline is measured from the due time, a late send does not push the end of the poll
+        # past the next due time
+        deadline = max(job.period * (1.0 - DEADLINE_MARGIN) - lateness, job.period * DEADLINE_MARGIN)
+        job.polls += 1
+        job.last_lateness = lateness
+        job.total_lateness += lateness
+        if lateness > job.max_lateness:
+            job.max_lateness = lateness
+        job.in_flight = True
+        task = asyncio.ensure_future(self._poll(job, deadline))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self):
+        logging.info("Entering scheduled polling, press Ctrl+C to exit")
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            due, _, job = self._heap[0]
+            if job.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            delay = due - monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            if job.in_flight:
+                logging.debug(f"Previous poll of device {job.dst_addr} is still in flight, skipping")
+                job.missed += 1
+                now = monotonic()
+            else:
+                await self._outstanding.acquire()
+                now = monotonic()
+                self._start_poll(job, now)
+            # Next due time is derived from the previous one, not from the send time
+            job.next_due = due + job.period
+            if job.next_due <= now:
+                skipped = int((now - job.next_due) // job.period) + 1
+                job.missed += skipped
+                job.next_due += skipped * job.period
+            heapq.heappush(self._heap, (job.next_due, next(self._seq), job))
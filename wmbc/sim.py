@@ -0,0 +1,555 @@
+"""In-process simulation of a Wirepas sink and Wireless Modbus Bridge devices"""
+
+import asyncio
+import logging
+import random
+import struct
+from dataclasses import dataclass
+from time import monotonic
+from typing import Dict, Iterable, List, Optional
+
+import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
+import wmbc.mb_proto.mb_protocol_answers_pb2 as mb_answers
+import wmbc.mb_proto.mb_protocol_enums_pb2 as mb_enums
+from wmbc.mb_proto import crc16
+from wmbc.mb_proto import modbus_rtu
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+
+# Endpoints of MB Protocol, commands are sent from MB_PROTO_SRC_EP to MB_PROTO_DST_EP
+MB_PROTO_SRC_EP = 77
+MB_PROTO_DST_EP = 66
+BROADCAST_ADDRESS = 0xFFFFFFFF
+MAX_CONFIGURATIONS = 64
+
+# Modbus exception codes
+EXC_ILLEGAL_FUNCTION = 0x01
+EXC_ILLEGAL_DATA_ADDRESS = 0x02
+EXC_ILLEGAL_DATA_VALUE = 0x03
+
+_ADDRESS_COUNT = struct.Struct(">HH")
+
+
+def _rtu_frame(pdu: bytes) -> bytes:
+    return pdu + modbus_rtu.crc16_modbus(pdu).to_bytes(2, "little")
+
+
+class ModbusSlaveSim():
+    """
+    Simulated Modbus RTU slave
+
+    Serves function codes 1-6, 15 and 16 from sparse tables (unset addresses read as 0),
+    anything else is answered with an illegal function exception.
+    """
+
+    def __init__(self, slave: int = 1):
+        if not (1 <= slave <= 247):
+            raise ValueError("Slave address must be between 1 and 247")
+        self.slave = slave
+        self.coils: Dict[int, bool] = dict()
+        self.discrete_inputs: Dict[int, bool] = dict()
+        self.holding_registers: Dict[int, int] = dict()
+        self.input_registers: Dict[int, int] = dict()
+        self.requests = 0
+
+    def _exception(self, function_code: int, code: int) -> bytes:
+        return _rtu_frame(bytes([self.slave, function_code | 0x80, code]))
+
+    @staticmethod
+    def _pack_bits(table: dict, address: int, count: int) -> bytes:
+        data = bytearray((count + 7) // 8)
+        for bit in range(count):
+            if table.get(address + bit):
+                data[bit // 8] |= 1 << (bit % 8)
+        return bytes(data)
+
+    def handle(self, frame: bytes) -> Optional[bytes]:
+        """Returns RTU response to the request frame, None if the frame is not addressed to the slave or invalid"""
+        if len(frame) < 4 or frame[0] != self.slave:
+            return None
+        if modbus_rtu.crc16_modbus(frame[:-2]) != (frame[-2] | frame[-1] << 8):
+            return None
+        self.requests += 1
+        function_code = frame[1]
+        if function_code not in modbus_rtu.RESPONSE_NAMES:
+            return self._exception(function_code, EXC_ILLEGAL_FUNCTION)
+        if len(frame) < 8:
+            return self._exception(function_code, EXC_ILLEGAL_DATA_VALUE)
+        address, value = _ADDRESS_COUNT.unpack_from(frame, 2)
+
+        if function_code in (modbus_rtu.FC_READ_COILS, modbus_rtu.FC_READ_DISCRETE_INPUTS):
+            if not (1 <= value <= 2000):
+                return self._exception(function_code, EXC_ILLEGAL_DATA_VALUE)
+            if address + value > 0x10000:
+                return self._exception(function_code, EXC_ILLEGAL_DATA_ADDRESS)
+            table = self.coils if function_code == modbus_rtu.FC_READ_COILS else self.discrete_inputs
+            data = self._pack_bits(table, address, value)
+            return _rtu_frame(bytes([self.slave, function_code, len(data)]) + data)
+        if function_code in (modbus_rtu.FC_READ_HOLDING_REGISTERS, modbus_rtu.FC_READ_INPUT_REGISTERS):
+            if not (1 <= value <= 125):
+                return self._exception(function_code, EXC_ILLEGAL_DATA_VALUE)
+            if address + value > 0x10000:
+                return self._exception(function_code, EXC_ILLEGAL_DATA_ADDRESS)
+            table = (self.holding_registers if function_code == modbus_rtu.FC_READ_HOLDING_REGISTERS
+                     else self.input_registers)
+            data = struct.pack(f">{value}H", *(table.get(address + idx, 0) for idx in range(value)))
+            return _rtu_frame(bytes([self.slave, function_code, len(data)]) + data)
+        if function_code == modbus_rtu.FC_WRITE_SINGLE_COIL:
+            if value not in (0x0000, 0xFF00):
+                return self._exception(function_code, EXC_ILLEGAL_DATA_VALUE)
+            self.coils[address] = value == 0xFF00
+            return frame[:8]
+        if function_code == modbus_rtu.FC_WRITE_SINGLE_REGISTER:
+            self.holding_registers[address] = value
+            return frame[:8]
+
+        # Multiple writes carry byte count and data after address and quantity
+        if len(frame) < 9 or len(frame) != 9 + frame[6]:
+            return self._exception(function_code, EXC_ILLEGAL_DATA_VALUE)
+        data = frame[7:7 + frame[6]]
+        if address + value > 0x10000:
+            return self._exception(function_code, EXC_ILLEGAL_DATA_ADDRESS)
+        if function_code == modbus_rtu.FC_WRITE_MULTIPLE_COILS:
+            if not (1 <= value <= 1968) or len(data) != (value + 7) // 8:
+                return self._exception(function_code, EXC_ILLEGAL_DATA_VALUE)
+            for bit in range(value):
+                self.coils[address + bit] = bool(data[bit // 8] >> (bit % 8) & 1)
+        else:
+            if not (1 <= value <= 123) or len(data) != 2 * value:
+                return self._exception(function_code, EXC_ILLEGAL_DATA_VALUE)
+            for idx, register in enumerate(struct.unpack(f">{value}H", data)):
+                self.holding_registers[address + idx] = register
+        return _rtu_frame(frame[:6])
+
+
+@dataclass(slots=True)
+class PeriodicConfiguration:
+    port: int
+    interval: int
+    modbus_frame: bytes
+
+
+class WMBDeviceEmulator():
+    """
+    Simulated Wireless Modbus Bridge
+
+    Answers MB Protocol commands like the device: configuration commands are acknowledged and
+    kept in the device state reported by diagnostics, one-shot Modbus frames are served by the
+    simulated slaves of the target port and periodical configurations are stored in 64 slots
+    (interval 0 disables a slot). Invalid commands are answered with NACK.
+    """
+
+    def __init__(self, address: int, slaves: Optional[Dict[int, List[ModbusSlaveSim]]] = None,
+                 firmware_version: int = 0x010000, device_id: Optional[int] = None):
+        self.address = address
+        # Slaves by port (1 or 2)
+        self.slaves = {1: [ModbusSlaveSim(1)], 2: []} if slaves is None else slaves
+        self.firmware_version = firmware_version
+        self.device_id = address if device_id is None else device_id
+        self.device_mode = mb_enums.MODBUS_MODE_MASTER
+        self.antenna_settings = mb_enums.ANTENNA_INTERNAL
+        self.port_settings = {
+            port: (mb_enums.PORT_BAUD_9600, mb_enums.PORT_PARITY_NONE, mb_enums.PORT_STOP_BITS_1)
+            for port in (mb_enums.MODBUS_PORT_ZERO, mb_enums.MODBUS_PORT_ONE)
+        }
+        self.configurations: Dict[int, PeriodicConfiguration] = dict()
+        self.last_reset_cause = 0
+        self.commands = 0
+        self._boot = monotonic()
+
+    @staticmethod
+    def _answer(cmd: int) -> mb_protocol.MbMessage:
+        message = mb_protocol.MbMessage()
+        message.header = MBProto.PROTOCOL_HEADER
+        message.version = MBProto.PROTOCOL_VERSION
+        message.cmd = cmd
+        return message
+
+    @staticmethod
+    def _encode(message: mb_protocol.MbMessage) -> bytes:
+        data = message.SerializeToString()
+        crc = crc16.crc16(data)
+        return data + bytes([crc >> 8, crc & 0xFF])
+
+    def _ack(self, cmd: int, ack: bool = True) -> bytes:
+        message = self._answer(cmd)
+        message.payload.payload_answer_frame.ack_frame.acknowladge = (
+            mb_answers.ACKNOWLADGE_ACK if ack else mb_answers.ACKNOWLADGE_NACK)
+        return self._encode(message)
+
+    def _diagnostics(self) -> bytes:
+        message = self._answer(mb_protocol.Cmd.CMD_DIAGNOSTICS)
+        frame = message.payload.payload_answer_frame.diagnostics_ans_frame
+        frame.firmware_version = self.firmware_version
+        frame.device_id = self.device_id
+        frame.transport_type = mb_answers.TRANSPORT_TYPE_WIREPAS
+        frame.last_reset_cause = self.last_reset_cause
+        frame.last_fault_address = 0
+        frame.device_mode = self.device_mode
+        frame.antenna_settings = self.antenna_settings
+        frame.uptime = int(monotonic() - self._boot)
+        frame.baud_port_0, frame.parity_port_0, frame.stop_bits_port_0 = self.port_settings[mb_enums.MODBUS_PORT_ZERO]
+        frame.baud_port_1, frame.parity_port_1, frame.stop_bits_port_1 = self.port_settings[mb_enums.MODBUS_PORT_ONE]
+        for idx in range(1, MAX_CONFIGURATIONS + 1):
+            cfg = self.configurations.get(idx)
+            value = 0 if cfg is None else 0x10000000 | (cfg.port & 0xF) << 24 | (cfg.interval & 0xFFFFFF)
+            frame.modbus_configurations.add(configuration=value)
+        return self._encode(message)
+
+    def modbus_request(self, port: int, modbus_frame: bytes) -> Optional[bytes]:
+        """Sends Modbus frame to the slaves of the port, returns the response of the addressed slave"""
+        for slave in self.slaves.get(port, []):
+            response = slave.handle(modbus_frame)
+            if response is not None:
+                return response
+        return None
+
+    def modbus_answer(self, cmd: int, port: int, configuration_index: int, modbus_frame: bytes) -> Optional[bytes]:
+        """Returns Modbus response answer of the device, None if no slave answered"""
+        response = self.modbus_request(port, modbus_frame)
+        if response is None:
+            return None
+        message = self._answer(cmd)
+        frame = message.payload.payload_answer_frame.modbus_response_frame
+        frame.modbus_port = port
+        frame.configuration_index = configuration_index
+        frame.modbus_frame = response
+        return self._encode(message)
+
+    def periodic_answer(self, configuration_index: int) -> Optional[bytes]:
+        cfg = self.configurations.get(configuration_index)
+        if cfg is None:
+            return None
+        return self.modbus_answer(mb_protocol.Cmd.CMD_MODBUS_PERIODICAL, cfg.port, configuration_index,
+                                  cfg.modbus_frame)
+
+    def handle(self, payload: bytes) -> List[bytes]:
+        """Handles MB Protocol command, returns encoded answers"""
+        if len(payload) < 3 or crc16.crc16(payload[:-2]) != int.from_bytes(payload[-2:], "big"):
+            return []
+        message = mb_protocol.MbMessage()
+        try:
+            message.ParseFromString(payload[:-2])
+        except Exception:
+            return []
+        self.commands += 1
+        cmd = message.cmd
+        cmd_frame = message.payload.payload_cmd_frame
+        if cmd == mb_protocol.Cmd.CMD_DEV_RESET:
+            self._boot = monotonic()
+            self.last_reset_cause = 1
+            return [self._ack(cmd)]
+        if cmd == mb_protocol.Cmd.CMD_DIAGNOSTICS:
+            return [self._diagnostics()]
+        if cmd == mb_protocol.Cmd.CMD_DEV_MODE:
+            mode = cmd_frame.device_mode_frame.device_mode
+            if mode not in (mb_enums.MODBUS_MODE_MASTER, mb_enums.MODBUS_MODE_SNIFFER):
+                return [self._ack(cmd, False)]
+            self.device_mode = mode
+            return [self._ack(cmd)]
+        if cmd == mb_protocol.Cmd.CMD_ANTENA_CONFIG:
+            antenna = cmd_frame.antenna_settings_frame.antenna_settings
+            if antenna not in (mb_enums.ANTENNA_INTERNAL, mb_enums.ANTENNA_EXTERNAL):
+                return [self._ack(cmd, False)]
+            self.antenna_settings = antenna
+            return [self._ack(cmd)]
+        if cmd == mb_protocol.Cmd.CMD_PORT_CONFIG:
+            frame = cmd_frame.port_settings_frame
+            if frame.modbus_port not in self.port_settings:
+                return [self._ack(cmd, False)]
+            self.port_settings[frame.modbus_port] = (frame.port_baud, frame.port_parity, frame.port_stop_bits)
+            return [self._ack(cmd)]
+        if cmd == mb_protocol.Cmd.CMD_MODBUS_ONE_SHOT:
+            frame = cmd_frame.modbus_one_shot_frame
+            answer = self.modbus_answer(cmd, frame.modbus_port, 0, frame.modbus_frame)
+            return [answer] if answer is not None else []
+        if cmd == mb_protocol.Cmd.CMD_MODBUS_PERIODICAL:
+            frame = cmd_frame.modbus_periodical_frame
+            if not (1 <= frame.configuration_index <= MAX_CONFIGURATIONS):
+                return [self._ack(cmd, False)]
+            if frame.interval == 0:
+                self.configurations.pop(frame.configuration_index, None)
+            else:
+                self.configurations[frame.configuration_index] = PeriodicConfiguration(
+                    frame.modbus_port, frame.interval, bytes(frame.modbus_frame))
+            return [self._ack(cmd)]
+        return [self._ack(cmd, False)]
+
+
+@dataclass
+class SimResponse:
+    """Received packet, same fields as wsctrl WirepasResponse"""
+    dst: int
+    src: int
+    src_ep: int
+    dst_ep: int
+    travel_time: int
+    qos: int
+    hop_count: int
+    payload: bytes
+
+
+class SimulatedSink():
+    """Sink of a SimulatedNetwork, implements the part of the sinkService sink API used by the controllers"""
+
+    def __init__(self, network: 'SimulatedNetwork', sink_id: str, max_mtu: int = 102):
+        self._network = network
+        self.sink_id = sink_id
+        self._config = {"started": False, "max_mtu": max_mtu}
+
+    @property
+    def started(self) -> bool:
+        return self._config["started"]
+
+    def read_config(self):
+        return dict(self._config), None
+
+    def write_config(self, config: dict) -> None:
+        self._config.update(config)
+
+    def send_data(self, dst: int, src_ep: int, dst_ep: int, qos: int, initial_delay_ms: int, payload: bytes,
+                  is_unack_csma_ca: bool = False, hop_limit: int = 0) -> None:
+        self._network.downlink(self, dst, src_ep, dst_ep, initial_delay_ms, payload)
+
+
+class _SinkManager():
+    def __init__(self, sinks: List[SimulatedSink]):
+        self._sinks = sinks
+
+    def get_sinks(self) -> List[SimulatedSink]:
+        return list(self._sinks)
+
+
+class SimulatedSinkController():
+    """
+    Stand-in for wsctrl SinkController connected to a SimulatedNetwork
+
+    Accepts the SinkController constructor arguments, so it can be passed to the controllers
+    as their sink_controller factory (see SimulatedNetwork.sink_controller). Unlike the real
+    one every instance has its own receive queue.
+    """
+
+    MAX_HOP_LIMIT = 15
+    DEFAULT_QOS = 0
+    DEFAULT_DELAY_MS = 0
+
+    def __init__(self, network: 'SimulatedNetwork', dst_addr, ep_src=1, ep_dst=1, qos=DEFAULT_QOS,
+                 initial_delay_ms=DEFAULT_DELAY_MS, is_unack_csma_ca=False, hop_limit=MAX_HOP_LIMIT, pm=False,
+                 sink_ids=["sink0"], **kwargs):
+        self._network = network
+        self._dst_addr = dst_addr
+        self._qos = qos
+        self._initial_delay_ms = initial_delay_ms
+        self._is_unack_csma_ca = is_unack_csma_ca
+        self._hop_limit = hop_limit
+        self._src_ep = ep_src
+        self._dst_ep = ep_dst
+        self._pm = pm
+        self._sink_id_set = set(sink_ids)
+        self._nbors = []
+        self._queue = asyncio.Queue()
+        network.attach(self)
+
+    @property
+    def sink_manager(self) -> _SinkManager:
+        return self._network.sink_manager
+
+    def _sinks(self) -> List[SimulatedSink]:
+        return [sink for sink in self._network.sink_manager.get_sinks() if sink.sink_id in self._sink_id_set]
+
+    def initialize_sink(self):
+        for sink in self._sinks():
+            sink.write_config({"started": True})
+
+    def deinitialize_sink(self):
+        for sink in self._sinks():
+            sink.write_config({"started": False})
+
+    def send(self, payload_coded):
+        for sink in self._sinks():
+            sink.send_data(self._dst_addr, self._src_ep, self._dst_ep, self._qos, self._initial_delay_ms,
+                           payload_coded, self._is_unack_csma_ca, self._hop_limit)
+
+    def on_data_received(self, sink_id, timestamp, src, dst, src_ep, dst_ep, travel_time, qos, hop_count, data):
+        if sink_id not in self._sink_id_set:
+            return
+        if (not self._pm and (src_ep != self._dst_ep or dst_ep != self._src_ep)):
+            return
+        self._queue.put_nowait(SimResponse(dst, src, src_ep, dst_ep, travel_time, qos, hop_count, data))
+
+    def receive(self):
+        return self._queue.get_nowait()
+
+    async def async_receive(self):
+        return await self._queue.get()
+
+    @property
+    def nbors(self) -> list:
+        return self._nbors
+
+    @property
+    def src_ep(self):
+        return self._src_ep
+
+    @src_ep.setter
+    def src_ep(self, value):
+        self._src_ep = value
+
+    @property
+    def dst_ep(self):
+        return self._dst_ep
+
+    @dst_ep.setter
+    def dst_ep(self, value):
+        self._dst_ep = value
+
+    @property
+    def mtu(self) -> int:
+        for sink in self._sinks():
+            config, _ = sink.read_config()
+            return config["max_mtu"]
+        return None
+
+
+class SimulatedNetwork():
+    """
+    Simulated Wirepas network of WMB devices behind one or more sinks
+
+    Every packet (commands and answers alike) is lost with probability loss, otherwise it is
+    delivered after latency + uniform(0, jitter) seconds. If bandwidth (bytes per second) is
+    set, packets are additionally serialized over a single shared medium, so the throughput of
+    the whole network is limited the same way as a real mesh. Answers are delivered to every
+    attached controller listening on the sink the command was sent through, device-initiated
+    periodical answers go through the first started sink.
+
+    Usage:
+        network = SimulatedNetwork.with_devices(100, latency=0.2, loss=0.01)
+        fleet = WMBFleetController(sink_controller=network.sink_controller)
+    """
+
+    def __init__(self, devices: Iterable[WMBDeviceEmulator] = (), latency: float = 0.05, jitter: float = 0.0,
+                 loss: float = 0.0, bandwidth: Optional[float] = None, sink_ids: Iterable[str] = ("sink0",),
+                 seed: Optional[int] = None):
+        if latency < 0 or jitter < 0:
+            raise ValueError("Latency and jitter must not be negative")
+        if not (0.0 <= loss < 1.0):
+            raise ValueError("Loss must be between 0 and 1")
+        if bandwidth is not None and bandwidth <= 0:
+            raise ValueError("Bandwidth must be positive")
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.bandwidth = bandwidth
+        self._random = random.Random(seed)
+        self._devices: Dict[int, WMBDeviceEmulator] = dict()
+        self._sink_manager = _SinkManager([SimulatedSink(self, sink_id) for sink_id in sink_ids])
+        self._controllers: List[SimulatedSinkController] = list()
+        self._periodic_handles: Dict[int, dict] = dict()
+        self._periodic_state: Dict[int, dict] = dict()
+        self._busy_until = 0.0
+        self.sent = 0
+        self.received = 0
+        self.lost = 0
+        for device in devices:
+            self.add_device(device)
+
+    @classmethod
+    def with_devices(cls, count: int, first_address: int = 1, **kwargs) -> 'SimulatedNetwork':
+        """Creates network of count devices with one simulated slave (address 1) on port 1 each"""
+        return cls([WMBDeviceEmulator(address) for address in range(first_address, first_address + count)], **kwargs)
+
+    def add_device(self, device: WMBDeviceEmulator) -> None:
+        self._devices[device.address & 0xFFFFFFFF] = device
+
+    def device(self, address: int) -> Optional[WMBDeviceEmulator]:
+        return self._devices.get(address & 0xFFFFFFFF)
+
+    @property
+    def devices(self) -> List[WMBDeviceEmulator]:
+        return list(self._devices.values())
+
+    @property
+    def sink_manager(self) -> _SinkManager:
+        return self._sink_manager
+
+    def sink_controller(self, *args, **kwargs) -> SimulatedSinkController:
+        """Factory with the wsctrl SinkController signature creating controllers attached to this network"""
+        return SimulatedSinkController(self, *args, **kwargs)
+
+    def attach(self, controller: SimulatedSinkController) -> None:
+        self._controllers.append(controller)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "received": self.received, "lost": self.lost}
+
+    def _delay(self, size: int) -> Optional[float]:
+        """Returns delivery delay of a packet, None if it is lost"""
+        if self.loss and self._random.random() < self.loss:
+            self.lost += 1
+            return None
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if self.bandwidth is not None:
+            now = monotonic()
+            start = max(now, self._busy_until)
+            self._busy_until = start + size / self.bandwidth
+            delay += self._busy_until - now
+        return delay
+
+    def downlink(self, sink: SimulatedSink, dst: int, src_ep: int, dst_ep: int, initial_delay_ms: int,
+                 payload: bytes) -> None:
+        if not sink.started:
+            logging.debug(f"Dropping packet to {dst}, {sink.sink_id} is not started")
+            return
+        self.sent += 1
+        if dst_ep != MB_PROTO_DST_EP or src_ep != MB_PROTO_SRC_EP:
+            return
+        dst &= 0xFFFFFFFF
+        if dst == BROADCAST_ADDRESS:
+            targets = list(self._devices.values())
+        else:
+            device = self._devices.get(dst)
+            targets = [] if device is None else [device]
+        for device in targets:
+            delay = self._delay(len(payload))
+            if delay is not None:
+                asyncio.get_running_loop().call_later(delay + initial_delay_ms / 1000, self._deliver, sink, device,
+                                                      bytes(payload))
+
+    def _deliver(self, sink: SimulatedSink, device: WMBDeviceEmulator, payload: bytes) -> None:
+        for answer in device.handle(payload):
+            self.uplink(sink, device, answer)
+        self._schedule_periodic(device)
+
+    def uplink(self, sink: SimulatedSink, device: WMBDeviceEmulator, payload: bytes) -> None:
+        delay = self._delay(len(payload))
+        if delay is not None:
+            asyncio.get_running_loop().call_later(delay, self._receive, sink, device.address, payload,
+                                                  int(delay * 1000))
+
+    def _receive(self, sink: SimulatedSink, src: int, payload: bytes, travel_time: int) -> None:
+        self.received += 1
+        for controller in self._controllers:
+            controller.on_data_received(sink.sink_id, monotonic(), src, 0, MB_PROTO_DST_EP, MB_PROTO_SRC_EP,
+                                        travel_time, 0, 1, payload)
+
+    def _schedule_periodic(self, device: WMBDeviceEmulator) -> None:
+        state = {idx: (cfg.port, cfg.interval, cfg.modbus_frame) for idx, cfg in device.configurations.items()}
+        if self._periodic_state.get(device.address, {}) == state:
+            return
+        for handle in self._periodic_handles.pop(device.address, {}).values():
+            handle.cancel()
+        self._periodic_state[device.address] = state
+        loop = asyncio.get_running_loop()
+        self._periodic_handles[device.address] = {
+            idx: loop.call_later(interval, self._periodic, device, idx, interval)
+            for idx, (port, interval, modbus_frame) in state.items()
+        }
+
+    def _periodic(self, device: WMBDeviceEmulator, idx: int, interval: int) -> None:
+        handles = self._periodic_handles[device.address]
+        handles[idx] = asyncio.get_running_loop().call_later(interval, self._periodic, device, idx, interval)
+        sink = next((sink for sink in self._sink_manager.get_sinks() if sink.started), None)
+        answer = device.periodic_answer(idx)
+        if sink is not None and answer is not None:
+            self.uplink(sink, device, answer)
@@ -0,0 +1,170 @@
+import logging
+from time import monotonic
+from typing import Iterable, Optional
+
+from wmbc import metrics
+
+
+class SinkState():
+    """Load and health of a single sink"""
+
+    __slots__ = ("sink_id", "sent", "outstanding", "answered", "timeouts", "failures", "unanswered", "srtt",
+                 "down_until")
+
+    def __init__(self, sink_id: str):
+        self.sink_id = sink_id
+        self.sent = 0
+        self.outstanding = 0
+        self.answered = 0
+        self.timeouts = 0
+        # Consecutive send errors and devices left unanswered since the last answer
+        self.failures = 0
+        self.unanswered = set()
+        self.srtt = None
+        self.down_until = 0.0
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        completed = self.answered + self.timeouts
+        return self.answered / completed if completed else None
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def as_dict(self) -> dict:
+        return {
+            "sent": self.sent,
+            "outstanding": self.outstanding,
+            "answered": self.answered,
+            "timeouts": self.timeouts,
+            "success_rate": self.success_rate,
+            "srtt": self.srtt,
+            "healthy": self.healthy(monotonic())
+        }
+
+
+class SinkScheduler():
+    """
+    Chooses the sink every command is sent over
+
+    Commands go to the healthy sink with the shortest expected wait, (outstanding + 1) * SRTT,
+    so sinks share the load in proportion to how fast they answer. Sinks without RTT samples
+    are assumed as fast as the fastest known one. After failure_threshold consecutive timeouts
+    or send errors a sink is taken out of rotation for cooldown seconds, then it gets traffic again
+    and a single further failure takes it out again. When no sink is healthy the one which
+    recovers first is used, so commands are never held back.
+
+    A timeout alone does not tell a dead sink from a dead device, so only timeouts of distinct
+    devices count as consecutive failures of the sink and every answer resets them. Repeated
+    timeouts of one unreachable device never take a working sink out of rotation. With a single
+    sink there is nowhere to move commands to and its health is not tracked.
+    """
+
+    ALPHA = 1 / 8
+
+    def __init__(self, sink_ids: Iterable[str] = (), failure_threshold: int = 3, cooldown: float = 30.0):
+        if failure_threshold < 1:
+            raise ValueError("Failure threshold must be at least 1")
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._sinks = dict()
+        for sink_id in sink_ids:
+            self._get(sink_id)
+
+    def _get(self, sink_id: str) -> SinkState:
+        state = self._sinks.get(sink_id)
+        if state is None:
+            state = self._sinks[sink_id] = SinkState(sink_id)
+        return state
+
+    def select(self, sink_ids: Iterable[str], exclude: Optional[str] = None) -> str:
+        """
+        Returns the sink the next command should be sent over
+
+        Args:
+            sink_ids: Currently available sinks
+            exclude: Sink to avoid if any other is healthy, e.g. the one a retried command timed out on
+        """
+        now = monotonic()
+        states = [self._get(sink_id) for sink_id in sink_ids]
+        if not states:
+            raise ValueError("No sink available")
+        healthy = [state for state in states if state.healthy(now)]
+        if exclude is not None and len(healthy) > 1:
+            healthy = [state for state in healthy if state.sink_id != exclude] or healthy
+        if not healthy:
+            return min(states, key=lambda state: state.down_until).sink_id
+        known = [state.srtt for state in healthy if state.srtt is not None]
+        default_srtt = min(known) if known else 1.0
+
+        def expected_wait(state: SinkState):
+            srtt = state.srtt if state.srtt is not None else default_srtt
+            # Ties are broken by the number of sent commands, which spreads an idle start evenly
+            return ((state.outstanding + 1) * srtt, state.sent)
+
+        return min(healthy, key=expected_wait).sink_id
+
+    def sent(self, sink_id: str) -> None:
+        """Counts a command sent over the sink"""
+        self._get(sink_id).sent += 1
+        metrics.SINK_COMMANDS_SENT.inc(sink_id)
+
+    def started(self, sink_id: str) -> None:
+        """Marks a request waiting for its answer on the sink"""
+        state = self._get(sink_id)
+        state.outstanding += 1
+        metrics.SINK_OUTSTANDING.set(sink_id, value=state.outstanding)
+
+    def _finish(self, state: SinkState) -> None:
+        state.outstanding = max(state.outstanding - 1, 0)
+        metrics.SINK_OUTSTANDING.set(state.sink_id, value=state.outstanding)
+
+    def answered(self, sink_id: str, rtt: Optional[float] = None) -> None:
+        """Completes a request answered on the sink, rtt is None if it is ambiguous (retransmitted command)"""
+        state = self._get(sink_id)
+        self._finish(state)
+        state.answered += 1
+        state.failures = 0
+        state.unanswered.clear()
+        state.down_until = 0.0
+        if rtt is not None:
+            state.srtt = rtt if state.srtt is None else (1 - self.ALPHA) * state.srtt + self.ALPHA * rtt
+        metrics.SINK_HEALTHY.set(sink_id, value=1)
+
+    def timed_out(self, sink_id: str, dst_addr: int) -> None:
+        """Completes a request to the device left unanswered on the sink"""
+        state = self._get(sink_id)
+        self._finish(state)
+        state.timeouts += 1
+        metrics.SINK_TIMEOUTS.inc(sink_id)
+        if dst_addr not in state.unanswered:
+            state.unanswered.add(dst_addr)
+            self._failed(state)
+
+    def cancelled(self, sink_id: str) -> None:
+        """Completes a request abandoned before its outcome was known"""
+        self._finish(self._get(sink_id))
+
+    def send_failed(self, sink_id: str) -> None:
+        """Records an error raised when sending over the sink"""
+        state = self._get(sink_id)
+        state.failures += 1
+        self._failed(state)
+
+    def _failed(self, state: SinkState) -> None:
+        if len(self._sinks) < 2:
+            return
+        if max(state.failures, len(state.unanswered)) >= self._failure_threshold:
+            if state.healthy(monotonic()):
+                logging.warning(f"Sink {state.sink_id} stopped answering, taken out of rotation for {self._cooldown}s")
+            state.down_until = monotonic() + self._cooldown
+            metrics.SINK_HEALTHY.set(state.sink_id, value=0)
+
+    def state(self, sink_id: str) -> Optional[SinkState]:
+        return self._sinks.get(sink_id)
+
+    def utilization(self) -> dict:
+        """Returns load and health of every sink with its share of all sent commands"""
+        total = sum(state.sent for state in self._sinks.values())
+        return {sink_id: {**state.as_dict(), "share": state.sent / total if total else None}
+                for sink_id, state in self._sinks.items()}
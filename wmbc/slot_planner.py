@@ -0,0 +1,202 @@
+"""Offloading of recurring Modbus reads to periodical configurations of the device"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from wmbc.mb_proto.mb_protocol_iface import MBProto
+from wmbc.mb_proto.mb_protocol_results import AckResult, DiagnosticsResult, decode_modbus_p_config
+
+# Number of periodical Modbus configurations supported by the device
+MAX_SLOTS = 64
+MAX_INTERVAL = 2592000
+
+
+@dataclass(slots=True, frozen=True)
+class PeriodicRead:
+    """
+    Modbus frame to be sent every interval seconds
+
+    Args:
+        port: Target port of the bridge (1 or 2)
+        interval: Interval in seconds
+        modbus_frame: Modbus RTU request frame (e.g. CompiledBlock.frame of a register map)
+    """
+    port: int
+    interval: int
+    modbus_frame: bytes
+
+    def __post_init__(self):
+        if self.port not in (1, 2):
+            raise ValueError("Unsupported port index!")
+        if not (1 <= self.interval <= MAX_INTERVAL):
+            raise ValueError(f"Interval must be between 1 and {MAX_INTERVAL} seconds")
+        if len(self.modbus_frame) > 256:
+            raise ValueError("Modbus frame exceeds maximum size of 256 bytes")
+
+
+@dataclass(slots=True)
+class SlotPlan:
+    """
+    Result of SlotPlanner.plan
+
+    Args:
+        slots: Desired read of every used configuration index (1-based)
+        push: Configuration indexes which have to be (re)configured
+        disable: Configuration indexes enabled on the device which are not needed anymore
+        fallback: Reads which did not fit into the slots (or whose slot could not be configured)
+                  and have to be polled by the gateway
+    """
+    slots: Dict[int, PeriodicRead] = field(default_factory=dict)
+    push: List[int] = field(default_factory=list)
+    disable: List[int] = field(default_factory=list)
+    fallback: List[PeriodicRead] = field(default_factory=list)
+
+
+class SlotPlanner():
+    """
+    Assigns recurring reads to periodical configuration slots of the devices
+
+    Diagnostics report only the enable flag, port and interval of every slot, not its Modbus
+    frame, so frames pushed by the planner are remembered per device. A slot is left untouched
+    only if diagnostics report it with the port and interval of its read and the planner pushed
+    its frame, everything else is pushed again. Reads which stay in place keep their slot, new
+    reads take the free slots ordered by port and interval and reads over the max_slots budget
+    fall back to gateway polling with a PollScheduler. Slots up to max_slots are owned by the
+    planner (unknown enabled ones are disabled), slots above it are left for manual configuration.
+    """
+
+    def __init__(self, fleet, max_slots: int = MAX_SLOTS, scheduler=None):
+        if not (0 <= max_slots <= MAX_SLOTS):
+            raise ValueError(f"Number of slots must be between 0 and {MAX_SLOTS}")
+        self._fleet = fleet
+        self._max_slots = max_slots
+        self._scheduler = scheduler
+        self._pushed = dict()
+        self._fallback_jobs = dict()
+        # Encoding updates settings of MBProto, the fleet's own instance is left untouched
+        self._mbproto = MBProto()
+
+    def pushed(self, dst_addr: int) -> Dict[int, PeriodicRead]:
+        """Returns reads configured by the planner on the device by configuration index"""
+        return dict(self._pushed.get(dst_addr, {}))
+
+    def plan(self, dst_addr: int, reads: Sequence[PeriodicRead], configurations: Sequence[int]) -> SlotPlan:
+        """
+        Plans slots of the device
+
+        Args:
+            dst_addr: Wirepas address of the device
+            reads: Desired recurring reads, duplicates are configured once
+            configurations: Raw configuration words of the device (DiagnosticsResult.modbus_configurations)
+        """
+        reported = dict()
+        for idx, value in enumerate(configurations[:MAX_SLOTS]):
+            cfg = decode_modbus_p_config(value)
+            if cfg["enable"]:
+                reported[idx + 1] = cfg
+        pushed = self._pushed.get(dst_addr, {})
+
+        result = SlotPlan()
+        pending = list()
+        for read in sorted(dict.fromkeys(reads), key=lambda read: (read.port, read.interval)):
+            for idx, pushed_read in pushed.items():
+                cfg = reported.get(idx)
+                if (pushed_read == read and idx not in result.slots and idx <= self._max_slots
+                        and cfg is not None and cfg["port"] == read.port and cfg["interval"] == read.interval):
+                    result.slots[idx] = read
+                    break
+            else:
+                pending.append(read)
+
+        free = (idx for idx in range(1, self._max_slots + 1) if idx not in result.slots)
+        for read in pending:
+            idx = next(free, None)
+            if idx is None:
+                result.fallback.append(read)
+                continue
+            result.slots[idx] = read
+            result.push.append(idx)
+        result.disable = sorted(idx for idx in reported if idx <= self._max_slots and idx not in result.slots)
+        return result
+
+    async def read_configurations(self, dst_addr: int, timeout: float = None) -> List[int]:
+        """Reads raw periodical configuration words of the device from its diagnostics"""
+        response, msg = await self._fleet.request(dst_addr, self._mbproto.create_diagnostics(), timeout=timeout)
+        result = self._mbproto.decode_answer(msg)
+        if not isinstance(result, DiagnosticsResult):
+            raise ValueError(f"Unexpected answer to diagnostics from {dst_addr}")
+        return result.modbus_configurations
+
+    async def _configure(self, dst_addr: int, idx: int, port: int, interval: int, modbus_frame: bytes,
+                         timeout: Optional[float]) -> bool:
+        mbproto = self._mbproto
+        mbproto.target_port = port
+        payload_coded = mbproto.create_modbus_periodic(idx, interval, modbus_frame)
+        try:
+            response, msg = await self._fleet.request(dst_addr, payload_coded, timeout=timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"No response from the device {dst_addr} to configuration {idx}")
+            return False
+        result = mbproto.decode_answer(msg)
+        if not (isinstance(result, AckResult) and result.is_ack):
+            logging.warning(f"Configuration {idx} rejected by the device {dst_addr}")
+            return False
+        return True
+
+    def _poll_fallback(self, dst_addr: int, reads: List[PeriodicRead], _callback, callback_args) -> None:
+        for job in self._fallback_jobs.pop(dst_addr, []):
+            self._scheduler.remove_job(job)
+        if not reads:
+            return
+        mbproto = self._mbproto
+        jobs = list()
+        for read in reads:
+            mbproto.target_port = read.port
+            payload_coded = mbproto.create_modbus_oneshot(read.modbus_frame)
+            jobs.append(self._scheduler.add_job(dst_addr, payload_coded, read.interval,
+                                                _callback=_callback, callback_args=callback_args))
+        self._fallback_jobs[dst_addr] = jobs
+
+    async def apply(self, dst_addr: int, reads: Sequence[PeriodicRead], timeout: float = None,
+                    _callback=None, callback_args=None) -> SlotPlan:
+        """
+        Configures the device to send the reads by itself
+
+        Reads the current configurations from diagnostics, pushes only changed slots and
+        disables slots which are not needed anymore. Reads whose slot configuration failed are
+        moved to the fallback and their slots are retried on the next apply. Fallback reads are
+        polled with the scheduler (if the planner has one), device-initiated answers are delivered
+        to the device handler of the fleet controller.
+
+        Args:
+            _callback, callback_args: Callback of the fallback polls, see PollScheduler.add_job
+        """
+        plan = self.plan(dst_addr, reads, await self.read_configurations(dst_addr, timeout))
+        pushed = self._pushed.setdefault(dst_addr, {})
+        for idx in [idx for idx in pushed if idx not in plan.slots and idx not in plan.disable]:
+            # Already disabled on the device
+            del pushed[idx]
+        for idx in plan.push:
+            read = plan.slots[idx]
+            pushed.pop(idx, None)
+            if await self._configure(dst_addr, idx, read.port, read.interval, read.modbus_frame, timeout):
+                pushed[idx] = read
+            else:
+                # Polled by the gateway until the slot is configured by the next apply
+                del plan.slots[idx]
+                plan.fallback.append(read)
+        for idx in plan.disable:
+            # Interval 0 disables the configuration
+            read = pushed.get(idx)
+            if await self._configure(dst_addr, idx, read.port if read else 1, 0, b"", timeout):
+                pushed.pop(idx, None)
+        logging.info(f"Device {dst_addr}: {len(plan.slots)} slots in use, {len(plan.push)} pushed, "
+                     f"{len(plan.disable)} disabled, {len(plan.fallback)} polled by the gateway")
+
+        if self._scheduler is not None:
+            self._poll_fallback(dst_addr, plan.fallback, _callback, callback_args)
+        elif plan.fallback:
+            logging.warning(f"Device {dst_addr}: {len(plan.fallback)} reads do not fit into the slots")
+        return plan
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+# Overflow policies of ResponseStream
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP = "drop"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP)
+
+
+class ResponseStream():
+    """
+    Bounded queue of received messages consumed with async for
+
+    When the queue is full the overflow policy decides what happens with a new message:
+    - block: producer waits until the consumer makes space (backpressure towards the sink)
+    - drop_oldest: the oldest queued message is discarded to make space
+    - drop: the new message is discarded
+    Discarded messages are counted in dropped.
+    """
+
+    def __init__(self, maxsize: int = 1024, overflow: str = OVERFLOW_BLOCK):
+        if maxsize <= 0:
+            raise ValueError("Stream size must be positive!")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unsupported overflow policy!")
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._overflow = overflow
+        self.dropped = 0
+
+    @property
+    def overflow(self) -> str:
+        return self._overflow
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def put(self, item) -> None:
+        if self._overflow == OVERFLOW_BLOCK:
+            await self._queue.put(item)
+        else:
+            self.put_nowait(item)
+
+    def put_nowait(self, item) -> bool:
+        """Queues item without waiting, returns False if a message had to be dropped"""
+        if not self._queue.full():
+            self._queue.put_nowait(item)
+            return True
+        self.dropped += 1
+        if self._overflow == OVERFLOW_DROP_OLDEST:
+            self._queue.get_nowait()
+            self._queue.put_nowait(item)
+        logging.debug(f"Response stream overflow, dropped {self.dropped} messages so far")
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
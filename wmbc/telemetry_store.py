@@ -0,0 +1,223 @@
+"""Append-only memory-mapped store of received Modbus telemetry (requires NumPy)"""
+
+import logging
+import os
+from time import time
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("TelemetryStore requires NumPy, install wmbc[numpy]") from e
+
+import wmbc.mb_proto.mb_protocol_pb2 as mb_protocol
+from wmbc.mb_proto import modbus_rtu
+
+STORE_MAGIC = b"WMBTLM"
+STORE_VERSION = 1
+HEADER_SIZE = 64
+FILE_SUFFIX = ".tlm"
+
+_HEADER_DTYPE = np.dtype([
+    ("magic", "S6"),
+    ("version", "u1"),
+    ("reserved", "u1"),
+    ("max_registers", "<u2"),
+    ("count", "<u8"),
+])
+
+
+def record_dtype(max_registers: int) -> np.dtype:
+    """Fixed-width record layout of a store holding up to max_registers values per record"""
+    return np.dtype([
+        ("timestamp", "<f8"),
+        ("src", "<u4"),
+        ("cmd", "u1"),
+        ("port", "u1"),
+        ("configuration_index", "<u2"),
+        ("function_code", "u1"),
+        ("exception_code", "u1"),
+        ("register_count", "<u2"),
+        ("registers", "<u2", (max_registers,)),
+    ])
+
+
+class DeviceLog():
+    """
+    Records of a single device in one memory-mapped file
+
+    Records are appended in timestamp order, so the timestamp column is the time index of
+    the device and range queries are binary searches over the mapped file. A timestamp older
+    than the last one is raised to it (counted in clamped) instead of breaking the order. The file grows in
+    chunks of chunk_records, the record count in the header is updated only after the record
+    is written, so readers never see partial records.
+    """
+
+    def __init__(self, path: str, max_registers: int, chunk_records: int):
+        self._path = path
+        self._chunk_records = chunk_records
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+            with open(path, "wb") as f:
+                f.truncate(HEADER_SIZE)
+            self._header = np.memmap(path, dtype=_HEADER_DTYPE, mode="r+", shape=(1,))
+            self._header[0] = (STORE_MAGIC, STORE_VERSION, 0, max_registers, 0)
+        else:
+            self._header = np.memmap(path, dtype=_HEADER_DTYPE, mode="r+", shape=(1,))
+            if self._header["magic"][0] != STORE_MAGIC or self._header["version"][0] != STORE_VERSION:
+                raise ValueError(f"{path} is not a supported telemetry file")
+            if self._header["max_registers"][0] != max_registers:
+                raise ValueError(f"{path} holds up to {self._header['max_registers'][0]} registers per record")
+        self._dtype = record_dtype(max_registers)
+        self._count = int(self._header["count"][0])
+        # Records whose timestamp was raised to the previous one
+        self.clamped = 0
+        self._records = None
+        self._map(max(self._count, 1))
+
+    def _map(self, min_capacity: int):
+        capacity = -(-min_capacity // self._chunk_records) * self._chunk_records
+        size = HEADER_SIZE + capacity * self._dtype.itemsize
+        if os.path.getsize(self._path) < size:
+            with open(self._path, "r+b") as f:
+                f.truncate(size)
+        # Views returned earlier keep the previous mapping alive
+        self._records = np.memmap(self._path, dtype=self._dtype, mode="r+", offset=HEADER_SIZE, shape=(capacity,))
+
+    def __len__(self):
+        return self._count
+
+    def append(self, record: tuple) -> None:
+        last = self._records["timestamp"][self._count - 1] if self._count else None
+        if last is not None and record[0] < last:
+            # Wall clock stepped back (e.g. NTP), clamped so the time index stays sorted
+            if not self.clamped:
+                logging.warning(f"Timestamp of {self._path} went back by {last - record[0]:.3f}s, clamping")
+            self.clamped += 1
+            record = (last,) + tuple(record[1:])
+        if self._count == len(self._records):
+            self._map(self._count + 1)
+        self._records[self._count] = record
+        self._count += 1
+        self._header["count"] = self._count
+
+    @property
+    def records(self) -> np.ndarray:
+        """View of all records"""
+        return self._records[:self._count]
+
+    def last(self, n: int) -> np.ndarray:
+        return self._records[max(self._count - n, 0):self._count]
+
+    def range(self, start: float, end: float) -> np.ndarray:
+        """View of records with start <= timestamp < end"""
+        timestamps = self._records["timestamp"][:self._count]
+        lo = int(np.searchsorted(timestamps, start, side="left"))
+        hi = int(np.searchsorted(timestamps, end, side="left"))
+        return self._records[lo:hi]
+
+    def flush(self):
+        self._records.flush()
+        self._header.flush()
+
+
+class TelemetryStore():
+    """
+    Append-only store of fixed-width telemetry records with a per-device time index
+
+    Every device has its own memory-mapped file in the store directory, queries return
+    zero-copy NumPy views of the mapped records (see record_dtype for the columns), e.g.
+    store.last(21, 100)["registers"][:, :4] are the first 4 registers of the last 100 records.
+    Views stay valid after further appends but do not include them.
+
+    Usage with a fleet controller:
+        async for response, msg in fleet.responses():
+            store.append_response(response, msg)
+    Reads of coils and discrete inputs pass the requested count, see append_response.
+    """
+
+    def __init__(self, path: str, max_registers: int = 125, chunk_records: int = 4096):
+        if not (1 <= max_registers <= 0xFFFF):
+            raise ValueError("Number of registers must be between 1 and 65535")
+        if chunk_records < 1:
+            raise ValueError("Chunk size must be positive")
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._max_registers = max_registers
+        self._chunk_records = chunk_records
+        self._logs: Dict[int, DeviceLog] = dict()
+        for name in os.listdir(path):
+            if name.endswith(FILE_SUFFIX) and name[:-len(FILE_SUFFIX)].isdigit():
+                self._open(int(name[:-len(FILE_SUFFIX)]))
+
+    def _open(self, src: int) -> DeviceLog:
+        log = self._logs.get(src)
+        if log is None:
+            log = self._logs[src] = DeviceLog(os.path.join(self._path, f"{src}{FILE_SUFFIX}"),
+                                              self._max_registers, self._chunk_records)
+        return log
+
+    @property
+    def devices(self) -> List[int]:
+        return sorted(self._logs)
+
+    def append(self, src: int, cmd: int, registers: Sequence[int], configuration_index: int = 0, port: int = 0,
+               function_code: int = 0, exception_code: int = 0, timestamp: Optional[float] = None) -> None:
+        """Appends a record, registers over max_registers are truncated"""
+        if timestamp is None:
+            timestamp = time()
+        count = min(len(registers), self._max_registers)
+        values = np.zeros(self._max_registers, dtype="<u2")
+        values[:count] = registers[:count]
+        self._open(src).append((timestamp, src, cmd, port, configuration_index, function_code, exception_code,
+                                count, values))
+
+    def append_response(self, response, msg: mb_protocol.MbMessage, timestamp: Optional[float] = None,
+                        count: Optional[int] = None) -> bool:
+        """
+        Appends a Modbus response answer of a device, bits of coil/discrete input reads are stored as 0/1 values
+
+        Args:
+            count: Number of coils or discrete inputs of the read request. Responses carry whole bytes
+                   of bits, so without it the padding bits of the last byte are stored as well.
+
+        Returns:
+            False if the message is not a parsable Modbus response
+        """
+        answer_frame = msg.payload.payload_answer_frame
+        if answer_frame.WhichOneof('answer_frame') != 'modbus_response_frame':
+            return False
+        response_frame = answer_frame.modbus_response_frame
+        try:
+            parsed = modbus_rtu.parse_response(response_frame.modbus_frame)
+        except ValueError as e:
+            logging.debug(f"Not storing invalid Modbus frame from {response.src}: {e}")
+            return False
+        if parsed is None:
+            return False
+        registers = parsed.registers if parsed.registers else parsed.bits[:count]
+        self.append(response.src, msg.cmd, registers, response_frame.configuration_index, response_frame.modbus_port,
+                    parsed.function_code & 0x7F, parsed.exception_code or 0, timestamp)
+        return True
+
+    def last(self, src: int, n: int) -> np.ndarray:
+        """View of the last n records of the device"""
+        log = self._logs.get(src)
+        return log.last(n) if log is not None else np.empty(0, dtype=record_dtype(self._max_registers))
+
+    def range(self, src: int, start: float, end: float) -> np.ndarray:
+        """View of the records of the device with start <= timestamp < end"""
+        log = self._logs.get(src)
+        return log.range(start, end) if log is not None else np.empty(0, dtype=record_dtype(self._max_registers))
+
+    def site_range(self, start: float, end: float) -> Dict[int, np.ndarray]:
+        """Views of the records of all devices with start <= timestamp < end, devices without records are left out"""
+        result = dict()
+        for src, log in self._logs.items():
+            records = log.range(start, end)
+            if len(records):
+                result[src] = records
+        return result
+
+    def flush(self) -> None:
+        for log in self._logs.values():
+            log.flush()
@@ -0,0 +1,182 @@
+"""Opt-in timing spans and profiling of the encode, send, receive and decode stages"""
+
+import json
+import logging
+import os
+from collections import deque
+from contextlib import nullcontext
+from time import monotonic, time
+from typing import Dict, Optional
+
+# Returned by disabled or not sampled spans, entering it costs a method call
+_NOOP = nullcontext()
+
+
+class _Span():
+    __slots__ = ("_tracer", "_stage", "_start")
+
+    def __init__(self, tracer: 'Tracer', stage: str):
+        self._tracer = tracer
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self._tracer._add(self._stage, self._start, monotonic() - self._start)
+        return False
+
+
+class _StageStats():
+    __slots__ = ("count", "total", "max", "durations")
+
+    def __init__(self, history: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.durations = deque(maxlen=history)
+
+    def as_dict(self) -> dict:
+        durations = sorted(self.durations)
+
+        def percentile(fraction: float) -> float:
+            return durations[min(int(fraction * len(durations)), len(durations) - 1)]
+
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_us": 1e6 * self.total / self.count,
+            "max_us": 1e6 * self.max,
+            "p50_us": 1e6 * percentile(0.5),
+            "p95_us": 1e6 * percentile(0.95),
+            "p99_us": 1e6 * percentile(0.99),
+        }
+
+
+class Tracer():
+    """
+    Collects durations of named stages
+
+    Spans are disabled by default, span() then returns a shared no-op context manager.
+    When enabled, every sample_every-th span of a stage is timed with monotonic timestamps and
+    aggregated per stage, the most recent spans are kept for inspection. Stage names are dotted,
+    nested stages (e.g. "decode.crc" inside "decode") are recorded independently.
+
+    Usage: with TRACER.span("decode"): ...
+    """
+
+    def __init__(self, sample_every: int = 1, history: int = 1024):
+        self.enabled = False
+        self._sample_every = sample_every
+        self._history = history
+        self._calls: Dict[str, int] = dict()
+        self._stages: Dict[str, _StageStats] = dict()
+        self._recent = deque(maxlen=history)
+
+    def enable(self, sample_every: int = 1) -> None:
+        """Starts timing every sample_every-th span of each stage"""
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+        self._sample_every = sample_every
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def span(self, stage: str):
+        """Returns context manager timing the stage if tracing is enabled and the span is sampled"""
+        if not self.enabled:
+            return _NOOP
+        if self._sample_every > 1:
+            calls = self._calls.get(stage, 0) + 1
+            self._calls[stage] = calls
+            if calls % self._sample_every:
+                return _NOOP
+        return _Span(self, stage)
+
+    def record(self, stage: str, duration: float) -> None:
+        """Records duration of a stage measured elsewhere, e.g. travel time reported by the network"""
+        if self.enabled:
+            self._add(stage, monotonic() - duration, duration)
+
+    def _add(self, stage: str, start: float, duration: float) -> None:
+        stats = self._stages.get(stage)
+        if stats is None:
+            stats = self._stages[stage] = _StageStats(self._history)
+        stats.count += 1
+        stats.total += duration
+        if duration > stats.max:
+            stats.max = duration
+        stats.durations.append(duration)
+        self._recent.append((stage, start, duration))
+
+    def breakdown(self, reset: bool = False) -> dict:
+        """Returns per-stage timing statistics, percentiles are computed from the most recent spans"""
+        result = {stage: stats.as_dict() for stage, stats in self._stages.items()}
+        if reset:
+            self.reset()
+        return result
+
+    def recent(self) -> list:
+        """Returns the most recent spans as (stage, monotonic start, duration in seconds) tuples"""
+        return list(self._recent)
+
+    def reset(self) -> None:
+        self._calls.clear()
+        self._stages.clear()
+        self._recent.clear()
+
+    async def profile(self, duration: float, path: Optional[str] = None) -> "cProfile.Profile":
+        """
+        Profiles the event loop thread with cProfile for duration seconds
+
+        Everything running on the loop meanwhile is captured, e.g. a controller polling in another task.
+        Stats are written to path (readable with pstats or snakeviz) if provided.
+        """
+        import asyncio
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
+            logging.info(f"Profile written to {path}")
+        return profiler
+
+    async def run_sampler(self, interval: float = 60.0, output: Optional[str] = None,
+                          profile_dir: Optional[str] = None, sample_every: int = 1) -> None:
+        """
+        Enables tracing and dumps the per-stage breakdown every interval seconds until cancelled
+
+        Breakdowns are appended to output as JSON lines or logged if output is not provided. If
+        profile_dir is set, every interval is also captured with cProfile into a separate file,
+        the spans of such intervals include the profiler overhead.
+        """
+        import asyncio
+        self.enable(sample_every)
+        self.reset()
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+        try:
+            while True:
+                if profile_dir is not None:
+                    path = os.path.join(profile_dir, f"wmbc-{int(time() * 1000)}.prof")
+                    await self.profile(interval, path)
+                else:
+                    await asyncio.sleep(interval)
+                line = json.dumps({"time": time(), "interval_s": interval, "stages": self.breakdown(reset=True)})
+                if output is None:
+                    logging.info(f"Timing breakdown: {line}")
+                else:
+                    with open(output, "a") as f:
+                        f.write(line + "\n")
+        finally:
+            self.disable()
+
+
+# Tracer of the hook points in MBProto and the controllers
+TRACER = Tracer()
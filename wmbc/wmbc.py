@@ -1,23 +1,27 @@
 import logging
-import os
 import sys
-from time import time, sleep
+from time import monotonic
 import asyncio
 import signal
+from dataclasses import replace
 
-from wsctrl.sink_ctrl import SinkController, Nbor
-from wmbc.mb_proto import mb_protocol_enums_pb2 as mb_enums
+from wmbc import metrics
+from wmbc.commands import build_command
+from wmbc.inflight import InFlightTable
 from wmbc.mb_proto.mb_protocol_iface import MBProto
-from google.protobuf.json_format import MessageToJson
+from wmbc.retry import RetryPolicy, NO_RETRY, policy_for, request_with_retry
+from wmbc.rtt import RttEstimator
+from wmbc.stream import ResponseStream, OVERFLOW_BLOCK
+from wmbc.tracing import TRACER
 
 
-logging.basicConfig(level=logging.INFO)
-   
-
 def signal_exit(sig, frame):
     sys.exit(0)
 
-signal.signal(signal.SIGINT, signal_exit)
+
+def install_signal_handlers():
+    """Exits quietly on Ctrl+C, called by the command line entry point and not on import"""
+    signal.signal(signal.SIGINT, signal_exit)
 
 
 class WMBController():
@@ -43,78 +47,36 @@ class WMBController():
         self._modbus_interval = kwargs.get("modbus_interval")
         self._modbus_cfg_idx = kwargs.get("modbus_cfg_idx")
         self._polling_only = self._cmd_type is None
+        # SinkController class or a factory with its signature, e.g. SimulatedNetwork.sink_controller
+        sink_controller = kwargs.get("sink_controller")
+        if sink_controller is None:
+            # Imported on demand, wsctrl pulls in D-Bus bindings
+            from wsctrl.sink_ctrl import SinkController as sink_controller
 
         self._mbproto = MBProto()
+        self._inflight = InFlightTable()
+        self._rtt = RttEstimator()
         # Provide default sink_ids if not provided in init
         if (self._sink_ids is None):
             self._sink_ids = ["sink0", "sink1"]
-        if (self._cmd_type is not None):
-            assert self._dst_addr > 0, "Destination address cannot be 0!"
-            self._client = SinkController(self._dst_addr & 0xFFFFFFFF, self.MB_PROTO_SRC_EP, self.MB_PROTO_DST_EP, sink_ids=self._sink_ids)
-        else:
-            self._client = SinkController(self._dst_addr, pm=True, sink_ids=self._sink_ids)
+        if (self._cmd_type is None):
+            self._client = sink_controller(self._dst_addr, pm=True, sink_ids=self._sink_ids)
             return
 
-        if self._cmd_type == "reset":
-            self._payload_coded = self._mbproto.create_device_reset()
-        elif self._cmd_type == "diag":
-            self._payload_coded = self._mbproto.create_diagnostics()
-        elif self._cmd_type == "dev_mode":
-            self._mbproto.device_mode = self._dev_mode
-            self._payload_coded = self._mbproto.create_device_mode()
-        elif self._cmd_type == "ant_cfg":
-            self._mbproto.antenna_config = self._ant_cfg
-            self._payload_coded = self._mbproto.create_antenna_config()
-        elif self._cmd_type == "port_cfg":
-            self._mbproto.target_port = self._target_port
-            self._mbproto.baudrate_config = int(self._port_cfg[0])
-            self._mbproto.parity_bit = int(self._port_cfg[1])
-            self._mbproto.stop_bits = int(self._port_cfg[2])
-            self._payload_coded = self._mbproto.create_port_config()
-        elif self._cmd_type == "modbus_1s":
-            if (self._modbus_file is not None and self._modbus_frame is not None):
-                raise ValueError("Both file and frame defined as payload")
-            elif (self._modbus_file is not None or self._modbus_frame is not None):
-                if (self._modbus_file is not None):
-                    try:
-                        with open(self._modbus_file, 'rb') as f:
-                            self._payload_coded = f.read()
-                    except FileNotFoundError:
-                        raise FileNotFoundError(f"File {self._modbus_file} does not exist!")
-                    except Exception as e:
-                        raise e(f"Unhandled exception")
-                    self._mbproto.target_port = self._target_port
-                    self._payload_coded = self._mbproto.create_modbus_oneshot(self._payload_coded)
-                else:
-                    self._payload_coded = self._modbus_frame
-                    self._mbproto.target_port = self._target_port
-                    self._payload_coded = self._mbproto.create_modbus_oneshot(self._payload_coded)
-            else:
-                raise ValueError("No Modbus Payload!")
-        elif self._cmd_type == "modbus_p":
-            if (self._modbus_file is not None and self._modbus_frame is not None):
-                raise ValueError("Both file and frame defined as payload")
-            elif (self._modbus_file is not None or self._modbus_frame is not None):
-                if (self._modbus_file is not None):
-                    try:
-                        with open(self._modbus_file, 'rb') as f:
-                            self._payload_coded = f.read()
-                    except FileNotFoundError:
-                        raise FileNotFoundError(f"File {self._modbus_file} does not exist!")
-                    except Exception as e:
-                        raise e(f"Unhandled exception")
-                    self._mbproto.target_port = self._target_port
-                    self._payload_coded = self._mbproto.create_modbus_periodic(self._modbus_cfg_idx, self._modbus_interval,
-                                                                               self._payload_coded)
-                else:
-                    self._payload_coded = self._modbus_frame
-                    self._mbproto.target_port = self._target_port
-                    self._payload_coded = self._mbproto.create_modbus_periodic(self._modbus_cfg_idx, self._modbus_interval,
-                                                                               self._payload_coded)
-            else:
-                raise ValueError("No Modbus Payload!")
-        else:
-            raise ValueError("Unsupported command type!")
+        assert self._dst_addr > 0, "Destination address cannot be 0!"
+        self._payload_coded = build_command(
+            self._mbproto, self._cmd_type, dev_mode=self._dev_mode, ant_cfg=self._ant_cfg,
+            target_port=self._target_port, port_cfg=self._port_cfg, modbus_file=self._modbus_file,
+            modbus_frame=self._modbus_frame, modbus_interval=self._modbus_interval,
+            modbus_cfg_idx=self._modbus_cfg_idx)
+        self._client = sink_controller(self._dst_addr & 0xFFFFFFFF, self.MB_PROTO_SRC_EP, self.MB_PROTO_DST_EP, sink_ids=self._sink_ids)
+
+        ret, err, cmd_msg = self._mbproto.decode_response(self._payload_coded)
+        if (not ret):
+            raise ValueError(f"Invalid command frame: {err}")
+        self._cmd_key = self._mbproto.correlation_key(cmd_msg)
+        self._cmd_label = metrics.cmd_label(cmd_msg.cmd)
+        self._retry_policy = policy_for(cmd_msg)
 
     def _stop_sinks(self):
         self._client.deinitialize_sink()
@@ -124,7 +86,9 @@ class WMBController():
 
     def send_command(self):
         if self._client and self._payload_coded:
-            self._client.send(self._payload_coded)
+            with TRACER.span("send"):
+                self._client.send(self._payload_coded)
+            metrics.COMMANDS_SENT.inc(self._dst_addr & 0xFFFFFFFF, self._cmd_label)
 
     def initialize_sink(self):
         self._start_sinks()
@@ -132,6 +96,10 @@ class WMBController():
     def deinitialize_sink(self):
         self._stop_sinks()
 
+    async def async_receive(self):
+        """Receives next raw Wirepas response without decoding, do not combine with run() or responses()"""
+        return await self._client.async_receive()
+
     async def run(self, quit=False):
         if self._cmd_type is not None:
             self.send_command()
@@ -140,29 +108,107 @@ class WMBController():
         while True:
             response = await self._client.async_receive()
             logging.info(f"Got message from: {response.src}")
-            self._mbproto.print_decoded_msg(response.payload)
+            TRACER.record("mesh", response.travel_time / 1000)
+            ret, err, msg = self._mbproto.decode_response(response.payload, src=response.src)
+            if (not ret):
+                logging.error("Failed to decode frame!:%s", err)
+            else:
+                metrics.record_answer(response.src, msg)
+                with TRACER.span("print"):
+                    self._mbproto.print_msg(msg)
             if quit:
                 return
 
-    async def run_periodically(self, period=10, timeout=5, _callback=None, callback_args=None, print_default=False):
+    async def _pump_responses(self, stream: ResponseStream):
+        while True:
+            response = await self._client.async_receive()
+            ret, err, msg = self._mbproto.decode_response(response.payload, src=response.src)
+            if (not ret):
+                logging.error("Failed to decode frame!: %s", err)
+                continue
+            metrics.record_answer(response.src, msg)
+            TRACER.record("mesh", response.travel_time / 1000)
+            await stream.put((response, msg))
+
+    async def responses(self, maxsize=1024, overflow=OVERFLOW_BLOCK):
+        """
+        Streams received messages as (Wirepas response, decoded MbMessage) tuples
+
+        Usage: async for response, msg in controller.responses(): ...
+        Messages are buffered in a bounded queue, overflow selects what happens when the consumer
+        falls behind (see ResponseStream). Do not combine with run() or run_periodically().
+        """
+        stream = ResponseStream(maxsize, overflow)
+        pump = asyncio.ensure_future(self._pump_responses(stream))
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            pump.cancel()
+            if stream.dropped:
+                logging.warning(f"Response stream dropped {stream.dropped} messages")
+
+    async def _receive_answers(self):
+        while True:
+            response = await self._client.async_receive()
+            ret, err, msg = self._mbproto.decode_response(response.payload, src=response.src)
+            if (not ret):
+                logging.error("Failed to decode frame!: %s", err)
+                continue
+            metrics.record_answer(response.src, msg)
+            TRACER.record("mesh", response.travel_time / 1000)
+            cmd, index = self._mbproto.correlation_key(msg)
+            if MBProto.is_report(msg) or not self._inflight.match(response.src, cmd, index, (response, msg)):
+                logging.debug(f"Dropping unsolicited message from: {response.src}")
+
+    @property
+    def rtt(self) -> RttEstimator:
+        return self._rtt
+
+    async def run_periodically(self, period=10, timeout=None, _callback=None, callback_args=None, print_default=False,
+                               retry_policy: RetryPolicy = None):
+        """
+        Sends the command every period seconds and handles its answers
+
+        Timeout of each command is derived from the RTT estimate of the device if not provided.
+        Unanswered commands are resent within the period according to the retry policy of the command
+        (see retry.policy_for), retry_policy overrides it for idempotent commands.
+        """
         if self._cmd_type is None:
             raise ValueError("Command not defined!")
         logging.info("Entering periodical command send with polling, press Ctrl+C to exit")
-        while True:
-            self.send_command()
-            try:
-                response = await asyncio.wait_for(self._client.async_receive(), timeout=timeout)
-            except asyncio.TimeoutError:
-                logging.warning("No response from the device!")
-                await asyncio.sleep(period)
-                continue
-            if _callback != None:
-                ret, err, msg = self._mbproto.decode_response(response.payload)
-                if (not ret):
-                    logging.error("Failed to decode frame!: %s", err)
+        cmd, index = self._cmd_key
+        policy = self._retry_policy
+        if retry_policy is not None and policy is not NO_RETRY:
+            policy = retry_policy
+        # All attempts have to fit into the period
+        policy = replace(policy, deadline=period if policy.deadline is None else min(policy.deadline, period))
+        dst_addr = self._dst_addr & 0xFFFFFFFF
+        receiver = asyncio.ensure_future(self._receive_answers())
+        next_due = monotonic()
+        try:
+            while True:
+                # Period is measured between sends, independent of the answer round trip time
+                next_due += period
+                try:
+                    with TRACER.span("request"):
+                        response, msg = await request_with_retry(
+                            self._inflight, self._rtt, self.send_command, dst_addr, cmd, index, policy,
+                            timeout if timeout is not None else self._rtt.timeout(dst_addr))
+                except asyncio.TimeoutError:
+                    # Late answers to this command will be dropped as stale
+                    logging.warning("No response from the device!")
                 else:
-                    _callback(msg, callback_args)
-            elif print_default:
-                logging.info(f"Got message from: {response.src}")
-                self._mbproto.print_decoded_msg(response.payload, decode_modbus_frame=False)
-            await asyncio.sleep(period)
+                    if _callback != None:
+                        with TRACER.span("callback"):
+                            _callback(msg, callback_args)
+                    elif print_default:
+                        logging.info(f"Got message from: {response.src}")
+                        with TRACER.span("print"):
+                            self._mbproto.print_msg(msg, decode_modbus_frame=False)
+                now = monotonic()
+                if next_due < now:
+                    next_due = now
+                await asyncio.sleep(next_due - now)
+        finally:
+            receiver.cancel()